@@ -0,0 +1,218 @@
+# bi/access_log.py – buffer de acessos a BI (Redis) + gravação em lote + rollup diário
+from __future__ import annotations
+
+import datetime as dt
+import json
+import logging
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Lista Redis com os eventos pendentes (JSON: {"r": report_pk, "u": user_pk, "t": epoch_float})
+ACCESS_BUFFER_KEY = getattr(settings, "POWERBI_ACCESS_BUFFER_KEY", "pbi:access:buffer")
+ACCESS_FLUSH_BATCH = int(getattr(settings, "POWERBI_ACCESS_FLUSH_BATCH", 5000))
+# Rollup incremental (BIAccess → BIAccessDaily) e retenção da tabela bruta
+ACCESS_ROLLUP_WATERMARK = "bi_access_daily"
+ACCESS_ROLLUP_BATCH = int(getattr(settings, "POWERBI_ACCESS_ROLLUP_BATCH", 10000))
+# Folga (s) sobre recorded_at: ids são reservados antes do commit, então uma linha de id menor
+# ainda pode aparecer depois de outra de id maior; só linhas mais velhas que isso entram no rollup
+ACCESS_ROLLUP_LAG_S = int(getattr(settings, "POWERBI_ACCESS_ROLLUP_LAG_S", 120))
+ACCESS_RETENTION_DAYS = int(getattr(settings, "POWERBI_ACCESS_RETENTION_DAYS", 180) or 0)  # 0 = guarda tudo
+ACCESS_PURGE_BATCH = 5000
+
+
+def _redis():
+    """Conexão Redis crua do cache padrão (None se o backend não for django_redis)."""
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection("default")
+    except Exception:
+        return None
+
+
+def _to_datetime(epoch: float) -> dt.datetime:
+    aware = dt.datetime.fromtimestamp(float(epoch), tz=dt.timezone.utc)
+    if settings.USE_TZ:
+        return aware
+    return timezone.localtime(aware, timezone.get_default_timezone()).replace(tzinfo=None)
+
+
+# ════════════════════════════════════════
+# Registro (caminho quente)
+# ════════════════════════════════════════
+
+def record_access(bi_report_id: int, user_id: int, when: Optional[dt.datetime] = None) -> None:
+    """
+    Enfileira um acesso no buffer Redis (O(1), sem tocar o banco).
+    Sem Redis disponível, grava na hora (comportamento antigo).
+    """
+    when = when or timezone.now()
+    conn = _redis()
+    if conn is not None:
+        try:
+            ts = when.timestamp() if timezone.is_aware(when) else timezone.make_aware(when).timestamp()
+            conn.rpush(ACCESS_BUFFER_KEY, json.dumps({"r": int(bi_report_id), "u": int(user_id), "t": ts}))
+            return
+        except Exception:
+            logger.warning("BI: buffer de acessos indisponível — gravando direto.", exc_info=True)
+    write_accesses([(int(bi_report_id), int(user_id), when)])
+
+
+# ════════════════════════════════════════
+# Gravação em lote (task periódica)
+# ════════════════════════════════════════
+
+def write_accesses(events: Iterable[tuple[int, int, dt.datetime]]) -> int:
+    """Grava eventos (report_pk, user_pk, datetime) em BIAccess (o rollup vem depois, por marca d'água)."""
+    from .models import BIAccess
+
+    events = list(events)
+    if not events:
+        return 0
+    with transaction.atomic():
+        BIAccess.objects.bulk_create(
+            [BIAccess(bi_report_id=r, user_id=u, accessed_at=t) for r, u, t in events],
+            batch_size=1000,
+        )
+    return len(events)
+
+
+def _apply_daily_rollup(events: Iterable[tuple[int, int, dt.datetime]]) -> None:
+    """Soma os eventos em BIAccessDaily (um upsert por relatório × usuário × dia)."""
+    from .models import BIAccessDaily
+
+    agg: dict[tuple[int, int, dt.date], list] = defaultdict(lambda: [0, None, None])
+    for r, u, t in events:
+        day = (timezone.localtime(t) if timezone.is_aware(t) else t).date()
+        a = agg[(r, u, day)]
+        a[0] += 1
+        a[1] = t if a[1] is None or t < a[1] else a[1]
+        a[2] = t if a[2] is None or t > a[2] else a[2]
+
+    for (r, u, day), (n, first, last) in agg.items():
+        qs = BIAccessDaily.objects.filter(bi_report_id=r, user_id=u, day=day)
+        updated = qs.update(
+            views=F("views") + n,
+            first_access=Least(F("first_access"), first),
+            last_access=Greatest(F("last_access"), last),
+        )
+        if updated:
+            continue
+        try:
+            with transaction.atomic():
+                BIAccessDaily.objects.create(
+                    bi_report_id=r, user_id=u, day=day, views=n, first_access=first, last_access=last
+                )
+        except IntegrityError:
+            # criado em paralelo — soma por cima
+            qs.update(
+                views=F("views") + n,
+                first_access=Least(F("first_access"), first),
+                last_access=Greatest(F("last_access"), last),
+            )
+
+
+def flush_access_buffer(max_items: Optional[int] = None) -> int:
+    """
+    Drena até `max_items` eventos do buffer Redis e grava em lote.
+    Em falha de banco, devolve os eventos ao início da fila.
+    """
+    conn = _redis()
+    if conn is None:
+        return 0
+    n = int(max_items or ACCESS_FLUSH_BATCH)
+
+    pipe = conn.pipeline(transaction=True)
+    pipe.lrange(ACCESS_BUFFER_KEY, 0, n - 1)
+    pipe.ltrim(ACCESS_BUFFER_KEY, n, -1)
+    raw, _ = pipe.execute()
+    if not raw:
+        return 0
+
+    events = []
+    for item in raw:
+        try:
+            ev = json.loads(item)
+            events.append((int(ev["r"]), int(ev["u"]), _to_datetime(ev["t"])))
+        except Exception:
+            logger.warning("BI: evento de acesso inválido descartado: %r", item)
+
+    try:
+        return write_accesses(events)
+    except IntegrityError:
+        # FK inválida (relatório/usuário apagado) — grava o que der, um a um
+        written = 0
+        for ev in events:
+            try:
+                written += write_accesses([ev])
+            except IntegrityError:
+                logger.warning("BI: acesso descartado (relatório/usuário inexistente): %s", ev[:2])
+        return written
+    except Exception:
+        conn.lpush(ACCESS_BUFFER_KEY, *reversed(raw))
+        raise
+
+
+# ════════════════════════════════════════
+# Rollup incremental + retenção (tasks periódicas)
+# ════════════════════════════════════════
+
+def rollup_new_accesses(max_rows: Optional[int] = None) -> int:
+    """
+    Consolida em BIAccessDaily os acessos brutos com id acima da marca d'água.
+    Rollup e avanço da marca vão na mesma transação: cada linha conta uma única vez.
+    A marca para na primeira linha gravada há menos de ACCESS_ROLLUP_LAG_S: transações
+    ainda abertas (gravação direta concorrente com o flush) podem ter ids abaixo dela.
+    """
+    from .models import BIAccess, BIRollupWatermark
+
+    n = int(max_rows or ACCESS_ROLLUP_BATCH)
+    safe_before = timezone.now() - dt.timedelta(seconds=ACCESS_ROLLUP_LAG_S)
+    with transaction.atomic():
+        wm, _ = BIRollupWatermark.objects.select_for_update().get_or_create(name=ACCESS_ROLLUP_WATERMARK)
+        rows = list(
+            BIAccess.objects.filter(pk__gt=wm.last_id)
+            .order_by("pk")
+            .values_list("pk", "bi_report_id", "user_id", "accessed_at", "recorded_at")[:n]
+        )
+        for i, row in enumerate(rows):
+            if row[4] >= safe_before:
+                rows = rows[:i]
+                break
+        if not rows:
+            return 0
+        _apply_daily_rollup((r, u, t) for _, r, u, t, _rec in rows)
+        wm.last_id = rows[-1][0]
+        wm.save(update_fields=["last_id", "updated_at"])
+    return len(rows)
+
+
+def purge_old_accesses(days: Optional[int] = None) -> int:
+    """
+    Apaga acessos brutos mais antigos que `days` (POWERBI_ACCESS_RETENTION_DAYS),
+    somente os já consolidados (id ≤ marca d'água). Em lotes, para não travar a tabela.
+    """
+    from .models import BIAccess, BIRollupWatermark
+
+    days = ACCESS_RETENTION_DAYS if days is None else int(days)
+    if days <= 0:
+        return 0
+    last_id = (BIRollupWatermark.objects.filter(name=ACCESS_ROLLUP_WATERMARK)
+               .values_list("last_id", flat=True).first()) or 0
+    horizon = timezone.now() - dt.timedelta(days=days)
+    qs = BIAccess.objects.filter(pk__lte=last_id, accessed_at__lt=horizon)
+
+    deleted = 0
+    while True:
+        ids = list(qs.values_list("pk", flat=True)[:ACCESS_PURGE_BATCH])
+        if not ids:
+            break
+        deleted += BIAccess.objects.filter(pk__in=ids).delete()[0]
+    return deleted
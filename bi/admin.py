@@ -1,7 +1,7 @@
 # bi/admin.py
 from django.contrib import admin
 from django.utils import timezone
-from .models import BIReport, BISavedView
+from .models import BIReport, BISavedView, BIDatasetLineage
 
 @admin.register(BIReport)
 class BIReportAdmin(admin.ModelAdmin):
@@ -18,3 +18,11 @@ class BISavedViewAdmin(admin.ModelAdmin):
     search_fields = ('name', 'owner__username', 'bi_report__title')
     filter_horizontal = ('shared_users', 'shared_groups')
     readonly_fields = ('share_token',)
+
+
+@admin.register(BIDatasetLineage)
+class BIDatasetLineageAdmin(admin.ModelAdmin):
+    list_display = ('dataset_id', 'group_id', 'source', 'discovered_at', 'expires_at')
+    list_filter = ('source',)
+    search_fields = ('dataset_id', 'group_id')
+    readonly_fields = ('discovered_at',)
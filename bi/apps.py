@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bi'
+
+    def ready(self):
+        import bi.signals  # Invalidação do cache de permissões
@@ -0,0 +1,345 @@
+# bi/fake_powerbi.py – stand-in local da REST API do Power BI (benchmarks e testes)
+"""
+Servidor HTTP em thread que imita as rotas do Power BI usadas por bi.utils / bi.tasks:
+reports, GenerateToken, datasets/refreshes, dataflows/transactions e upstreamDataflows.
+
+- Refreshes de dataset e dataflow seguem uma máquina de estados simples
+  (em andamento → Completed/Success, ou Failed) pela duração configurada.
+- Latência fixa + jitter por requisição e throttling opcional (429 + Retry-After).
+- `activate()` aponta POWERBI_API_BASE para o servidor e troca o msal por um stub
+  que devolve access_token local — nenhuma chamada sai da máquina.
+
+    with FakePowerBI(latency_ms=40) as fake, fake.activate():
+        fake.add_report("g1", "r1", dataset_id="d1", dataflows=["df1"])
+        cascade_refresh("r1", "g1")
+"""
+from __future__ import annotations
+
+import base64
+import contextlib
+import datetime as dt
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+
+def _iso(epoch: Optional[float]) -> str:
+    if not epoch:
+        return ""
+    return dt.datetime.fromtimestamp(epoch, tz=dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+@dataclass
+class _Run:
+    """Uma execução de refresh (dataset ou dataflow)."""
+    started: float
+    duration: float
+    fail: bool = False
+    request_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    refresh_type: str = "ViaApi"
+
+    def finished(self, now: float) -> bool:
+        return now >= self.started + self.duration
+
+    def dataset_row(self, now: float) -> dict:
+        done = self.finished(now)
+        return {
+            "requestId": self.request_id,
+            "id": self.request_id,
+            "refreshType": self.refresh_type,
+            "startTime": _iso(self.started),
+            "endTime": _iso(self.started + self.duration) if done else "",
+            "status": ("Failed" if self.fail else "Completed") if done else "Unknown",
+        }
+
+    def dataflow_tx(self, now: float) -> dict:
+        done = self.finished(now)
+        return {
+            "id": self.request_id,
+            "refreshType": "OnDemand",
+            "startTime": _iso(self.started),
+            "endTime": _iso(self.started + self.duration) if done else "",
+            "status": ("Failed" if self.fail else "Success") if done else "InProgress",
+        }
+
+
+class FakeConfidentialClientApplication:
+    """Stub de msal.ConfidentialClientApplication (client_credentials)."""
+
+    acquired = 0
+
+    def __init__(self, client_id=None, client_credential=None, authority=None, **kwargs):
+        self.client_id = client_id
+
+    def acquire_token_for_client(self, scopes=None):
+        type(self).acquired += 1
+        return {"access_token": f"fake-aad-{uuid.uuid4().hex}", "expires_in": 3600, "token_type": "Bearer"}
+
+
+class FakePowerBI:
+    """
+    Power BI de mentira. Parâmetros:
+      latency_ms / jitter_ms   – atraso por requisição;
+      throttle_rate            – fração de requisições respondidas com 429;
+      retry_after_s            – valor do cabeçalho Retry-After nos 429;
+      dataset_duration_s / dataflow_duration_s – duração padrão de um refresh;
+      seed                     – semente do RNG (jitter e throttling reprodutíveis).
+    """
+
+    def __init__(self, *, latency_ms: float = 0, jitter_ms: float = 0, throttle_rate: float = 0.0,
+                 retry_after_s: int = 1, dataset_duration_s: float = 2.0, dataflow_duration_s: float = 3.0,
+                 seed: int = 42, host: str = "127.0.0.1", port: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.retry_after_s = retry_after_s
+        self.dataset_duration_s = dataset_duration_s
+        self.dataflow_duration_s = dataflow_duration_s
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reports: dict[tuple[str, str], dict] = {}
+        self.datasets: dict[tuple[str, str], dict] = {}
+        self.dataflows: dict[tuple[str, str], dict] = {}
+        self.stats: Counter = Counter()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    # ── ciclo de vida ──────────────────────────────────────────
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1.0/myorg"
+
+    def start(self) -> "FakePowerBI":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-powerbi", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakePowerBI":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    @contextlib.contextmanager
+    def activate(self, **extra_settings):
+        """Aponta bi.utils para este servidor e usa o stub de msal enquanto o bloco durar."""
+        from django.test import override_settings
+        from . import utils
+
+        overrides = {
+            "POWERBI_API_BASE": self.base_url,
+            "POWERBI_TENANT_ID": "fake-tenant",
+            "POWERBI_CLIENT_ID": "fake-client",
+            "POWERBI_CLIENT_SECRET": "fake-secret",
+            **extra_settings,
+        }
+        real_msal = utils.msal
+        utils.msal = SimpleNamespace(ConfidentialClientApplication=FakeConfidentialClientApplication)
+        utils._token_cache, utils._EXP = {}, None
+        try:
+            with override_settings(**overrides):
+                yield self
+        finally:
+            utils.msal = real_msal
+            utils._token_cache, utils._EXP = {}, None
+
+    # ── cenário ────────────────────────────────────────────────
+
+    def add_report(self, group_id: str, report_id: str, *, dataset_id: Optional[str] = None,
+                   name: Optional[str] = None, dataflows: tuple | list = (), history: int = 3,
+                   dataset_duration_s: Optional[float] = None, dataflow_duration_s: Optional[float] = None) -> None:
+        """Cria report + dataset (+ dataflows upstream) com `history` refreshes concluídos no passado."""
+        g, r = group_id.lower(), report_id.lower()
+        d = (dataset_id or f"ds-{r}").lower()
+        ds_dur = self.dataset_duration_s if dataset_duration_s is None else dataset_duration_s
+        df_dur = self.dataflow_duration_s if dataflow_duration_s is None else dataflow_duration_s
+        now = time.time()
+        with self._lock:
+            self.reports[(g, r)] = {
+                "id": r, "name": name or f"Relatório {r}", "datasetId": d, "datasetWorkspaceId": g,
+                "embedUrl": f"https://app.powerbi.com/reportEmbed?reportId={r}&groupId={g}",
+            }
+            past = [_Run(now - (i + 1) * 3600, ds_dur, refresh_type="Scheduled") for i in range(history)]
+            self.datasets[(g, d)] = {
+                "duration": ds_dur,
+                "dataflows": [(g, str(df).lower()) for df in dataflows],
+                "runs": past,
+            }
+            for df in dataflows:
+                key = (g, str(df).lower())
+                if key not in self.dataflows:
+                    self.dataflows[key] = {
+                        "duration": df_dur,
+                        "runs": [_Run(now - (i + 1) * 3600, df_dur) for i in range(history)],
+                    }
+
+    def busy(self) -> bool:
+        """True se algum refresh (dataset ou dataflow) ainda está em andamento."""
+        now = time.time()
+        with self._lock:
+            items = [*self.datasets.values(), *self.dataflows.values()]
+            return any(not run.finished(now) for it in items for run in it["runs"])
+
+    def wait_idle(self, timeout_s: float = 60) -> bool:
+        deadline = time.time() + timeout_s
+        while self.busy():
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+    def fail_next(self, group_id: str, dataflow_id: str) -> None:
+        """A próxima execução do dataflow termina em Failed."""
+        with self._lock:
+            self.dataflows[(group_id.lower(), dataflow_id.lower())]["fail_next"] = True
+
+    # ── roteamento ─────────────────────────────────────────────
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):  # silencioso
+                pass
+
+            def do_GET(self):
+                fake._dispatch(self, "GET")
+
+            def do_POST(self):
+                fake._dispatch(self, "POST")
+
+        return Handler
+
+    def _dispatch(self, h: BaseHTTPRequestHandler, method: str) -> None:
+        length = int(h.headers.get("Content-Length") or 0)
+        if length:
+            h.rfile.read(length)
+
+        delay = self.latency_ms + (self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+        parts = urlsplit(h.path)
+        segs = [s.lower() for s in parts.path.strip("/").split("/")]
+        if segs[:2] == ["v1.0", "myorg"]:
+            segs = segs[2:]
+        query = parse_qs(parts.query)
+        top = int((query.get("$top") or ["100"])[0])
+        route = self._route_name(method, segs)
+
+        with self._lock:
+            self.stats[route] += 1
+            self.stats["total"] += 1
+            throttled = self.throttle_rate and self._rng.random() < self.throttle_rate
+            if throttled:
+                self.stats["throttled"] += 1
+
+        if not h.headers.get("Authorization", "").startswith("Bearer "):
+            return self._send(h, 401, {"error": {"code": "TokenExpired"}})
+        if throttled:
+            return self._send(h, 429, {"error": {"code": "TooManyRequests"}}, {"Retry-After": str(self.retry_after_s)})
+
+        status, body = self._handle(method, segs, top)
+        self._send(h, status, body)
+
+    @staticmethod
+    def _route_name(method: str, segs: list[str]) -> str:
+        named = []
+        for i, s in enumerate(segs):
+            named.append(s if i % 2 == 0 else "{id}")
+        return f"{method} /" + "/".join(named)
+
+    @staticmethod
+    def _send(h: BaseHTTPRequestHandler, status: int, body: Optional[dict], headers: Optional[dict] = None) -> None:
+        raw = json.dumps(body).encode("utf-8") if body is not None else b""
+        h.send_response(status)
+        h.send_header("Content-Type", "application/json; charset=utf-8")
+        h.send_header("Content-Length", str(len(raw)))
+        for k, v in (headers or {}).items():
+            h.send_header(k, v)
+        h.end_headers()
+        h.wfile.write(raw)
+
+    def _handle(self, method: str, segs: list[str], top: int) -> tuple[int, Optional[dict]]:
+        now = time.time()
+        with self._lock:
+            # /datasets/{d}
+            if method == "GET" and len(segs) == 2 and segs[0] == "datasets":
+                for (g, d) in self.datasets:
+                    if d == segs[1]:
+                        return 200, {"id": d, "isEffectiveIdentityRequired": False}
+                return 404, {"error": {"code": "ItemNotFound"}}
+
+            if len(segs) < 2 or segs[0] != "groups":
+                return 404, {"error": {"code": "NotFound"}}
+            g, rest = segs[1], segs[2:]
+
+            if rest == ["reports"] and method == "GET":
+                return 200, {"value": [dict(v, groupId=k[0]) for k, v in self.reports.items() if k[0] == g]}
+            if len(rest) >= 2 and rest[0] == "reports":
+                rpt = self.reports.get((g, rest[1]))
+                if not rpt:
+                    return 404, {"error": {"code": "ItemNotFound"}}
+                if len(rest) == 2 and method == "GET":
+                    return 200, dict(rpt)
+                if rest[2:] == ["generatetoken"] and method == "POST":
+                    exp = int(now + 3600)
+                    payload = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).decode().rstrip("=")
+                    return 200, {"token": f"fake.{payload}.sig", "expiration": _iso(exp)}
+
+            if rest == ["lineage"]:
+                return 404, {"error": {"code": "FeatureNotAvailable"}}
+            if rest == ["dataflows"] and method == "GET":
+                return 200, {"value": [{"objectId": df, "name": f"Dataflow {df}"} for (gg, df) in self.dataflows if gg == g]}
+
+            if len(rest) >= 2 and rest[0] == "datasets":
+                ds = self.datasets.get((g, rest[1]))
+                if not ds:
+                    return 404, {"error": {"code": "ItemNotFound"}}
+                tail = rest[2:]
+                if not tail and method == "GET":
+                    return 200, {"id": rest[1]}
+                if tail == ["refreshes"] and method == "GET":
+                    runs = sorted(ds["runs"], key=lambda x: x.started, reverse=True)[:top]
+                    return 200, {"value": [x.dataset_row(now) for x in runs]}
+                if tail == ["refreshes"] and method == "POST":
+                    if any(not x.finished(now) for x in ds["runs"]):
+                        return 400, {"error": {"code": "InvalidRequest", "message": "Another refresh request is already executing"}}
+                    ds["runs"].append(_Run(now, ds["duration"]))
+                    return 202, None
+                if tail == ["upstreamdataflows"]:
+                    return 200, {"value": [{"dataflowObjectId": df, "dataflowId": df, "groupId": gg} for gg, df in ds["dataflows"]]}
+                if tail in (["upstreamdatasets"], ["datasources"]):
+                    return 200, {"value": []}
+
+            if len(rest) >= 3 and rest[0] == "dataflows":
+                df = self.dataflows.get((g, rest[1]))
+                if not df:
+                    return 404, {"error": {"code": "ItemNotFound"}}
+                if rest[2] == "transactions" and method == "GET":
+                    runs = sorted(df["runs"], key=lambda x: x.started, reverse=True)[:top]
+                    return 200, {"value": [x.dataflow_tx(now) for x in runs]}
+                if rest[2] == "refreshes" and method == "POST":
+                    if any(not x.finished(now) for x in df["runs"]):
+                        return 400, {"error": {"pbi.error": {"code": "CdsaModelIsAlreadyRefreshing"}}}
+                    df["runs"].append(_Run(now, df["duration"], fail=df.pop("fail_next", False)))
+                    return 200, None
+
+        return 404, {"error": {"code": "NotFound"}}
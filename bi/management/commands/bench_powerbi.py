@@ -0,0 +1,158 @@
+# bi/management/commands/bench_powerbi.py
+from __future__ import annotations
+
+import statistics
+import time
+import uuid
+from typing import Callable
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+
+from bi.fake_powerbi import FakePowerBI
+
+SCENARIOS = ("sync", "last_update_cold", "last_update_warm", "cascade")
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _forget_report_caches(fake: FakePowerBI) -> None:
+    """Apaga só as chaves por relatório/dataset do cenário (o access_token do processo continua)."""
+    from bi.utils import _RESOLVE_CACHE_PREFIX, _refresh_history_key, last_update_key
+
+    keys = []
+    for (g, r), meta in fake.reports.items():
+        keys += [last_update_key(g, r), f"{_RESOLVE_CACHE_PREFIX}{g}:{r}", _refresh_history_key(g, meta["datasetId"])]
+    cache.delete_many(keys)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede cascade_refresh, sincronizar_bi_reports e get_last_update_rt contra um Power BI "
+        "simulado local (latência/throttling configuráveis). Nada é gravado no banco."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reports", type=int, default=5, help="Relatórios no workspace simulado")
+        parser.add_argument("--dataflows", type=int, default=2, help="Dataflows upstream por dataset")
+        parser.add_argument("--iterations", type=int, default=5, help="Repetições por cenário")
+        parser.add_argument("--latency-ms", type=float, default=50, help="Latência fixa por requisição")
+        parser.add_argument("--jitter-ms", type=float, default=20, help="Jitter máximo por requisição")
+        parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fração de respostas 429 (0–1)")
+        parser.add_argument("--retry-after", type=int, default=1, help="Retry-After (s) dos 429")
+        parser.add_argument("--dataset-duration", type=float, default=2.0, help="Duração (s) do refresh do dataset")
+        parser.add_argument("--dataflow-duration", type=float, default=3.0, help="Duração (s) do refresh dos dataflows")
+        parser.add_argument("--scenarios", type=str, default=",".join(SCENARIOS),
+                            help=f"Lista separada por vírgula: {', '.join(SCENARIOS)}")
+        parser.add_argument("--use-default-cache", action="store_true",
+                            help="Usa o cache configurado (ex.: Redis) em vez de um LocMem isolado")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **opts):
+        scenarios = [s.strip() for s in opts["scenarios"].split(",") if s.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            self.stderr.write(self.style.ERROR(f"Cenários desconhecidos: {', '.join(sorted(unknown))}"))
+            return
+
+        fake = FakePowerBI(
+            latency_ms=opts["latency_ms"], jitter_ms=opts["jitter_ms"],
+            throttle_rate=opts["throttle_rate"], retry_after_s=opts["retry_after"],
+            dataset_duration_s=opts["dataset_duration"], dataflow_duration_s=opts["dataflow_duration"],
+            seed=opts["seed"],
+        )
+        group_id = "bench-group"
+        for i in range(opts["reports"]):
+            fake.add_report(group_id, f"bench-report-{i}",
+                            dataflows=[f"bench-df-{i}-{j}" for j in range(opts["dataflows"])])
+
+        cache_settings = {} if opts["use_default_cache"] else {
+            "CACHES": {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                   "LOCATION": f"bench-{uuid.uuid4().hex}"}},
+        }
+
+        self.stdout.write(
+            f"Power BI simulado: {opts['reports']} relatórios × {opts['dataflows']} dataflows | "
+            f"latência {opts['latency_ms']:.0f}±{opts['jitter_ms']:.0f} ms | 429 {opts['throttle_rate']:.0%}"
+        )
+        rows = []
+        with fake, override_settings(**cache_settings), fake.activate(POWERBI_GROUP_ID_DEFAULT=group_id):
+            try:
+                with transaction.atomic():
+                    for name in scenarios:
+                        rows.append(self._run(name, fake, group_id, opts["iterations"]))
+                    raise _Rollback()
+            except _Rollback:
+                pass
+
+        self.stdout.write("")
+        self.stdout.write(f"{'cenário':<18} {'n':>3} {'p50 ms':>9} {'p95 ms':>9} {'máx ms':>9} {'req/it':>7} {'429':>5}")
+        for name, samples, calls, throttled in rows:
+            ms = sorted(s * 1000 for s in samples)
+            p95 = ms[min(len(ms) - 1, int(round(0.95 * (len(ms) - 1))))]
+            self.stdout.write(
+                f"{name:<18} {len(ms):>3} {statistics.median(ms):>9.1f} {p95:>9.1f} {ms[-1]:>9.1f} "
+                f"{calls / max(1, len(ms)):>7.1f} {throttled:>5}"
+            )
+
+    # ── cenários ───────────────────────────────────────────────
+
+    def _run(self, name: str, fake: FakePowerBI, group_id: str, iterations: int):
+        from bi.models import BIReport
+        from bi.tasks import sincronizar_bi_reports
+        from bi.utils import cascade_refresh
+        from bi.views import get_last_update_rt
+
+        if name != "sync" and not BIReport.objects.filter(group_id=group_id).exists():
+            sincronizar_bi_reports()
+        for (g, r), meta in fake.reports.items():
+            ds = fake.datasets[(g, meta["datasetId"])]
+            BIReport.objects.filter(report_id=r).update(
+                upstream_dataflows=[{"group_id": gg, "dataflow_id": df} for gg, df in ds["dataflows"]]
+            )
+        report_ids = [r for (_, r) in fake.reports]
+
+        user = get_user_model().objects.create(username=f"bench-{uuid.uuid4().hex[:12]}")
+        factory = RequestFactory()
+
+        def last_update(i: int) -> None:
+            req = factory.get("/", {"report_id": report_ids[i % len(report_ids)], "group_id": group_id})
+            req.user = user
+            get_last_update_rt(req)
+
+        def cascade(i: int) -> None:
+            result = cascade_refresh(report_ids[i % len(report_ids)], group_id, wait_for_dataflows=True)
+            if not result.get("ok"):
+                self.stderr.write(f"cascade #{i}: {result.get('dataset') or result.get('error')}")
+
+        steps: dict[str, tuple[Callable[[int], None], bool]] = {
+            "sync": (lambda i: sincronizar_bi_reports(), True),
+            "last_update_cold": (last_update, True),
+            "last_update_warm": (last_update, False),
+            "cascade": (cascade, False),
+        }
+        step, cold = steps[name]
+        if name == "last_update_warm":
+            for i in range(len(report_ids)):
+                last_update(i)
+
+        samples: list[float] = []
+        calls = throttled = 0
+        for i in range(iterations):
+            if cold:
+                _forget_report_caches(fake)
+            if name == "cascade":
+                fake.wait_idle()
+            before_total, before_429 = fake.stats["total"], fake.stats["throttled"]
+            t0 = time.perf_counter()
+            step(i)
+            samples.append(time.perf_counter() - t0)
+            calls += fake.stats["total"] - before_total
+            throttled += fake.stats["throttled"] - before_429
+            self.stdout.write(f"  {name} #{i + 1}: {samples[-1] * 1000:.1f} ms")
+        return name, samples, calls, throttled
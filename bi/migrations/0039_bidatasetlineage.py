@@ -0,0 +1,31 @@
+# Generated by Django 5.1.2 on 2026-10-19 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bi', '0038_alter_biaccess_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BIDatasetLineage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_id', models.CharField(max_length=64)),
+                ('dataset_id', models.CharField(max_length=64)),
+                ('dataflows', models.JSONField(blank=True, default=list)),
+                ('source', models.CharField(blank=True, default='', max_length=32)),
+                ('discovered_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Linhagem de Dataset',
+                'verbose_name_plural': 'Linhagens de Dataset',
+                'default_permissions': (),
+                'unique_together': {('group_id', 'dataset_id')},
+            },
+        ),
+    ]
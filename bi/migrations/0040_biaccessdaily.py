@@ -0,0 +1,67 @@
+# Generated by Django 5.1.2 on 2026-10-19 11:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_daily(apps, schema_editor):
+    """Popula o rollup diário a partir do histórico existente de BIAccess."""
+    from django.db.models import Count, Max, Min
+    from django.db.models.functions import TruncDate
+
+    BIAccess = apps.get_model("bi", "BIAccess")
+    BIAccessDaily = apps.get_model("bi", "BIAccessDaily")
+
+    rows = (
+        BIAccess.objects.annotate(day=TruncDate("accessed_at"))
+        .values("bi_report_id", "user_id", "day")
+        .annotate(views=Count("id"), first_access=Min("accessed_at"), last_access=Max("accessed_at"))
+        .order_by()
+    )
+    batch = []
+    for r in rows.iterator(chunk_size=2000):
+        batch.append(BIAccessDaily(**r))
+        if len(batch) >= 2000:
+            BIAccessDaily.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        BIAccessDaily.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bi', '0039_bidatasetlineage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='biaccess',
+            name='accessed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='BIAccessDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('first_access', models.DateTimeField()),
+                ('last_access', models.DateTimeField()),
+                ('bi_report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_daily', to='bi.bireport')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Acessos a BI (diário)',
+                'verbose_name_plural': 'Acessos a BI (diário)',
+                'ordering': ['-day', '-last_access'],
+                'default_permissions': (),
+                'indexes': [models.Index(fields=['bi_report', 'day'], name='bi_biaccess_bi_repo_852e2e_idx'), models.Index(fields=['user', 'day'], name='bi_biaccess_user_id_9c2e5f_idx')],
+                'unique_together': {('bi_report', 'user', 'day')},
+            },
+        ),
+        migrations.RunPython(backfill_daily, migrations.RunPython.noop),
+    ]
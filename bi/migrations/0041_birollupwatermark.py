@@ -0,0 +1,38 @@
+# Generated by Django 5.1.2 on 2026-10-19 11:24
+
+from django.db import migrations, models
+
+
+def seed_watermark(apps, schema_editor):
+    """Acessos já existentes foram consolidados (backfill da 0040 + rollup na gravação)."""
+    from django.db.models import Max
+
+    BIAccess = apps.get_model("bi", "BIAccess")
+    BIRollupWatermark = apps.get_model("bi", "BIRollupWatermark")
+    last_id = BIAccess.objects.aggregate(m=Max("id"))["m"] or 0
+    BIRollupWatermark.objects.update_or_create(name="bi_access_daily", defaults={"last_id": last_id})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bi', '0040_biaccessdaily'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BIRollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': "Marca d'água de rollup",
+                'verbose_name_plural': "Marcas d'água de rollup",
+                'default_permissions': (),
+            },
+        ),
+        migrations.RunPython(seed_watermark, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-19 16:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bi', '0041_birollupwatermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='biaccess',
+            name='recorded_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
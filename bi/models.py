@@ -7,6 +7,7 @@ from typing import List, Dict, Any
 from django.db import models
 from django.conf import settings
 from django.contrib.auth.models import Group
+from django.utils import timezone
 
 _GUID_RE = r"[0-9a-fA-F-]{36}"
 
@@ -194,7 +195,10 @@ class BIReport(models.Model):
 class BIAccess(models.Model):
     bi_report = models.ForeignKey("BIReport", on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    accessed_at = models.DateTimeField(auto_now_add=True)
+    # default (e não auto_now_add) para o flush em lote preservar o horário real do acesso
+    accessed_at = models.DateTimeField(default=timezone.now)
+    # momento da gravação (não do acesso): o rollup só consolida linhas mais velhas que a folga
+    recorded_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         default_permissions = ()  # desativa permissões padrão
@@ -217,6 +221,51 @@ class BIAccess(models.Model):
         return f"{self.user.username} acessou {self.bi_report.title} em {self.accessed_at}"
 
 
+class BIAccessDaily(models.Model):
+    """
+    Rollup diário de acessos (relatório × usuário × dia).
+    Os relatórios de acesso leem daqui em vez de varrer BIAccess.
+    """
+    bi_report = models.ForeignKey("BIReport", on_delete=models.CASCADE, related_name="access_daily")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    day = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    first_access = models.DateTimeField()
+    last_access = models.DateTimeField()
+
+    class Meta:
+        default_permissions = ()
+        unique_together = ("bi_report", "user", "day")
+        indexes = [
+            models.Index(fields=["bi_report", "day"]),
+            models.Index(fields=["user", "day"]),
+        ]
+        ordering = ["-day", "-last_access"]
+        verbose_name = "Acessos a BI (diário)"
+        verbose_name_plural = "Acessos a BI (diário)"
+
+    def __str__(self) -> str:
+        return f"{self.user} → {self.bi_report} em {self.day}: {self.views}"
+
+
+class BIRollupWatermark(models.Model):
+    """
+    Marca d'água de rollups incrementais: último id da tabela bruta já consolidado.
+    A task de rollup processa só o que vier depois dela.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        default_permissions = ()
+        verbose_name = "Marca d'água de rollup"
+        verbose_name_plural = "Marcas d'água de rollup"
+
+    def __str__(self) -> str:
+        return f"{self.name} → {self.last_id}"
+
+
 class BIUserReportState(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     bi_report = models.ForeignKey("BIReport", on_delete=models.CASCADE)
@@ -350,3 +399,27 @@ class BISavedView(models.Model):
             "created_at": self.created_at.isoformat(),
             "updated_at": self.updated_at.isoformat(),
         }
+
+
+class BIDatasetLineage(models.Model):
+    """
+    Cache persistido da linhagem (dataflows upstream) de um dataset, com TTL.
+    Preenchido pela descoberta automática em bi.utils e renovado em background.
+    """
+    group_id = models.CharField(max_length=64)
+    dataset_id = models.CharField(max_length=64)
+    # Ex.: [{"group_id": "...", "dataflow_id": "..."}]
+    dataflows = models.JSONField(default=list, blank=True)
+    # Estratégia que produziu a resposta (upstreamDataflows, lineage, datasources, ...)
+    source = models.CharField(max_length=32, blank=True, default="")
+    discovered_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        default_permissions = ()
+        unique_together = ("group_id", "dataset_id")
+        verbose_name = "Linhagem de Dataset"
+        verbose_name_plural = "Linhagens de Dataset"
+
+    def __str__(self) -> str:
+        return f"{self.group_id}/{self.dataset_id} ({self.source or '—'})"
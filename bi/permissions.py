@@ -0,0 +1,74 @@
+# bi/permissions.py – conjunto de relatórios acessíveis por usuário (cacheado)
+from __future__ import annotations
+
+from typing import FrozenSet
+
+from django.conf import settings
+from django.core.cache import cache
+
+ACCESS_CACHE_TTL = int(getattr(settings, "POWERBI_ACCESS_CACHE_TTL", 60 * 60))  # 1 h
+
+# Versão global: incrementada quando a mudança afeta um número indeterminado de
+# usuários (all_users, grupos do relatório, exclusão de grupo/relatório).
+_VERSION_KEY = "pbi:acl:ver"
+
+
+def _version() -> int:
+    return cache.get_or_set(_VERSION_KEY, 1, timeout=None)
+
+
+def _user_version_key(user_id: int) -> str:
+    return f"pbi:acl:uver:{user_id}"
+
+
+def acl_version(user_id: int) -> str:
+    """Versão das permissões do usuário (global + individual), para compor chaves de cache derivadas."""
+    return f"{_version()}.{cache.get(_user_version_key(user_id)) or 0}"
+
+
+def _user_key(user_id: int) -> str:
+    return f"pbi:acl:v{_version()}:u{user_id}"
+
+
+def _compute_accessible_ids(user) -> FrozenSet[int]:
+    from .models import BIReport
+
+    ids = set(BIReport.objects.filter(all_users=True).values_list("id", flat=True))
+    ids.update(BIReport.objects.filter(allowed_users=user).values_list("id", flat=True))
+    ids.update(BIReport.objects.filter(allowed_groups__user=user).values_list("id", flat=True))
+    return frozenset(ids)
+
+
+def accessible_report_ids(user) -> FrozenSet[int]:
+    """Ids de BIReport que o usuário pode ver (todos, individual ou via grupo)."""
+    if not user or not getattr(user, "is_authenticated", False):
+        return frozenset()
+    key = _user_key(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = _compute_accessible_ids(user)
+        cache.set(key, ids, timeout=ACCESS_CACHE_TTL)
+    return ids
+
+
+def user_can_access_report(user, bi_report) -> bool:
+    if bi_report.all_users:
+        return True
+    return bi_report.pk in accessible_report_ids(user)
+
+
+def invalidate_user(*user_ids: int) -> None:
+    if user_ids:
+        cache.delete_many([_user_key(uid) for uid in user_ids])
+        for uid in user_ids:
+            try:
+                cache.incr(_user_version_key(uid))
+            except ValueError:
+                cache.set(_user_version_key(uid), 1, timeout=None)
+
+
+def invalidate_all() -> None:
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        cache.set(_VERSION_KEY, 2, timeout=None)
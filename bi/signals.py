@@ -0,0 +1,60 @@
+# bi/signals.py – invalidação do cache de permissões de BI (bi.permissions)
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import BIReport
+from .permissions import invalidate_all, invalidate_user
+
+User = get_user_model()
+
+_CHANGES = {"post_add", "post_remove", "post_clear"}
+
+
+@receiver(m2m_changed, sender=BIReport.allowed_users.through)
+def acl_allowed_users_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in _CHANGES:
+        return
+    if reverse:
+        # user.bi_reports.add(...) → só este usuário
+        invalidate_user(instance.pk)
+    elif pk_set:
+        invalidate_user(*pk_set)
+    else:
+        invalidate_all()  # clear(): não sabemos quem estava na lista
+
+
+@receiver(m2m_changed, sender=BIReport.allowed_groups.through)
+def acl_allowed_groups_changed(sender, action, **kwargs):
+    if action in _CHANGES:
+        invalidate_all()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def acl_user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in _CHANGES:
+        return
+    if not reverse:
+        invalidate_user(instance.pk)
+    elif pk_set:
+        # group.user_set.add(...) → usuários afetados
+        invalidate_user(*pk_set)
+    else:
+        invalidate_all()
+
+
+@receiver(post_save, sender=BIReport)
+def acl_report_saved(sender, instance, created, update_fields=None, **kwargs):
+    # saves parciais que não tocam all_users (ex.: last_updated) não mudam o acesso
+    if update_fields is not None and "all_users" not in update_fields:
+        return
+    if created and not instance.all_users:
+        return
+    invalidate_all()
+
+
+@receiver(post_delete, sender=BIReport)
+@receiver(post_delete, sender=Group)
+def acl_report_or_group_deleted(sender, **kwargs):
+    invalidate_all()
@@ -0,0 +1,117 @@
+# bi/state_store.py – estado do relatório por usuário com write-behind em cache
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import time
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+STATE_CACHE_TTL = int(getattr(settings, "POWERBI_STATE_CACHE_TTL", 24 * 60 * 60))   # 24 h
+STATE_FLUSH_DELAY_S = int(getattr(settings, "POWERBI_STATE_FLUSH_DELAY_S", 10))     # silêncio antes de gravar
+
+
+def _key(user_id: int, report_pk: int) -> str:
+    return f"pbi:state:{user_id}:{report_pk}"
+
+
+def state_hash(state: dict) -> str:
+    raw = json.dumps(state or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _entry_from_db(user_id: int, report_pk: int) -> Optional[dict]:
+    from .models import BIUserReportState
+
+    row = (BIUserReportState.objects
+           .filter(user_id=user_id, bi_report_id=report_pk)
+           .values("state", "updated_at")
+           .first())
+    if not row:
+        return None
+    h = state_hash(row["state"])
+    return {
+        "state": row["state"] or {},
+        "hash": h,
+        "persisted_hash": h,
+        "seq": 0,
+        "updated_at": row["updated_at"].isoformat(),
+    }
+
+
+def load_state(user_id: int, report_pk: int) -> Tuple[dict, str]:
+    """(state, updated_at_iso) — cache primeiro, banco como reserva; ({}, "") se não houver."""
+    key = _key(user_id, report_pk)
+    entry = cache.get(key)
+    if entry is None:
+        entry = _entry_from_db(user_id, report_pk)
+        if entry is None:
+            return {}, ""
+        cache.add(key, entry, STATE_CACHE_TTL)
+    return entry["state"], entry["updated_at"]
+
+
+def save_state(user_id: int, report_pk: int, state: dict) -> Tuple[str, bool]:
+    """
+    Guarda o estado mais recente no cache e agenda a gravação após STATE_FLUSH_DELAY_S.
+    Estado idêntico (mesmo hash) não gera escrita. Retorna (updated_at_iso, mudou?).
+    """
+    key = _key(user_id, report_pk)
+    h = state_hash(state)
+    prev = cache.get(key)
+    if prev is None:
+        prev = _entry_from_db(user_id, report_pk)
+    if prev and prev["hash"] == h:
+        return prev["updated_at"], False
+
+    seq = time.time_ns()
+    entry = {
+        "state": state,
+        "hash": h,
+        "persisted_hash": (prev or {}).get("persisted_hash"),
+        "seq": seq,
+        "updated_at": timezone.now().isoformat(),
+    }
+    cache.set(key, entry, STATE_CACHE_TTL)
+
+    try:
+        from .tasks import flush_user_report_state
+        flush_user_report_state.apply_async((user_id, report_pk, seq), countdown=STATE_FLUSH_DELAY_S)
+    except Exception:
+        logger.warning("BI: broker indisponível — gravando estado direto.", exc_info=True)
+        flush_state(user_id, report_pk)
+    return entry["updated_at"], True
+
+
+def flush_state(user_id: int, report_pk: int, seq: Optional[int] = None) -> bool:
+    """
+    Grava no banco a última versão do estado. Com `seq`, só grava se nenhuma escrita
+    mais nova chegou depois (a mais nova tem o seu próprio flush agendado).
+    """
+    from .models import BIUserReportState
+
+    key = _key(user_id, report_pk)
+    entry = cache.get(key)
+    if not entry:
+        return False
+    if seq is not None and entry.get("seq") != seq:
+        return False
+    if entry.get("persisted_hash") == entry["hash"]:
+        return False
+
+    BIUserReportState.objects.update_or_create(
+        user_id=user_id, bi_report_id=report_pk, defaults={"state": entry["state"]}
+    )
+
+    # marca como persistido, a menos que outra escrita tenha chegado nesse meio-tempo
+    current = cache.get(key)
+    if current and current.get("seq") == entry.get("seq"):
+        current["persisted_hash"] = entry["hash"]
+        cache.set(key, current, STATE_CACHE_TTL)
+    return True
@@ -7,6 +7,7 @@ from typing import Optional, List, Dict
 import requests
 from celery import shared_task
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 
@@ -55,19 +56,14 @@ def _get_dataset_last_refresh_time(
         logger.warning("last_refresh_time: parâmetros ausentes (dataset/group).")
         return None
 
-    url = f"https://api.powerbi.com/v1.0/myorg/groups/{dataset_group_id}/datasets/{dataset_id}/refreshes?$top=1"
-    headers = {"Authorization": f"Bearer {access_token}"}
-    logger.log(_wire_level(), "GET %s", url)
+    from .utils import get_dataset_refresh_history, _auth_headers
 
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
-        logger.log(_wire_level(), "HTTP %s (last_refresh_time)", resp.status_code)
-
-        if resp.status_code != 200:
-            logger.error("last_refresh_time: http_%s body=%s", resp.status_code, _short(resp.text))
-            resp.raise_for_status()
-
-        rows = (resp.json() or {}).get("value", []) or []
+        # histórico incremental compartilhado com as views (bi.utils)
+        rows = get_dataset_refresh_history(dataset_group_id, dataset_id, _auth_headers(access_token))
+        if rows is None:
+            logger.error("last_refresh_time: histórico indisponível (dataset %s).", dataset_id)
+            return None
         last = rows[0] if rows else {}
         status = (last.get("status") or "").strip()
         end_s = last.get("endTime")
@@ -105,7 +101,9 @@ def _get_dataset_last_refresh_time(
 
 
 def _listar_relatorios(group_id: str, access_token: str) -> Optional[List[Dict]]:
-    url = f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/reports"
+    from .utils import _api_base
+
+    url = f"{_api_base()}/groups/{group_id}/reports"
     headers = {"Authorization": f"Bearer {access_token}"}
     logger.log(_wire_level(), "GET %s", url)
     try:
@@ -212,7 +210,7 @@ def sincronizar_bi_reports():
 def cascade_refresh_dataset_with_dataflows(report_id: str, report_group_id: str,
                                            wait_for_dataflows: bool = True,
                                            df_timeout_s: int = 1800,
-                                           poll_every_s: int = 15,
+                                           poll_every_s: Optional[int] = None,
                                            fail_on_dataflow_error: bool = True):
     from .utils import cascade_refresh
     logger.info("CASCADE: acionando (wait=%s) report=%s group=%s", wait_for_dataflows, report_id, report_group_id)
@@ -230,3 +228,213 @@ def cascade_refresh_dataset_with_dataflows(report_id: str, report_group_id: str,
     except Exception:
         logger.exception("CASCADE: erro inesperado")
         return {"ok": False, "stage": "internal_error"}
+
+
+@shared_task(ignore_result=True)
+def poll_refresh_status(report_id: str, report_group_id: str, started_at: Optional[int] = None):
+    """
+    Poller compartilhado de status de refresh (um por report, garantido por lock em cache).
+    Cada execução consulta o Power BI uma vez, grava o snapshot e — se ainda houver refresh
+    em andamento — se reagenda com countdown, sem prender o worker em sleep.
+    """
+    from .utils import (
+        STATUS_POLL_INTERVAL_S,
+        STATUS_POLL_MAX_S,
+        build_refresh_status_snapshot,
+        store_refresh_status_snapshot,
+        expire_refresh_status_poller,
+        touch_refresh_status_poller,
+        release_refresh_status_poller,
+    )
+
+    started_at = int(started_at or time.time())
+    try:
+        snap = build_refresh_status_snapshot(report_id, report_group_id)
+    except Exception:
+        logger.exception("STATUS: erro consultando status report=%s group=%s", report_id, report_group_id)
+        snap = {"ok": False, "error": "internal_error", "running": False, "polled_at": int(time.time())}
+
+    expired = (time.time() - started_at) >= STATUS_POLL_MAX_S
+    if snap.get("running") and expired:
+        # não deixa um snapshot “rodando” para trás: ele reabriria o poller na próxima leitura
+        expire_refresh_status_poller(report_id, report_group_id, snap)
+    else:
+        store_refresh_status_snapshot(report_id, report_group_id, snap)
+
+    if snap.get("running") and not expired:
+        touch_refresh_status_poller(report_id, report_group_id)
+        try:
+            poll_refresh_status.apply_async(
+                args=(report_id, report_group_id, started_at),
+                countdown=STATUS_POLL_INTERVAL_S,
+            )
+            return
+        except Exception:
+            logger.exception("STATUS: falha ao reagendar poller report=%s group=%s", report_id, report_group_id)
+
+    if snap.get("running") and expired:
+        logger.warning("STATUS: poller encerrado por tempo máximo report=%s group=%s", report_id, report_group_id)
+    release_refresh_status_poller(report_id, report_group_id)
+
+
+@shared_task(ignore_result=True)
+def refresh_dataset_lineage(dataset_id: str, dataset_group_id: str, report_id: str = ""):
+    """Redescobre a linhagem upstream de um dataset e atualiza BIDatasetLineage (background)."""
+    from .utils import (
+        get_powerbi_access_token, _auth_headers,
+        _discover_upstream_dataflows_with_source, store_dataset_lineage, _lineage_lock_key,
+    )
+
+    access_token = get_powerbi_access_token()
+    if not access_token:
+        logger.error("LINHAGEM: sem access_token — abortando.")
+        return
+    try:
+        ups, source = _discover_upstream_dataflows_with_source(
+            dataset_id, dataset_group_id, _auth_headers(access_token), report_id=report_id
+        )
+        store_dataset_lineage(dataset_id, dataset_group_id, ups, source)
+        logger.info("LINHAGEM: %s/%s → %d dataflow(s) via %s", dataset_group_id, dataset_id, len(ups), source or "—")
+    except Exception:
+        logger.exception("LINHAGEM: erro ao renovar %s/%s", dataset_group_id, dataset_id)
+    finally:
+        cache.delete(_lineage_lock_key(dataset_group_id, dataset_id))
+
+
+@shared_task(ignore_result=True)
+def refresh_expiring_lineages(ahead_minutes: int = 30, limit: int = 50):
+    """
+    Periódica: renova linhagens que expiram nos próximos `ahead_minutes`, só de datasets
+    com acesso recente (BIAccessDaily nos últimos POWERBI_LINEAGE_ACTIVE_DAYS dias).
+    As demais expiram; se voltarem a ser usadas, get_upstream_lineage redescobre sob demanda.
+    """
+    from .models import BIDatasetLineage, BIReport
+
+    active_days = int(getattr(settings, "POWERBI_LINEAGE_ACTIVE_DAYS", 7))
+    since = (timezone.now() - datetime.timedelta(days=active_days)).date()
+    active = {
+        str(d).lower()
+        for d in BIReport.objects.filter(access_daily__day__gte=since)
+        .exclude(dataset_id__isnull=True).exclude(dataset_id="")
+        .values_list("dataset_id", flat=True).distinct()
+    }
+    if not active:
+        logger.info("LINHAGEM: nenhum dataset com acesso recente — nada a renovar.")
+        return
+
+    horizon = timezone.now() + datetime.timedelta(minutes=ahead_minutes)
+    rows = list(
+        BIDatasetLineage.objects.filter(expires_at__lte=horizon, dataset_id__in=active)
+        .order_by("expires_at")
+        .values_list("dataset_id", "group_id")[:limit]
+    )
+    for dataset_id, group_id in rows:
+        refresh_dataset_lineage.delay(dataset_id, group_id)
+    logger.info("LINHAGEM: %d renovação(ões) agendada(s).", len(rows))
+
+
+@shared_task(ignore_result=True)
+def flush_bi_access_buffer(max_batches: int = 20):
+    """
+    Periódica (ex.: a cada 1 min): drena o buffer Redis de acessos a BI para BIAccess.
+    O rollup diário fica com rollup_bi_access. Lock evita flushes concorrentes.
+    """
+    from .access_log import flush_access_buffer
+
+    lock_key = "pbi:access:flush-lock"
+    if not cache.add(lock_key, 1, timeout=5 * 60):
+        return
+    total = 0
+    try:
+        for _ in range(max_batches):
+            n = flush_access_buffer()
+            total += n
+            if not n:
+                break
+    except Exception:
+        logger.exception("ACESSOS: erro ao gravar lote de acessos")
+    finally:
+        cache.delete(lock_key)
+    if total:
+        logger.info("ACESSOS: %d acesso(s) gravado(s).", total)
+
+
+@shared_task(ignore_result=True)
+def rollup_bi_access(max_batches: int = 20):
+    """
+    Periódica (ex.: a cada 1 min, logo após o flush): consolida em BIAccessDaily só os
+    acessos novos desde a última marca d'água.
+    """
+    from .access_log import rollup_new_accesses
+
+    total = 0
+    try:
+        for _ in range(max_batches):
+            n = rollup_new_accesses()
+            total += n
+            if not n:
+                break
+    except Exception:
+        logger.exception("ACESSOS: erro no rollup diário")
+    if total:
+        logger.info("ACESSOS: %d acesso(s) consolidado(s) no rollup diário.", total)
+
+
+@shared_task(ignore_result=True)
+def purge_bi_access(days: Optional[int] = None):
+    """
+    Periódica (ex.: diária): apaga acessos brutos já consolidados e mais antigos que
+    POWERBI_ACCESS_RETENTION_DAYS. O histórico continua no rollup diário.
+    """
+    from .access_log import purge_old_accesses
+
+    try:
+        n = purge_old_accesses(days)
+    except Exception:
+        logger.exception("ACESSOS: erro na limpeza de acessos antigos")
+        return
+    if n:
+        logger.info("ACESSOS: %d acesso(s) bruto(s) antigo(s) removido(s).", n)
+
+
+@shared_task(ignore_result=True)
+def prewarm_embed_tokens(top_n: int = 20, days: int = 7):
+    """
+    Periódica (ex.: a cada 10 min): renova, antes de expirar, o embed_token dos
+    relatórios mais acessados nos últimos `days` dias (rollup BIAccessDaily).
+    """
+    from django.db.models import Sum
+    from .models import BIAccessDaily, BIReport
+    from .utils import prewarm_embed_token
+
+    since = timezone.localdate() - datetime.timedelta(days=days)
+    hot_ids = list(
+        BIAccessDaily.objects.filter(day__gte=since)
+        .values("bi_report_id")
+        .annotate(n=Sum("views"))
+        .order_by("-n")
+        .values_list("bi_report_id", flat=True)[:top_n]
+    )
+    if not hot_ids:
+        return
+
+    counts: Dict[str, int] = {}
+    for report_id, group_id in BIReport.objects.filter(pk__in=hot_ids).values_list("report_id", "group_id"):
+        try:
+            outcome = prewarm_embed_token(report_id, group_id)
+        except Exception:
+            logger.exception("PREWARM: erro renovando embed de %s", report_id)
+            outcome = "failed"
+        counts[outcome] = counts.get(outcome, 0) + 1
+    logger.info("PREWARM: %d relatório(s) quentes — %s", len(hot_ids), counts)
+
+
+@shared_task(ignore_result=True)
+def flush_user_report_state(user_id: int, report_pk: int, seq: int):
+    """Grava o estado (write-behind) se ainda for a última versão recebida."""
+    from .state_store import flush_state
+
+    try:
+        flush_state(user_id, report_pk, seq)
+    except Exception:
+        logger.exception("ESTADO: erro ao gravar estado user=%s report=%s", user_id, report_pk)
@@ -44,3 +44,629 @@ class SynchronizationTestCase(TestCase):
                 # Verifique se next_update está no próximo horário inteiro
                 expected_next_update = (bi_report.last_updated + timezone.timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
                 self.assertEqual(bi_report.next_update, expected_next_update)
+
+
+class LineageDiscoveryTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_primeira_resposta_autoritativa_vence_e_persiste(self):
+        import time
+        from . import utils
+        from .models import BIDatasetLineage
+
+        def lento(*args):
+            time.sleep(0.5)
+            return [{"group_id": "g", "dataflow_id": "lento"}]
+
+        achado = [{"group_id": "g", "dataflow_id": "df1"}]
+        probes = (
+            ("upstreamDataflows", lambda *a: []),
+            ("lineage", lambda *a: achado),
+            ("datasources", lento),
+            ("parentDatasets", lambda *a: []),
+        )
+        with patch.object(utils, "_AUTHORITATIVE_PROBES", probes):
+            ups = utils.get_upstream_lineage("ds", "g", {})
+
+        self.assertEqual(ups, achado)
+        row = BIDatasetLineage.objects.get(group_id="g", dataset_id="ds")
+        self.assertEqual(row.source, "lineage")
+
+        # segunda chamada: servida do cache, sem probes
+        with patch.object(utils, "_AUTHORITATIVE_PROBES", ()):
+            self.assertEqual(utils.get_upstream_lineage("ds", "g", {}), achado)
+
+    def test_hint_por_nome_usa_o_que_sobra_do_prazo(self):
+        import time
+        from django.test import override_settings
+        from . import utils
+
+        def lento(*args):
+            time.sleep(1.6)
+            return []
+
+        probes = (("lineage", lento),)
+        with override_settings(POWERBI_LINEAGE_PROBE_TIMEOUT_S=1), \
+                patch.object(utils, "_AUTHORITATIVE_PROBES", probes), \
+                patch.object(utils, "_name_hints_for", return_value=["Vendas"]), \
+                patch.object(utils, "_match_dataflows_by_name", side_effect=lento):
+            t0 = time.monotonic()
+            self.assertEqual(utils._discover_upstream_dataflows_with_source("ds", "g", {}), ([], ""))
+        self.assertLess(time.monotonic() - t0, 1.5)  # não dobra o prazo esperando o hint
+
+    def test_renovacao_periodica_so_de_datasets_em_uso(self):
+        import datetime
+        from django.contrib.auth import get_user_model
+        from .models import BIAccessDaily, BIDatasetLineage
+        from .tasks import refresh_expiring_lineages
+
+        agora = timezone.now()
+        user = get_user_model().objects.create(username="leitor")
+        for i, (ds, dias) in enumerate((("DS-USADO", 1), ("ds-antigo", 30), ("ds-sem-acesso", None))):
+            rep = BIReport.objects.create(title=ds, report_id=f"r{i}", group_id="g", dataset_id=ds)
+            BIDatasetLineage.objects.create(group_id="g", dataset_id=ds.lower(), discovered_at=agora, expires_at=agora)
+            if dias is not None:
+                quando = agora - datetime.timedelta(days=dias)
+                BIAccessDaily.objects.create(bi_report=rep, user=user, day=quando.date(), views=1,
+                                             first_access=quando, last_access=quando)
+
+        with patch("bi.tasks.refresh_dataset_lineage.delay") as delay:
+            refresh_expiring_lineages()
+        delay.assert_called_once_with("ds-usado", "g")
+
+
+class AccessLogTestCase(TestCase):
+    def setUp(self):
+        p = patch("bi.access_log.ACCESS_ROLLUP_LAG_S", 0)  # sem folga: o rollup vê o que acabou de gravar
+        p.start()
+        self.addCleanup(p.stop)
+
+    def test_acessos_sem_redis_gravam_direto_e_somam_no_rollup(self):
+        from django.contrib.auth import get_user_model
+        from .access_log import record_access, rollup_new_accesses
+        from .models import BIAccess, BIAccessDaily
+
+        user = get_user_model().objects.create(username="leitor")
+        bi = BIReport.objects.create(title="R", report_id="aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa")
+        t0 = timezone.now().replace(hour=10, minute=0)
+        with patch("bi.access_log._redis", return_value=None):
+            record_access(bi.pk, user.pk, when=t0)
+            record_access(bi.pk, user.pk, when=t0 + timezone.timedelta(minutes=30))
+            record_access(bi.pk, user.pk, when=t0 - timezone.timedelta(minutes=5))
+
+        self.assertEqual(BIAccess.objects.count(), 3)
+        self.assertEqual(rollup_new_accesses(), 3)
+        daily = BIAccessDaily.objects.get(bi_report=bi, user=user)
+        self.assertEqual(daily.views, 3)
+        self.assertEqual(daily.first_access, t0 - timezone.timedelta(minutes=5))
+        self.assertEqual(daily.last_access, t0 + timezone.timedelta(minutes=30))
+
+    def test_rollup_incremental_e_retencao_so_apagam_o_ja_consolidado(self):
+        from django.contrib.auth import get_user_model
+        from .access_log import purge_old_accesses, rollup_new_accesses, write_accesses
+        from .models import BIAccess, BIAccessDaily
+
+        user = get_user_model().objects.create(username="leitor")
+        bi = BIReport.objects.create(title="R", report_id="bbbbbbbb-bbbb-bbbb-bbbb-bbbbbbbbbbbb")
+        antigo = timezone.now() - timezone.timedelta(days=400)
+
+        write_accesses([(bi.pk, user.pk, antigo)])
+        self.assertEqual(purge_old_accesses(days=180), 0)  # ainda não consolidado
+        self.assertEqual(rollup_new_accesses(), 1)
+        self.assertEqual(rollup_new_accesses(), 0)  # marca d'água: nada reprocessado
+
+        write_accesses([(bi.pk, user.pk, timezone.now())])
+        self.assertEqual(rollup_new_accesses(), 1)
+        self.assertEqual(purge_old_accesses(days=180), 1)
+        self.assertEqual(BIAccess.objects.count(), 1)
+        self.assertEqual(BIAccessDaily.objects.filter(bi_report=bi).count(), 2)
+
+    def test_rollup_respeita_folga_de_linhas_recem_gravadas(self):
+        from django.contrib.auth import get_user_model
+        from .access_log import rollup_new_accesses, write_accesses
+        from .models import BIAccess, BIRollupWatermark
+
+        user = get_user_model().objects.create(username="leitor")
+        bi = BIReport.objects.create(title="R", report_id="cccccccc-cccc-cccc-cccc-cccccccccccc")
+        write_accesses([(bi.pk, user.pk, timezone.now())] * 3)
+        ids = list(BIAccess.objects.order_by("pk").values_list("pk", flat=True))
+        # id do meio gravado agora (commit tardio): a marca não pode passar dele
+        velho = timezone.now() - timezone.timedelta(minutes=10)
+        BIAccess.objects.filter(pk__in=[ids[0], ids[2]]).update(recorded_at=velho)
+
+        with patch("bi.access_log.ACCESS_ROLLUP_LAG_S", 120):
+            self.assertEqual(rollup_new_accesses(), 1)
+            self.assertEqual(BIRollupWatermark.objects.get().last_id, ids[0])
+            BIAccess.objects.filter(pk=ids[1]).update(recorded_at=velho)
+            self.assertEqual(rollup_new_accesses(), 2)
+
+
+class EmbedTokenTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    @staticmethod
+    def _fake_embed(ttl_s):
+        import base64, json, time
+        payload = base64.urlsafe_b64encode(json.dumps({"exp": time.time() + ttl_s}).encode()).decode().rstrip("=")
+        return {"embed_url": "https://x", "embed_token": f"h.{payload}.s", "report_name": "R"}
+
+    def test_cache_hit_e_prewarm_renova_perto_de_expirar(self):
+        from . import utils
+
+        with patch.object(utils, "get_powerbi_access_token", return_value="tok"), \
+             patch.object(utils, "_generate_embed_token", return_value=self._fake_embed(3600)) as gen:
+            utils.get_embed_params_user_owns_data("r", "g")
+            utils.get_embed_params_user_owns_data("r", "g")
+            self.assertEqual(gen.call_count, 1)
+            self.assertEqual(utils.prewarm_embed_token("r", "g"), "fresh")
+
+        with patch.object(utils, "get_powerbi_access_token", return_value="tok"), \
+             patch.object(utils, "_generate_embed_token", return_value=self._fake_embed(600)):
+            utils.get_embed_params_user_owns_data("r", "g", force=True)
+            self.assertEqual(utils.prewarm_embed_token("r", "g"), "renewed")
+
+    def test_espera_esgotada_nao_gera_fora_do_lock(self):
+        from django.core.cache import cache
+        from . import utils
+
+        antigo = self._fake_embed(45)  # dentro da margem de segurança, mas ainda válido
+        cache.set(utils._embed_cache_key("r", "g"), antigo)
+        cache.set(utils._embed_lock_key("r", "g"), 1)  # outro worker gerando
+        with patch.object(utils, "_EMBED_WAIT_S", 0.3), patch.object(utils, "_generate_embed_token") as gen:
+            self.assertEqual(utils.get_embed_params_user_owns_data("r", "g"), antigo)
+            cache.delete(utils._embed_cache_key("r", "g"))
+            self.assertIsNone(utils.get_embed_params_user_owns_data("r", "g"))
+        gen.assert_not_called()
+
+    def test_lock_liberado_sem_token_assume_a_geracao(self):
+        from django.core.cache import cache
+        from . import utils
+
+        cache.set(utils._embed_lock_key("r", "g"), 1, timeout=1)  # dono falhou; lock expira
+        with patch.object(utils, "get_powerbi_access_token", return_value="tok"), \
+             patch.object(utils, "_generate_embed_token", return_value=self._fake_embed(3600)) as gen:
+            self.assertIsNotNone(utils.get_embed_params_user_owns_data("r", "g"))
+        self.assertEqual(gen.call_count, 1)
+        self.assertIsNone(cache.get(utils._embed_lock_key("r", "g")))
+
+
+class PermissionCacheTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_conjunto_cacheado_acompanha_mudancas_de_permissao(self):
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.models import Group
+        from .permissions import accessible_report_ids
+
+        user = get_user_model().objects.create(username="leitor")
+        grupo = Group.objects.create(name="Financeiro")
+        r1 = BIReport.objects.create(title="R1", report_id="r1")
+        r2 = BIReport.objects.create(title="R2", report_id="r2")
+        r3 = BIReport.objects.create(title="R3", report_id="r3")
+
+        self.assertEqual(accessible_report_ids(user), frozenset())
+        with self.assertNumQueries(0):
+            accessible_report_ids(user)
+
+        r1.allowed_users.add(user)
+        self.assertEqual(accessible_report_ids(user), {r1.pk})
+
+        r2.allowed_groups.add(grupo)
+        user.groups.add(grupo)
+        self.assertEqual(accessible_report_ids(user), {r1.pk, r2.pk})
+
+        r3.all_users = True
+        r3.save()
+        self.assertEqual(accessible_report_ids(user), {r1.pk, r2.pk, r3.pk})
+
+        grupo.user_set.remove(user)
+        r1.allowed_users.clear()
+        self.assertEqual(accessible_report_ids(user), {r3.pk})
+
+
+class StateWriteBehindTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_so_a_ultima_versao_e_gravada_e_estado_igual_nao_escreve(self):
+        from django.contrib.auth import get_user_model
+        from .models import BIUserReportState
+        from .state_store import flush_state, load_state, save_state
+
+        user = get_user_model().objects.create(username="leitor")
+        bi = BIReport.objects.create(title="R", report_id="r1")
+
+        with patch("bi.tasks.flush_user_report_state.apply_async") as agendar:
+            save_state(user.pk, bi.pk, {"activePage": "P1"})
+            save_state(user.pk, bi.pk, {"activePage": "P2"})
+            _, changed = save_state(user.pk, bi.pk, {"activePage": "P2"})
+        self.assertFalse(changed)
+        self.assertEqual(agendar.call_count, 2)
+
+        primeiro_seq = agendar.call_args_list[0].args[0][2]
+        ultimo_seq = agendar.call_args_list[1].args[0][2]
+        self.assertFalse(flush_state(user.pk, bi.pk, primeiro_seq))
+        self.assertFalse(BIUserReportState.objects.exists())
+
+        self.assertEqual(load_state(user.pk, bi.pk)[0], {"activePage": "P2"})
+        self.assertTrue(flush_state(user.pk, bi.pk, ultimo_seq))
+        self.assertEqual(BIUserReportState.objects.get().state, {"activePage": "P2"})
+        self.assertFalse(flush_state(user.pk, bi.pk))
+
+
+class RefreshHistoryTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_historico_funde_paginas_pequenas_e_respeita_frescor(self):
+        from . import utils
+
+        antigos = [
+            {"requestId": "b", "status": "Completed", "startTime": "2024-01-02T10:00:00Z", "endTime": "2024-01-02T10:05:00Z"},
+            {"requestId": "a", "status": "Completed", "startTime": "2024-01-01T10:00:00Z", "endTime": "2024-01-01T10:05:00Z"},
+        ]
+        novo = {"requestId": "c", "status": "Unknown", "startTime": "2024-01-03T10:00:00Z"}
+
+        with patch("bi.utils._fetch_refresh_page", return_value=list(antigos)) as fetch:
+            rows = utils.get_dataset_refresh_history("g", "d", {})
+            self.assertEqual([r["requestId"] for r in rows], ["b", "a"])
+            utils.get_dataset_refresh_history("g", "d", {})
+            self.assertEqual(fetch.call_count, 1)  # ainda fresco: nenhuma chamada extra
+
+        utils.mark_refresh_history_stale("g", "d")
+        with patch("bi.utils._fetch_refresh_page", return_value=[novo, antigos[0]]) as fetch:
+            rows = utils.get_dataset_refresh_history("g", "d", {}, need_completed=True)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual([r["requestId"] for r in rows], ["c", "b", "a"])
+
+
+class DataflowWaitTestCase(TestCase):
+    def test_polling_adaptativo_usa_duracao_tipica_e_retry_after(self):
+        import datetime as dt
+        from . import utils
+
+        class Relogio:
+            agora = 1_700_000_000.0
+
+            def time(self):
+                return self.agora
+
+            def sleep(self, s):
+                self.agora += s
+
+        relogio = Relogio()
+        inicio = relogio.agora
+        iso = dt.datetime.fromtimestamp(inicio, tz=dt.timezone.utc).isoformat()
+        consultas = []
+
+        def historico(group_id, dataflow_id, headers, top=1):
+            consultas.append(relogio.agora)
+            if len(consultas) == 2:
+                return [], 30  # 429 com Retry-After
+            if relogio.agora - inicio >= 620:
+                return [{"status": "Success", "startTime": iso, "endTime": iso}], None
+            return [{"status": "InProgress", "startTime": iso, "endTime": ""}], None
+
+        with patch.object(utils, "time", relogio), patch("bi.utils._get_dataflow_tx_history", side_effect=historico):
+            out = utils._wait_for_dataflows(
+                [{"group_id": "g", "dataflow_id": "d"}], {},
+                timeout_s=1800, expected_duration_s={("g", "d"): 600.0},
+            )
+
+        self.assertEqual(out[0]["status"], "Success")
+        self.assertGreaterEqual(consultas[2] - consultas[1], 30)
+        self.assertLess(len(consultas), 12)  # intervalo fixo de 15s faria ~40 consultas
+        self.assertLess(relogio.agora - inicio, 700)
+
+
+class FakePowerBITestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_sincronia_e_cascade_contra_power_bi_simulado(self):
+        from .fake_powerbi import FakePowerBI
+        from .utils import cascade_refresh
+
+        with FakePowerBI() as fake, fake.activate(POWERBI_GROUP_ID_DEFAULT="g1"):
+            fake.add_report("g1", "r1", dataset_id="d1", dataflows=["df1"])
+            sincronizar_bi_reports()
+
+            bi = BIReport.objects.get(report_id="r1")
+            self.assertEqual(bi.dataset_id, "d1")
+            self.assertIsNotNone(bi.last_updated)
+
+            bi.upstream_dataflows = [{"group_id": "g1", "dataflow_id": "df1"}]
+            bi.save()
+            result = cascade_refresh("r1", "g1")
+
+        self.assertTrue(result["ok"])
+        self.assertEqual([d["ok"] for d in result["dataflows"]], [True])
+        self.assertEqual(fake.stats["POST /groups/{id}/dataflows/{id}/refreshes"], 1)
+        self.assertEqual(fake.stats["POST /groups/{id}/datasets/{id}/refreshes"], 1)
+
+
+class PermissionReportTestCase(TestCase):
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.models import Group, Permission
+
+        User = get_user_model()
+        self.admin = User.objects.create(username="auditor")
+        self.admin.user_permissions.add(Permission.objects.get(codename="permission_report", content_type__app_label="bi"))
+        alice = User.objects.create(username="alice")
+        bob = User.objects.create(username="bob")
+        carol = User.objects.create(username="carol")
+        vendas, compras = Group.objects.create(name="Vendas"), Group.objects.create(name="Compras")
+        bob.groups.add(vendas)
+        carol.groups.add(compras)
+
+        report = BIReport.objects.create(title="Faturamento", report_id="fat")
+        report.allowed_users.add(alice, bob)
+        report.allowed_groups.add(vendas, compras)
+
+    def _rows(self, **filters):
+        from .views import _permissoes_union_qs
+
+        return sorted((p["username"], p["via"]) for p in _permissoes_union_qs(**filters))
+
+    def test_filtros_restringem_a_linha_do_join(self):
+        self.assertEqual(self._rows(user_text="alice"), [("alice", "Acesso individual")])
+        self.assertEqual(self._rows(user_text="carol"), [("carol", "Compras")])
+        self.assertEqual(self._rows(group_text="vendas"), [("bob", "Vendas")])
+        self.assertEqual(self._rows(user_text="bob", group_text="compras"), [])
+        self.assertEqual(len(self._rows()), 4)
+
+    def test_view_pagina_e_exporta_em_streaming(self):
+        import json
+        from django.urls import reverse
+
+        self.client.force_login(self.admin)
+        url = reverse("bi:relatorio_permissoes")
+
+        resp = self.client.get(url, {"pp": "abc"})  # pp inválido cai no padrão
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context["page_obj"].paginator.per_page, 100)
+        resp = self.client.get(url, {"pp": "3", "page": "2"})
+        self.assertEqual([p["username"] for p in resp.context["permissoes"]], ["carol"])
+
+        resp = self.client.get(url, {"formato": "csv", "user": "bob"})
+        linhas = b"".join(resp.streaming_content).decode().splitlines()
+        self.assertEqual(linhas, ["bi,usuario,via", "Faturamento,bob,Acesso individual", "Faturamento,bob,Vendas"])
+
+        resp = self.client.get(url, {"formato": "json", "group": "compras"})
+        dados = json.loads(b"".join(resp.streaming_content))
+        self.assertEqual([(d["username"], d["via"]) for d in dados], [("carol", "Compras")])
+
+
+class SavedViewsListTestCase(TestCase):
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.models import Group
+        from django.core.cache import cache
+
+        cache.clear()
+        User = get_user_model()
+        self.dono = User.objects.create(username="dono")
+        self.leitor = User.objects.create(username="leitor")
+        self.grupo = Group.objects.create(name="Vendas")
+        self.bi = BIReport.objects.create(title="R", report_id="rep-1", group_id="grp-1", all_users=True)
+
+    def _criar(self, nome, **extra):
+        from .models import BISavedView
+
+        grupos = extra.pop("grupos", [])
+        sv = BISavedView.objects.create(bi_report=self.bi, owner=self.dono, name=nome, **extra)
+        sv.shared_groups.set(grupos)
+        sv.shared_users.set([self.leitor])
+        return sv
+
+    def _listar_payload(self, user):
+        from django.urls import reverse
+
+        self.client.force_login(user)
+        resp = self.client.get(reverse("bi:saved_views_list"), {"report_id": "rep-1", "group_id": "grp-1"})
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()["views"]
+
+    def _listar(self, user):
+        return [v["name"] for v in self._listar_payload(user)]
+
+    def _post(self, nome_url, body):
+        import json
+        from django.urls import reverse
+
+        self.client.force_login(self.dono)
+        resp = self.client.post(reverse(f"bi:{nome_url}"), json.dumps(body), content_type="application/json")
+        self.assertEqual(resp.status_code, 200, resp.content)
+        return resp.json()
+
+    def test_queries_constantes_com_mais_visoes(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .views import _saved_views_bump
+
+        self._criar("v1", grupos=[self.grupo])
+        self._listar(self.dono)  # aquece sessão/ACL
+        _saved_views_bump(self.bi.pk)
+        with CaptureQueriesContext(connection) as poucas:
+            self._listar(self.dono)
+
+        for i in range(2, 7):
+            self._criar(f"v{i}", grupos=[self.grupo], is_public=bool(i % 2))
+        _saved_views_bump(self.bi.pk)
+        with CaptureQueriesContext(connection) as muitas:
+            self.assertEqual(len(self._listar(self.dono)), 6)
+        self.assertEqual(len(muitas), len(poucas))
+
+        with self.assertNumQueries(len(poucas) - 3):  # cache: sem a listagem + 2 prefetches
+            self._listar(self.dono)
+
+    def test_cache_invalidado_por_escrita_e_grupo(self):
+        import json
+        from django.test import RequestFactory
+        from .views import saved_views_set_default
+
+        self.assertEqual(self._listar(self.leitor), [])
+
+        # save
+        criado = self._post("saved_views_save", {
+            "report_id": "rep-1", "group_id": "grp-1", "name": "Mensal", "state": {},
+            "visibility": "groups", "shared_group_ids": [self.grupo.pk],
+        })["view"]
+        self.assertEqual(self._listar(self.dono), ["Mensal"])
+        self.assertEqual(self._listar(self.leitor), [])
+
+        # entrar no grupo: a lista cacheada do leitor não pode sobreviver
+        self.leitor.groups.add(self.grupo)
+        self.assertEqual(self._listar(self.leitor), ["Mensal"])
+        # sair do grupo: some na hora (a lista traz o share token)
+        self.grupo.user_set.remove(self.leitor)
+        self.assertEqual(self._listar(self.leitor), [])
+        self.leitor.groups.add(self.grupo)
+
+        # update
+        self._post("saved_views_update", {"id": criado["id"], "name": "Anual", "visibility": "groups",
+                                          "shared_group_ids": [self.grupo.pk]})
+        self.assertEqual(self._listar(self.leitor), ["Anual"])
+
+        # set_default (sem rota própria): updated_at da visão muda na listagem
+        antes = self._listar_payload(self.leitor)[0]["updated_at"]
+        req = RequestFactory().post("/", data=json.dumps({"id": criado["id"]}), content_type="application/json")
+        req.user = self.dono
+        self.assertEqual(saved_views_set_default(req).status_code, 200)
+        self.assertNotEqual(self._listar_payload(self.leitor)[0]["updated_at"], antes)
+
+        # delete
+        self._post("saved_views_delete", {"id": criado["id"]})
+        self.assertEqual(self._listar(self.leitor), [])
+
+
+class RefreshEventsTestCase(TestCase):
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from django.core.cache import cache
+
+        cache.clear()
+        self.client.force_login(get_user_model().objects.create(username="leitor"))
+        BIReport.objects.create(title="R", report_id="rep-1", group_id="grp-1", all_users=True)
+        self.snap = {"ok": True, "running": True, "items": [{"status": "Unknown"}], "polled_at": 1}
+        patch("bi.views.get_refresh_status_snapshot", side_effect=lambda *a: self.snap).start()
+        patch("bi.views.ensure_refresh_status_poller").start()
+        self.lastupd = patch("bi.views._last_update_payload",
+                             return_value={"ok": True, "last_updated_epoch": 10}).start()
+        self.addCleanup(patch.stopall)
+
+    def _events(self, last_event_id=None):
+        from django.urls import reverse
+
+        extra = {"HTTP_LAST_EVENT_ID": last_event_id} if last_event_id else {}
+        resp = self.client.get(reverse("bi:refresh_events"), {"report_id": "rep-1", "group_id": "grp-1"}, **extra)
+        self.assertEqual(resp["Content-Type"], "text/event-stream")
+        return b"".join(resp.streaming_content).decode()
+
+    @staticmethod
+    def _field(body, name):
+        vals = [ln.split(": ", 1)[1] for ln in body.splitlines() if ln.startswith(name + ": ")]
+        return vals[-1] if vals else None
+
+    def test_padrao_responde_uma_leitura_e_fecha(self):
+        with patch("bi.views.time.sleep", side_effect=AssertionError("não deveria esperar")):
+            body = self._events()
+        self.assertEqual((body.count("event: status"), body.count("event: last_update")), (1, 1))
+        self.assertEqual(self._field(body, "retry"), "3000")  # refresh rodando: reconecta rápido
+
+    def test_ocioso_reconecta_devagar(self):
+        self.snap = {"ok": True, "running": False, "items": [{"status": "Completed"}], "polled_at": 1}
+        self.assertEqual(self._field(self._events(), "retry"), "30000")
+
+    def test_reconexao_so_reenvia_o_que_mudou(self):
+        body = self._events()
+        last_id = self._field(body, "id")
+        self.assertTrue(last_id)
+
+        # nada mudou: a reconexão não repete eventos nem consulta a última atualização
+        body = self._events(last_id)
+        self.assertEqual((body.count("event: status"), body.count("event: last_update")), (0, 0))
+        self.assertEqual(self.lastupd.call_count, 1)
+
+        # refresh concluiu: status novo + última atualização reconsultada
+        self.snap = {"ok": True, "running": False, "items": [{"status": "Completed"}], "polled_at": 2}
+        self.lastupd.return_value = {"ok": True, "last_updated_epoch": 20}
+        body = self._events(last_id)
+        self.assertEqual((body.count("event: status"), body.count("event: last_update")), (1, 1))
+        self.assertEqual(self._field(body, "retry"), "30000")
+
+    def test_stream_longo_so_com_worker_assincrono(self):
+        import time
+
+        with patch("bi.views._SSE_LONG_LIVED", True), patch("bi.views._SSE_STREAM_SECONDS", 0.05), \
+                patch("bi.views._SSE_TICK_SECONDS", 0.01), patch("bi.views.time.sleep", wraps=time.sleep) as sleep:
+            body = self._events()
+        self.assertTrue(body.startswith("retry: 3000\n\n"))
+        self.assertGreater(sleep.call_count, 1)
+        self.assertEqual(body.count("event: status"), 1)  # sem mudança, não repete
+
+
+class RefreshStatusPollerTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.delay = patch("bi.tasks.poll_refresh_status.delay").start()
+        self.reagenda = patch("bi.tasks.poll_refresh_status.apply_async").start()
+        self.addCleanup(patch.stopall)
+
+    def _poll(self, snap, started_at=None):
+        from bi.tasks import poll_refresh_status
+
+        with patch("bi.utils.build_refresh_status_snapshot", return_value=snap):
+            poll_refresh_status.run("rep-1", "grp-1", started_at)
+
+    def test_um_unico_poller_por_report(self):
+        from bi.utils import ensure_refresh_status_poller
+
+        self.assertTrue(ensure_refresh_status_poller("rep-1", "grp-1"))
+        self.assertFalse(ensure_refresh_status_poller("rep-1", "grp-1"))
+        self.assertEqual(self.delay.call_count, 1)
+
+    def test_para_quando_o_status_fica_terminal(self):
+        from bi.utils import ensure_refresh_status_poller, get_refresh_status_snapshot
+
+        ensure_refresh_status_poller("rep-1", "grp-1")
+        self._poll({"ok": True, "running": True, "items": [{"status": "InProgress"}], "polled_at": 1})
+        self.assertEqual(self.reagenda.call_count, 1)
+
+        self._poll({"ok": True, "running": False, "items": [{"status": "Completed"}], "polled_at": 2})
+        self.assertEqual(self.reagenda.call_count, 1)
+        self.assertFalse(get_refresh_status_snapshot("rep-1", "grp-1")["running"])
+        self.assertTrue(ensure_refresh_status_poller("rep-1", "grp-1"))  # lock liberado
+
+    def test_tempo_maximo_nao_reabre_o_poller(self):
+        import time
+        from bi.utils import (
+            STATUS_POLL_MAX_S, ensure_refresh_status_poller, get_refresh_status_snapshot,
+            mark_refresh_status_started,
+        )
+
+        ensure_refresh_status_poller("rep-1", "grp-1")
+        snap = {"ok": True, "running": True, "items": [{"status": "InProgress"}], "polled_at": 1}
+        self._poll(snap, started_at=int(time.time()) - STATUS_POLL_MAX_S - 1)
+        self.reagenda.assert_not_called()
+
+        atual = get_refresh_status_snapshot("rep-1", "grp-1")
+        self.assertEqual((atual["running"], atual["stale"]), (False, True))
+        self.assertFalse(ensure_refresh_status_poller("rep-1", "grp-1"))
+        self.assertEqual(self.delay.call_count, 1)
+
+        # um refresh novo libera o poller
+        mark_refresh_status_started("rep-1", "grp-1", int(time.time()))
+        self.assertTrue(ensure_refresh_status_poller("rep-1", "grp-1"))
@@ -18,6 +18,7 @@ urlpatterns = [
     path('get_last_update_rt/', views.get_last_update_rt, name='get_last_update_rt'),
     path('refresh_now/', views.refresh_now, name='refresh_now'),
     path('get_refresh_status/', views.get_refresh_status, name='get_refresh_status'),
+    path('refresh_events/', views.refresh_events, name='refresh_events'),                    # SSE
     path('saved_views/list/', views.saved_views_list, name='saved_views_list'),
     path('saved_views/save/', views.saved_views_save, name='saved_views_save'),
     path('saved_views/get/', views.saved_views_get, name='saved_views_get'),                 # by id ou token
@@ -4,11 +4,14 @@ from __future__ import annotations
 import base64
 import json
 import logging
+import random
+import statistics
 import time
 import re
 from typing import Any, Dict, Optional, Iterable, Tuple, List
 
 import datetime as dt
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
 
 import msal
 import requests
@@ -42,6 +45,10 @@ def _short(s: str | bytes | None, n: int = 500) -> str:
     s = str(s)
     return s if len(s) <= n else s[:n] + "…"
 
+def _api_base() -> str:
+    """Raiz da REST API do Power BI (POWERBI_API_BASE permite apontar para um stand-in local)."""
+    return str(getattr(settings, "POWERBI_API_BASE", "https://api.powerbi.com/v1.0/myorg")).rstrip("/")
+
 
 # ════════════════════════════════════════
 # Sticky “hint” compartilhado de refresh (para pílula “via api”)
@@ -204,7 +211,7 @@ def _generate_embed_token(report_id: str, group_id: str, access_token: str) -> O
     headers = _auth_headers(access_token)
 
     # 1) info do relatório
-    info_url = f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/reports/{report_id}"
+    info_url = f"{_api_base()}/groups/{group_id}/reports/{report_id}"
     try:
         info = _request("GET", info_url, headers=headers)
         if info.status_code == 401:
@@ -226,7 +233,7 @@ def _generate_embed_token(report_id: str, group_id: str, access_token: str) -> O
 
     # Opcional: ler dataset para log de flags
     if dataset_id:
-        ds_url = f"https://api.powerbi.com/v1.0/myorg/datasets/{dataset_id}"
+        ds_url = f"{_api_base()}/datasets/{dataset_id}"
         try:
             ds = _request("GET", ds_url, headers=headers)
             logger.log(_api_level(), "PBI-DBG: GET dataset (myorg) HTTP %s", ds.status_code)
@@ -271,30 +278,105 @@ def _generate_embed_token(report_id: str, group_id: str, access_token: str) -> O
         "report_name": report_name,
     }
 
-def get_embed_params_user_owns_data(report_id: str, group_id: str) -> Optional[dict]:
+_EMBED_LOCK_TTL = 30          # s — teto para uma geração de token
+_EMBED_WAIT_S = 10            # s — quanto um request espera o token gerado por outro
+EMBED_PREWARM_AHEAD_S = int(getattr(settings, "POWERBI_EMBED_PREWARM_AHEAD_S", 20 * 60))
+
+def _embed_cache_key(report_id: str, group_id: str) -> str:
+    return f"{_CACHE_PREFIX}{group_id}:{report_id}"
+
+def _embed_lock_key(report_id: str, group_id: str) -> str:
+    return f"{_CACHE_PREFIX}lock:{group_id}:{report_id}"
+
+def _embed_remaining_s(embed: Optional[dict]) -> float:
+    """Segundos de vida restantes do embed_token (0 se desconhecido)."""
+    exp = _get_pbi_token_exp((embed or {}).get("embed_token") or "")
+    return max(0.0, exp - time.time()) if exp else 0.0
+
+def _store_embed(cache_key: str, embed: dict) -> None:
+    # cache vive até o token entrar na margem de segurança (_MIN_LIFETIME)
+    remaining = _embed_remaining_s(embed)
+    ttl = int(remaining - _MIN_LIFETIME) if remaining else _EMBED_TTL
+    cache.set(cache_key, embed, timeout=max(60, ttl))
+    logger.info("PBI: [%s] embed_token gerado e cacheado (%ss).", embed["report_name"], max(60, ttl))
+
+def _generate_and_store_embed(report_id: str, group_id: str, cache_key: str) -> Optional[dict]:
+    access_token = get_powerbi_access_token()
+    if not access_token:
+        logger.error("PBI: falha ao obter access_token – não foi possível gerar embed_token.")
+        return None
+    embed = _generate_embed_token(report_id, group_id, access_token)
+    if embed:
+        _store_embed(cache_key, embed)
+    return embed
+
+def _generate_embed_locked(report_id: str, group_id: str, cache_key: str, lock_key: str, *, force: bool = False) -> Optional[dict]:
+    """Gera o token com o lock já adquirido (e o libera ao final)."""
+    try:
+        # outro processo pode ter acabado de gerar entre o get e o lock
+        fresh = None if force else cache.get(cache_key)
+        if fresh and _is_token_still_safe(fresh["embed_token"]):
+            return fresh
+        return _generate_and_store_embed(report_id, group_id, cache_key)
+    finally:
+        cache.delete(lock_key)
+
+def get_embed_params_user_owns_data(report_id: str, group_id: str, *, force: bool = False) -> Optional[dict]:
     """
     Retorna {embed_url, embed_token, report_name} para um report.
     Usa cache (Django cache) e renova o token se ele estiver a <5 min de expirar.
+    Single-flight: só um processo gera o token por vez; os demais aguardam o cache.
     """
-    cache_key = f"{_CACHE_PREFIX}{group_id}:{report_id}"
+    cache_key = _embed_cache_key(report_id, group_id)
     cached: Optional[dict] = cache.get(cache_key)  # type: ignore[assignment]
 
-    if cached and _is_token_still_safe(cached["embed_token"]):
+    if not force and cached and _is_token_still_safe(cached["embed_token"]):
         logger.debug("PBI: [%s] embed_token (cache) → %s", cached.get("report_name", report_id), cache_key)
         return cached
-    elif cached:
+    elif cached and not force:
         logger.log(_api_level(), "PBI: [%s] token a <5min de expirar – descartando cache.", cached.get("report_name", report_id))
 
-    access_token = get_powerbi_access_token()
-    if not access_token:
-        logger.error("PBI: falha ao obter access_token – não foi possível gerar embed_token.")
-        return None
+    lock_key = _embed_lock_key(report_id, group_id)
+    if cache.add(lock_key, 1, timeout=_EMBED_LOCK_TTL):
+        return _generate_embed_locked(report_id, group_id, cache_key, lock_key, force=force)
 
-    embed = _generate_embed_token(report_id, group_id, access_token)
-    if embed:
-        cache.set(cache_key, embed, timeout=_EMBED_TTL)
-        logger.info("PBI: [%s] embed_token gerado e cacheado (%ss).", embed["report_name"], _EMBED_TTL)
-    return embed
+    # Outro request/worker já está gerando — o token antigo ainda serve se não expirou
+    if cached and _embed_remaining_s(cached) > 60:
+        return cached
+    deadline = time.time() + _EMBED_WAIT_S
+    while time.time() < deadline:
+        time.sleep(0.2)
+        fresh = cache.get(cache_key)
+        if fresh and _is_token_still_safe(fresh["embed_token"]):
+            return fresh
+        # dono do lock terminou (ou falhou) sem deixar token válido: tentamos assumir o lock
+        if cache.add(lock_key, 1, timeout=_EMBED_LOCK_TTL):
+            return _generate_embed_locked(report_id, group_id, cache_key, lock_key)
+
+    # Geração concorrente ainda em curso: nunca gerar fora do lock — serve o token antigo se ainda vale
+    stale = cache.get(cache_key) or cached
+    if stale and _embed_remaining_s(stale) > 0:
+        logger.warning("PBI: [%s] espera pelo embed_token concorrente expirou — usando token antigo.", report_id)
+        return stale
+    logger.warning("PBI: [%s] espera pelo embed_token concorrente expirou — sem token válido.", report_id)
+    return None
+
+def prewarm_embed_token(report_id: str, group_id: str, *, ahead_s: Optional[int] = None) -> str:
+    """
+    Renova o embed_token em background quando faltar menos de `ahead_s` para expirar.
+    Retorna "fresh" (nada a fazer), "renewed", "busy" (outro gerando) ou "failed".
+    """
+    ahead = int(ahead_s if ahead_s is not None else EMBED_PREWARM_AHEAD_S)
+    cache_key = _embed_cache_key(report_id, group_id)
+    if _embed_remaining_s(cache.get(cache_key)) > ahead:
+        return "fresh"
+    lock_key = _embed_lock_key(report_id, group_id)
+    if not cache.add(lock_key, 1, timeout=_EMBED_LOCK_TTL):
+        return "busy"
+    try:
+        return "renewed" if _generate_and_store_embed(report_id, group_id, cache_key) else "failed"
+    finally:
+        cache.delete(lock_key)
 
 
 # ════════════════════════════════════════
@@ -341,7 +423,7 @@ _RESOLVE_CACHE_PREFIX = "pbi:resolve:"
 def _probe_dataset_workspace(dataset_id: str, candidates: list[str], headers: dict) -> Optional[str]:
     """Descobre em qual workspace o dataset existe (primeiro 200)."""
     for gid in candidates:
-        url = f"https://api.powerbi.com/v1.0/myorg/groups/{gid}/datasets/{dataset_id}"
+        url = f"{_api_base()}/groups/{gid}/datasets/{dataset_id}"
         try:
             r = _request("GET", url, headers=headers)
             logger.log(_api_level(), "PBI: probe dataset %s → HTTP %s (group %s)", dataset_id, r.status_code, gid)
@@ -361,7 +443,7 @@ def _resolve_dataset_ids(report_id: str, report_group_id: str, headers: dict) ->
         logger.debug("PBI: resolve cache HIT → %s", ckey)
         return cached
 
-    info_url = f"https://api.powerbi.com/v1.0/myorg/groups/{report_group_id}/reports/{report_id}"
+    info_url = f"{_api_base()}/groups/{report_group_id}/reports/{report_id}"
     try:
         ir = _request("GET", info_url, headers=headers)
         logger.log(_api_level(), "PBI: reports/{id} HTTP %s", ir.status_code)
@@ -396,6 +478,120 @@ def _resolve_dataset_ids(report_id: str, report_group_id: str, headers: dict) ->
     return dataset_id, real_gid
 
 
+# ════════════════════════════════════════
+# 4.1) HISTÓRICO DE REFRESH – cache incremental por dataset
+# ════════════════════════════════════════
+#  Um único histórico por dataset atende “último concluído”, “em andamento” e
+#  “últimos N”. Cada atualização pede só uma página pequena ($top) e funde com o
+#  que já está em cache (por requestId); a página só cresce se houver lacuna.
+
+_HISTORY_PAGE = int(getattr(settings, "POWERBI_REFRESH_HISTORY_PAGE", 3))
+_HISTORY_MAX_TOP = 50
+_HISTORY_KEEP = 20
+_HISTORY_TTL_ACTIVE = int(getattr(settings, "POWERBI_REFRESH_HISTORY_TTL_ACTIVE_S", 5))
+_HISTORY_TTL_IDLE = int(getattr(settings, "POWERBI_REFRESH_HISTORY_TTL_IDLE_S", 60))
+_HISTORY_CACHE_TTL = 24 * 60 * 60  # o histórico em si vive mais; “fresh_until” decide a revalidação
+
+def _refresh_history_key(ds_group_id: str, dataset_id: str) -> str:
+    return f"pbi:refhist:{str(ds_group_id).lower()}:{str(dataset_id).lower()}"
+
+def _refresh_row_id(row: dict):
+    return row.get("requestId") or row.get("id") or (row.get("startTime"), row.get("refreshType"))
+
+def _refresh_row_running(row: dict) -> bool:
+    st = (row.get("status") or "").strip().lower()
+    if st in _RUNNING_STATES:
+        return True
+    # o serviço reporta “Unknown” sem endTime enquanto o refresh roda
+    return bool(row.get("startTime")) and not row.get("endTime") and st in {"", "unknown"}
+
+def _fetch_refresh_page(ds_group_id: str, dataset_id: str, headers: dict, top: int) -> Optional[list[dict]]:
+    """GET /refreshes?$top=N (1 retry em ReadTimeout). None em erro."""
+    url = f"{_api_base()}/groups/{ds_group_id}/datasets/{dataset_id}/refreshes?$top={int(top)}"
+    try:
+        try:
+            r = _request("GET", url, headers=headers)
+        except requests.ReadTimeout:
+            logger.warning("PBI: timeout lendo refreshes — tentando novamente com timeout maior.")
+            r = _request("GET", url, headers=headers, timeout=DEFAULT_TIMEOUT * 2)
+    except requests.RequestException as exc:
+        logger.error("PBI: erro lendo refreshes — %s", exc)
+        return None
+    logger.log(_api_level(), "PBI: refreshes($top=%s) HTTP %s", top, r.status_code)
+    if not r.ok:
+        return None
+    try:
+        return list((r.json() or {}).get("value") or [])
+    except Exception:
+        logger.debug("PBI: payload inválido ao ler refreshes.")
+        return None
+
+def _merge_refresh_history(old: list[dict], page: list[dict]) -> tuple[list[dict], bool]:
+    """Página nova (mais recentes primeiro) + histórico antigo; retorna (fundido, houve_sobreposição)."""
+    page_ids = {_refresh_row_id(r) for r in page}
+    old_ids = {_refresh_row_id(r) for r in old}
+    overlapped = bool(page_ids & old_ids)
+    merged = list(page) + [r for r in old if _refresh_row_id(r) not in page_ids]
+    return merged, overlapped
+
+def get_dataset_refresh_history(ds_group_id: str, dataset_id: str, headers: dict, *,
+                                min_items: int = 1, need_completed: bool = False) -> Optional[list[dict]]:
+    """
+    Histórico de refreshes do dataset (mais recentes primeiro), servido do cache enquanto
+    “fresco” (TTL curto com refresh ativo, longo quando ocioso). None se a API falhar sem cache.
+    """
+    key = _refresh_history_key(ds_group_id, dataset_id)
+    snap = cache.get(key)
+    now = time.time()
+    items: list[dict] = list(snap["items"]) if snap else []
+    exhausted = bool(snap and snap.get("exhausted"))
+
+    def _satisfied(its: list[dict], exh: bool) -> bool:
+        if len(its) < min_items and not exh:
+            return False
+        if need_completed and not exh and not any((r.get("status") or "") == "Completed" for r in its):
+            return False
+        return True
+
+    if snap and snap.get("fresh_until", 0) > now and _satisfied(items, exhausted):
+        return items
+
+    top = _HISTORY_PAGE if items else max(_HISTORY_PAGE, int(min_items))
+    while True:
+        page = _fetch_refresh_page(ds_group_id, dataset_id, headers, top)
+        if page is None:
+            return items if snap else None  # API fora: serve o que houver
+        exhausted = len(page) < top
+        merged, overlapped = _merge_refresh_history(items, page)
+        if top >= _HISTORY_MAX_TOP and items and not overlapped and not exhausted:
+            merged = list(page)  # lacuna grande demais: recomeça do zero para não ter buracos
+        if ((not items or overlapped or exhausted) and _satisfied(merged, exhausted)) or top >= _HISTORY_MAX_TOP:
+            break
+        top = min(_HISTORY_MAX_TOP, top * 4)
+
+    merged = merged[:max(_HISTORY_KEEP, int(min_items))]
+    ttl = _HISTORY_TTL_ACTIVE if (merged and _refresh_row_running(merged[0])) else _HISTORY_TTL_IDLE
+    cache.set(key, {"items": merged, "fresh_until": now + ttl, "exhausted": exhausted}, _HISTORY_CACHE_TTL)
+    return merged
+
+def mark_refresh_history_stale(ds_group_id: str, dataset_id: str) -> None:
+    """Força revalidação na próxima leitura (ex.: logo após disparar um refresh)."""
+    key = _refresh_history_key(ds_group_id, dataset_id)
+    snap = cache.get(key)
+    if snap:
+        snap["fresh_until"] = 0
+        cache.set(key, snap, _HISTORY_CACHE_TTL)
+
+def _utc_to_setting_tz(value: Optional[timezone.datetime]) -> Optional[timezone.datetime]:
+    """UTC aware → aware (USE_TZ=True) ou naive local (USE_TZ=False)."""
+    if not value or settings.USE_TZ:
+        return value
+    try:
+        return timezone.localtime(value, timezone.get_current_timezone()).replace(tzinfo=None)
+    except Exception:
+        return None
+
+
 # ════════════════════════════════════════
 # 5) REAL-TIME – última atualização (usando resolução cacheada)
 # ════════════════════════════════════════
@@ -418,41 +614,11 @@ def get_report_last_refresh_time_rt(report_id: str, report_group_id: str) -> Opt
         return None
     dataset_id, ds_group_id = ids
 
-    # Buscar refreshes do dataset e pegar o mais recente (com 1 retry em ReadTimeout)
-    ref_url = f"https://api.powerbi.com/v1.0/myorg/groups/{ds_group_id}/datasets/{dataset_id}/refreshes?$top=50"
-    try:
-        rr = _request("GET", ref_url, headers=headers)
-    except requests.ReadTimeout:
-        logger.warning("RT: timeout lendo refreshes — tentando novamente com timeout maior.")
-        try:
-            rr = _request("GET", ref_url, headers=headers, timeout=DEFAULT_TIMEOUT * 2)
-        except Exception as e:
-            logger.error("RT: erro buscando refreshes (retry) – %s", e)
-            return None
-    except Exception as e:
-        logger.error("RT: erro buscando refreshes – %s", e, exc_info=True)
-        return None
-
-    logger.log(_api_level(), "RT: refreshes HTTP %s", rr.status_code)
-    if not rr.ok:
+    # Histórico incremental em cache (página mínima; só o último concluído interessa)
+    rows = get_dataset_refresh_history(ds_group_id, dataset_id, headers, need_completed=True)
+    if not rows:
         return None
-
-    try:
-        newest = _pick_newest_refresh_dt((rr.json() or {}).get("value", []))
-    except Exception:
-        logger.debug("RT: payload inválido ao ler refreshes.")
-        newest = None
-
-    if not newest:
-        return None
-
-    if not settings.USE_TZ:
-        try:
-            local_tz = timezone.get_current_timezone()
-            return timezone.localtime(newest, local_tz).replace(tzinfo=None)
-        except Exception:
-            return None
-    return newest
+    return _utc_to_setting_tz(_pick_newest_refresh_dt(rows))
 
 
 # ════════════════════════════════════════
@@ -536,7 +702,7 @@ def trigger_dataset_refresh(report_id: str, report_group_id: str, refresh_type:
         return False, "dataset_nao_encontrado"
     dataset_id, ds_group_id = ids
 
-    url = f"https://api.powerbi.com/v1.0/myorg/groups/{ds_group_id}/datasets/{dataset_id}/refreshes"
+    url = f"{_api_base()}/groups/{ds_group_id}/datasets/{dataset_id}/refreshes"
     payload = {"type": refresh_type, "notifyOption": "NoNotification"}
     logger.log(_api_level(), "PBI: POST refresh dataset url=%s payload=%s", url, payload)
 
@@ -552,6 +718,7 @@ def trigger_dataset_refresh(report_id: str, report_group_id: str, refresh_type:
                 "PBI: refresh acionado para dataset %s (group %s) [%s]",
                 dataset_id, ds_group_id, refresh_type
             )
+            mark_refresh_history_stale(ds_group_id, dataset_id)
             return True, "accepted"
         try:
             j = r.json()
@@ -611,15 +778,11 @@ def get_latest_refresh_status(report_id: str, report_group_id: str, *, after_epo
         return {"ok": False, "error": "dataset_nao_encontrado"}
 
     dataset_id, ds_group_id = ids
-    url = f"https://api.powerbi.com/v1.0/myorg/groups/{ds_group_id}/datasets/{dataset_id}/refreshes?$top=1"
 
     try:
-        r = _request("GET", url, headers=headers)
-        logger.log(_api_level(), "PBI: latest refresh HTTP %s", r.status_code)
-        if not r.ok:
-            return {"ok": False, "error": f"http_{r.status_code}"}
-        data = r.json() or {}
-        rows = data.get("value") or []
+        rows = get_dataset_refresh_history(ds_group_id, dataset_id, headers)
+        if rows is None:
+            return {"ok": False, "error": "history_unavailable"}
         last = rows[0] if rows else {}
 
         status = (last.get("status") or "Unknown").strip()
@@ -798,7 +961,7 @@ def _extract_dataflows_from_upstream(js: dict, default_group_id: str) -> list[di
 
 def _list_upstream_datasets(dataset_id: str, ds_group_id: str, headers: dict) -> list[str]:
     """Lista datasets “pais” (upstream) de um dataset (nem todo tenant suporta)."""
-    url = f"https://api.powerbi.com/v1.0/myorg/groups/{ds_group_id}/datasets/{dataset_id}/upstreamDatasets"
+    url = f"{_api_base()}/groups/{ds_group_id}/datasets/{dataset_id}/upstreamDatasets"
     try:
         r = _request("GET", url, headers=headers)
         logger.log(_api_level(), "PBI: upstreamDatasets HTTP %s (group %s/dataset %s)", r.status_code, ds_group_id, dataset_id)
@@ -814,7 +977,7 @@ def _list_upstream_datasets(dataset_id: str, ds_group_id: str, headers: dict) ->
 
 # --------- Dataflows do workspace (Gen1) -------------
 def _list_workspace_dataflows(group_id: str, headers: dict):
-    url = f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/dataflows"
+    url = f"{_api_base()}/groups/{group_id}/dataflows"
     try:
         r = _request("GET", url, headers=headers)
         logger.log(_api_level(), "PBI: list dataflows HTTP %s (group %s)", r.status_code, group_id)
@@ -900,84 +1063,198 @@ def _load_upstream_override_db(report_id: str, dataset_id: str, default_group_id
         return []
 
 # --------- Descoberta (com fallbacks Gen1) -------------
-def _discover_upstream_dataflows(dataset_id: str, ds_group_id: str, headers: dict, *, report_id: str = "") -> list[dict]:
-    """
-    Descoberta automática (apenas quando habilitada explicitamente).
-    """
-    # 1) upstreamDataflows
-    url_up = f"https://api.powerbi.com/v1.0/myorg/groups/{ds_group_id}/datasets/{dataset_id}/upstreamDataflows"
+# --------- Probes de descoberta (independentes entre si) -------------
+def _probe_upstream_dataflows(dataset_id: str, ds_group_id: str, headers: dict) -> list[dict]:
+    url_up = f"{_api_base()}/groups/{ds_group_id}/datasets/{dataset_id}/upstreamDataflows"
     try:
         ru = _request("GET", url_up, headers=headers)
         logger.log(_api_level(), "PBI: upstreamDataflows HTTP %s (group %s/dataset %s)", ru.status_code, ds_group_id, dataset_id)
         if ru.ok:
-            out = _extract_dataflows_from_upstream(ru.json() or {}, ds_group_id)
-            if out:
-                return out
+            return _extract_dataflows_from_upstream(ru.json() or {}, ds_group_id)
     except requests.RequestException as exc:
         logger.debug("PBI: upstreamDataflows erro — %s", exc)
+    return []
 
-    # 2) lineage
-    url_lineage = f"https://api.powerbi.com/v1.0/myorg/groups/{ds_group_id}/lineage"
+def _probe_lineage(dataset_id: str, ds_group_id: str, headers: dict) -> list[dict]:
+    url_lineage = f"{_api_base()}/groups/{ds_group_id}/lineage"
     try:
         rl = _request("GET", url_lineage, headers=headers)
         logger.log(_api_level(), "PBI: lineage HTTP %s (workspace %s)", rl.status_code, ds_group_id)
         if rl.ok:
-            ups = _extract_dataflows_from_lineage(rl.json() or {}, dataset_id, ds_group_id)
-            if ups:
-                return ups
+            return _extract_dataflows_from_lineage(rl.json() or {}, dataset_id, ds_group_id)
     except requests.RequestException as exc:
         logger.debug("PBI: lineage erro — %s", exc)
+    return []
 
-    # 3) datasources
-    url_ds = f"https://api.powerbi.com/v1.0/myorg/groups/{ds_group_id}/datasets/{dataset_id}/datasources"
+def _probe_datasources(dataset_id: str, ds_group_id: str, headers: dict) -> list[dict]:
+    url_ds = f"{_api_base()}/groups/{ds_group_id}/datasets/{dataset_id}/datasources"
     try:
         rds = _request("GET", url_ds, headers=headers)
         logger.log(_api_level(), "PBI: datasources HTTP %s (group %s/dataset %s)", rds.status_code, ds_group_id, dataset_id)
         if rds.ok:
-            ups = _extract_dataflows_from_datasources(rds.json() or {}, ds_group_id)
-            if ups:
-                return ups
+            return _extract_dataflows_from_datasources(rds.json() or {}, ds_group_id)
     except requests.RequestException as exc:
         logger.debug("PBI: datasources erro — %s", exc)
+    return []
 
-    # 4) upstreamDatasets (pais) → datasources dos pais
+def _probe_parent_datasets(dataset_id: str, ds_group_id: str, headers: dict) -> list[dict]:
+    """upstreamDatasets (pais) → datasources dos pais."""
     parents = _list_upstream_datasets(dataset_id, ds_group_id, headers)
     agg: list[dict] = []
     for p in parents:
         try:
-            url_p = f"https://api.powerbi.com/v1.0/myorg/groups/{ds_group_id}/datasets/{p}/datasources"
+            url_p = f"{_api_base()}/groups/{ds_group_id}/datasets/{p}/datasources"
             rp = _request("GET", url_p, headers=headers)
             logger.log(_api_level(), "PBI: datasources(pai) HTTP %s (group %s/dataset %s)", rp.status_code, ds_group_id, p)
             if rp.ok:
                 agg.extend(_extract_dataflows_from_datasources(rp.json() or {}, ds_group_id))
         except requests.RequestException as exc:
             logger.debug("PBI: datasources(pai) erro — %s", exc)
-    agg = _dedup(agg)
-    if agg:
-        return agg
-
-    # 5) Hints por nome
+    return _dedup(agg)
+
+# Probes “autoritativas” (a API descreve a linhagem); a primeira resposta não vazia vence.
+_AUTHORITATIVE_PROBES = (
+    ("upstreamDataflows", _probe_upstream_dataflows),
+    ("lineage", _probe_lineage),
+    ("datasources", _probe_datasources),
+    ("parentDatasets", _probe_parent_datasets),
+)
+
+def _discover_upstream_dataflows_with_source(dataset_id: str, ds_group_id: str, headers: dict, *,
+                                             report_id: str = "") -> tuple[list[dict], str]:
+    """
+    Executa as probes autoritativas em paralelo (e a de hints por nome junto, como reserva).
+    Retorna (dataflows, estratégia). Sem resposta autoritativa, cai para hints e singleton/all.
+    """
     name_hints = _name_hints_for(report_id, dataset_id)
-    if name_hints:
-        matched = _match_dataflows_by_name(ds_group_id, headers, name_hints)
-        if matched:
-            logger.debug("PBI: fallback Gen1 por HINT de nome → %s", [f"{m['group_id']}/{m['dataflow_id']}" for m in matched])
-            return matched
+    workers = len(_AUTHORITATIVE_PROBES) + (1 if name_hints else 0)
+    timeout_s = int(getattr(settings, "POWERBI_LINEAGE_PROBE_TIMEOUT_S", DEFAULT_TIMEOUT * 2))
+
+    deadline = time.monotonic() + timeout_s
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pbi-lineage")
+    try:
+        futures = {
+            pool.submit(fn, dataset_id, ds_group_id, headers): name
+            for name, fn in _AUTHORITATIVE_PROBES
+        }
+        hint_future = pool.submit(_match_dataflows_by_name, ds_group_id, headers, name_hints) if name_hints else None
+
+        try:
+            for fut in as_completed(futures, timeout=timeout_s):
+                try:
+                    out = fut.result()
+                except Exception:
+                    logger.debug("PBI: probe %s falhou", futures[fut], exc_info=True)
+                    continue
+                if out:
+                    logger.debug("PBI: linhagem via %s → %s", futures[fut], [f"{o['group_id']}/{o['dataflow_id']}" for o in out])
+                    return out, futures[fut]
+        except FuturesTimeout:
+            logger.debug("PBI: probes de linhagem excederam %ss (dataset %s)", timeout_s, dataset_id)
+
+        # 5) Hints por nome — só o que sobra do mesmo orçamento (rodou em paralelo às probes)
+        if hint_future is not None:
+            try:
+                matched = hint_future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except Exception:
+                matched = []
+            if matched:
+                logger.debug("PBI: fallback Gen1 por HINT de nome → %s", [f"{m['group_id']}/{m['dataflow_id']}" for m in matched])
+                return matched, "name_hints"
+    finally:
+        # não espera as probes mais lentas depois que já temos resposta
+        pool.shutdown(wait=False, cancel_futures=True)
 
     # 6) Singleton/All fallbacks
     try_singleton = bool(getattr(settings, "POWERBI_FALLBACK_REFRESH_SINGLETON", False))
     try_refresh_all = bool(getattr(settings, "POWERBI_FALLBACK_REFRESH_ALL", False))
-    dflist = _list_workspace_dataflows(ds_group_id, headers)
+    if try_singleton or try_refresh_all:
+        dflist = _list_workspace_dataflows(ds_group_id, headers)
 
-    if try_singleton and isinstance(dflist, dict) and dflist.get("items") and len(dflist["items"]) == 1:
-        item = dflist["items"][0]
-        return [{"group_id": ds_group_id, "dataflow_id": item["dataflow_id"]}]
+        if try_singleton and isinstance(dflist, dict) and dflist.get("items") and len(dflist["items"]) == 1:
+            item = dflist["items"][0]
+            return [{"group_id": ds_group_id, "dataflow_id": item["dataflow_id"]}], "singleton"
 
-    if try_refresh_all and isinstance(dflist, dict) and dflist.get("items"):
-        return [{"group_id": ds_group_id, "dataflow_id": d["dataflow_id"]} for d in dflist["items"]]
+        if try_refresh_all and isinstance(dflist, dict) and dflist.get("items"):
+            return [{"group_id": ds_group_id, "dataflow_id": d["dataflow_id"]} for d in dflist["items"]], "workspace_all"
 
     logger.debug("PBI: nenhum dataflow upstream identificado (Gen1) após fallbacks.")
-    return []
+    return [], ""
+
+# --------- Linhagem persistida (BIDatasetLineage) + cache -------------
+LINEAGE_TTL_S = int(getattr(settings, "POWERBI_LINEAGE_TTL_S", 6 * 60 * 60))           # 6 h
+LINEAGE_EMPTY_TTL_S = int(getattr(settings, "POWERBI_LINEAGE_EMPTY_TTL_S", 30 * 60))    # 30 min (sem upstream)
+
+def _lineage_cache_key(ds_group_id: str, dataset_id: str) -> str:
+    return f"pbi:lineage:{str(ds_group_id).lower()}:{str(dataset_id).lower()}"
+
+def _lineage_lock_key(ds_group_id: str, dataset_id: str) -> str:
+    return f"pbi:lineage:lock:{str(ds_group_id).lower()}:{str(dataset_id).lower()}"
+
+def store_dataset_lineage(dataset_id: str, ds_group_id: str, dataflows: list[dict], source: str) -> dict:
+    """Persiste a linhagem descoberta (BD + cache) e devolve o snapshot gravado."""
+    from .models import BIDatasetLineage
+
+    now = timezone.now()
+    ttl = LINEAGE_TTL_S if dataflows else LINEAGE_EMPTY_TTL_S
+    expires_at = now + dt.timedelta(seconds=ttl)
+    gid, dsid = str(ds_group_id).lower(), str(dataset_id).lower()
+    try:
+        BIDatasetLineage.objects.update_or_create(
+            group_id=gid, dataset_id=dsid,
+            defaults={"dataflows": dataflows, "source": source, "discovered_at": now, "expires_at": expires_at},
+        )
+    except Exception:
+        logger.warning("PBI: falha ao persistir linhagem %s/%s", gid, dsid, exc_info=True)
+    snap = {"dataflows": dataflows, "source": source, "expires_epoch": int(expires_at.timestamp())}
+    cache.set(_lineage_cache_key(gid, dsid), snap, ttl)
+    return snap
+
+def _load_dataset_lineage(dataset_id: str, ds_group_id: str) -> Optional[dict]:
+    """Cache → BD. Retorna snapshot (possivelmente expirado) ou None."""
+    snap = cache.get(_lineage_cache_key(ds_group_id, dataset_id))
+    if snap is not None:
+        return snap
+    from .models import BIDatasetLineage
+    row = (BIDatasetLineage.objects
+           .filter(group_id=str(ds_group_id).lower(), dataset_id=str(dataset_id).lower())
+           .only("dataflows", "source", "expires_at")
+           .first())
+    if not row:
+        return None
+    snap = {"dataflows": row.dataflows or [], "source": row.source, "expires_epoch": int(row.expires_at.timestamp())}
+    remaining = snap["expires_epoch"] - int(timezone.now().timestamp())
+    if remaining > 0:
+        cache.set(_lineage_cache_key(ds_group_id, dataset_id), snap, remaining)
+    return snap
+
+def _schedule_lineage_refresh(dataset_id: str, ds_group_id: str, report_id: str = "") -> None:
+    lock_key = _lineage_lock_key(ds_group_id, dataset_id)
+    if not cache.add(lock_key, 1, timeout=5 * 60):
+        return
+    try:
+        from .tasks import refresh_dataset_lineage
+        refresh_dataset_lineage.delay(dataset_id, ds_group_id, report_id)
+    except Exception:
+        logger.warning("PBI: não foi possível agendar renovação de linhagem %s/%s", ds_group_id, dataset_id, exc_info=True)
+        cache.delete(lock_key)
+
+def get_upstream_lineage(dataset_id: str, ds_group_id: str, headers: dict, *, report_id: str = "") -> list[dict]:
+    """
+    Linhagem upstream com cache persistido:
+      - válida → devolve direto (sem chamadas HTTP);
+      - expirada → devolve a antiga e agenda renovação em background;
+      - inexistente → descobre agora (probes em paralelo) e persiste.
+    """
+    snap = _load_dataset_lineage(dataset_id, ds_group_id)
+    if snap is not None:
+        if snap.get("expires_epoch", 0) <= int(timezone.now().timestamp()):
+            _schedule_lineage_refresh(dataset_id, ds_group_id, report_id)
+        return list(snap.get("dataflows") or [])
+
+    ups, source = _discover_upstream_dataflows_with_source(dataset_id, ds_group_id, headers, report_id=report_id)
+    store_dataset_lineage(dataset_id, ds_group_id, ups, source)
+    return ups
 
 # --------- Override por settings -------------
 def _normalize_override_items(items, default_group_id: str) -> list[dict]:
@@ -1037,7 +1314,7 @@ def find_upstream_dataflows_for_report(report_id: str, report_group_id: str) ->
         logger.debug("PBI: UI-only ativo — upstream via BD → %s", [f"{o['group_id']}/{o['dataflow_id']}" for o in over_db] or "[]")
         return _dedup(over_db)
 
-    ups = _discover_upstream_dataflows(dataset_id, ds_group_id, headers, report_id=report_id)
+    ups = get_upstream_lineage(dataset_id, ds_group_id, headers, report_id=report_id)
     over_st = _load_upstream_override(report_id, dataset_id, ds_group_id)
     merged = _dedup([*ups, *over_db, *over_st])
     logger.debug("PBI: upstream (discovery+UI+settings) → %s", [f"{u['group_id']}/{u['dataflow_id']}" for u in merged])
@@ -1054,7 +1331,7 @@ def trigger_dataflow_refresh(group_id: str, dataflow_id: str) -> tuple[bool, str
     group_id = str(group_id).lower()
     dataflow_id = str(dataflow_id).lower()
 
-    url = f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/dataflows/{dataflow_id}/refreshes"
+    url = f"{_api_base()}/groups/{group_id}/dataflows/{dataflow_id}/refreshes"
     logger.log(_api_level(), "PBI: POST refresh dataflow url=%s", url)
     try:
         r = _request("POST", url, json_body={}, headers=headers)
@@ -1120,26 +1397,50 @@ def _canon_df_status(s: str) -> str:
     }
     return mapping.get(key, s or "")
 
-def _get_latest_dataflow_tx(group_id: str, dataflow_id: str, headers: dict) -> dict:
+def _retry_after_s(resp: requests.Response) -> Optional[int]:
+    """Segundos pedidos pelo serviço (Retry-After em segundos ou data HTTP); None se ausente."""
+    raw = (resp.headers.get("Retry-After") or "").strip()
+    if not raw:
+        return None
+    if raw.isdigit():
+        return int(raw)
+    try:
+        from email.utils import parsedate_to_datetime
+        when = parsedate_to_datetime(raw)
+        return max(0, int(when.timestamp() - time.time()))
+    except Exception:
+        return None
+
+def _get_dataflow_tx_history(group_id: str, dataflow_id: str, headers: dict, top: int = 1) -> tuple[list[dict], Optional[int]]:
     """
-    Lê o último transaction do dataflow e retorna {'status','startTime','endTime'} (strings).
+    Lê os últimos `top` transactions do dataflow (mais recentes primeiro).
+    Retorna (linhas, retry_after_s); retry_after_s vem preenchido em 429/Retry-After.
     """
-    url = f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/dataflows/{dataflow_id}/transactions?$top=1"
+    url = f"{_api_base()}/groups/{group_id}/dataflows/{dataflow_id}/transactions?$top={int(top)}"
     try:
         r = _request("GET", url, headers=headers)
         logger.log(_api_level(), "PBI: dataflow tx HTTP %s (%s/%s)", r.status_code, group_id, dataflow_id)
+        retry_after = _retry_after_s(r)
+        if r.status_code == 429 and retry_after is None:
+            retry_after = 0  # throttled sem cabeçalho: quem chama decide o recuo
         if not r.ok:
-            return {"status": "", "startTime": "", "endTime": ""}
+            return [], retry_after
         rows = (r.json() or {}).get("value") or []
-        last = rows[0] if rows else {}
-        return {
-            "status": (last.get("status") or "").strip(),
-            "startTime": (last.get("startTime") or "").strip(),
-            "endTime": (last.get("endTime") or "").strip(),
-        }
+        return [{
+            "status": (row.get("status") or "").strip(),
+            "startTime": (row.get("startTime") or "").strip(),
+            "endTime": (row.get("endTime") or "").strip(),
+        } for row in rows], retry_after
     except requests.RequestException as exc:
         logger.debug("PBI: dataflow tx request_exception — %s", exc)
-        return {"status": "", "startTime": "", "endTime": ""}
+        return [], None
+
+def _get_latest_dataflow_tx(group_id: str, dataflow_id: str, headers: dict) -> dict:
+    """
+    Lê o último transaction do dataflow e retorna {'status','startTime','endTime'} (strings).
+    """
+    rows, _ = _get_dataflow_tx_history(group_id, dataflow_id, headers, top=1)
+    return rows[0] if rows else {"status": "", "startTime": "", "endTime": ""}
 
 def _to_dt(s: str) -> Optional[timezone.datetime]:
     if not s:
@@ -1167,14 +1468,45 @@ def _to_utc_naive_any(d: Optional[timezone.datetime]) -> Optional[dt.datetime]:
             aware = d.replace(tzinfo=dt.timezone.utc)
     return aware.astimezone(dt.timezone.utc).replace(tzinfo=None)
 
+# Política adaptativa de polling (por dataflow)
+_DF_POLL_MIN_S = int(getattr(settings, "POWERBI_DF_POLL_MIN_S", 5))
+_DF_POLL_MAX_S = int(getattr(settings, "POWERBI_DF_POLL_MAX_S", 120))
+_DF_POLL_FACTOR = float(getattr(settings, "POWERBI_DF_POLL_FACTOR", 2.0))
+_DF_POLL_JITTER = float(getattr(settings, "POWERBI_DF_POLL_JITTER", 0.2))
+_DF_ETA_FRACTION = float(getattr(settings, "POWERBI_DF_ETA_FRACTION", 0.9))
+_DF_HISTORY_TOP = int(getattr(settings, "POWERBI_DF_HISTORY_TOP", 10))
+_DF_DURATION_TTL = 7 * 24 * 60 * 60
+
+def _df_duration_key(group_id: str, dataflow_id: str) -> str:
+    return f"pbi:dfdur:{str(group_id).lower()}:{str(dataflow_id).lower()}"
+
+def _median_dataflow_duration_s(rows: list[dict]) -> Optional[float]:
+    """Mediana (s) das execuções concluídas com sucesso; None sem histórico útil."""
+    durations = []
+    for row in rows:
+        if _canon_df_status(row.get("status") or "") != "Success":
+            continue
+        sdt, edt = _to_dt(row.get("startTime") or ""), _to_dt(row.get("endTime") or "")
+        if sdt and edt and edt > sdt:
+            durations.append((edt - sdt).total_seconds())
+    return statistics.median(durations) if durations else None
+
+def get_dataflow_expected_duration_s(group_id: str, dataflow_id: str) -> Optional[float]:
+    """Duração típica (mediana) conhecida do dataflow, se já medida."""
+    return cache.get(_df_duration_key(group_id, dataflow_id))
+
+def _jittered(seconds: float) -> float:
+    return max(1.0, seconds * random.uniform(1 - _DF_POLL_JITTER, 1 + _DF_POLL_JITTER))
+
 def _wait_for_dataflows(
     upstream: list[dict],
     headers: dict,
     *,
     timeout_s: int = 1800,
-    poll_s: int = 15,
+    poll_s: Optional[int] = None,
     started_after: Optional[timezone.datetime] = None,
     prev_tx_end: Optional[dict[tuple[str, str], timezone.datetime]] = None,
+    expected_duration_s: Optional[dict[tuple[str, str], float]] = None,
 ) -> list[dict]:
     """
     Espera todos os dataflows alcançarem estado terminal. Retorna lista com status final por DF:
@@ -1189,6 +1521,13 @@ def _wait_for_dataflows(
       - Pequeno atraso inicial para o serviço materializar o transaction:
           settings.POWERBI_DF_CREATE_TX_DELAY_S (default 2s).
 
+    Polling adaptativo (cada dataflow tem o seu relógio):
+      - começa em POWERBI_DF_POLL_MIN_S e recua exponencialmente (×POWERBI_DF_POLL_FACTOR,
+        com jitter) até o teto `poll_s` (default POWERBI_DF_POLL_MAX_S);
+      - com duração típica conhecida (`expected_duration_s`), a primeira checagem útil após
+        confirmar o início fica para ~90% dela, e daí volta ao intervalo mínimo;
+      - 429/Retry-After: respeita o tempo pedido e dobra o intervalo.
+
     Settings opcionais:
       POWERBI_DF_START_GUARD_NEG_S = 10   # tolera até 10s “antes” do started_after
       POWERBI_DF_END_GUARD_POS_S   = 1    # exige > último end conhecido + 1s
@@ -1244,12 +1583,30 @@ def _wait_for_dataflows(
 
         return bool(cond_started_after and cond_prev)
 
-    all_done = False
-    while time.time() < deadline:
-        all_done = True
-        for u in upstream:
-            k = (u["group_id"], u["dataflow_id"])
-            tx = _get_latest_dataflow_tx(u["group_id"], u["dataflow_id"], headers)
+    cap_s = max(_DF_POLL_MIN_S, int(poll_s or _DF_POLL_MAX_S))
+    expected = expected_duration_s or {}
+    now = time.time()
+    next_at = {k: now for k in status_map}
+    interval = {k: float(_DF_POLL_MIN_S) for k in status_map}
+    eta_used: set[tuple[str, str]] = set()
+    pending = {(u["group_id"], u["dataflow_id"]): u for u in upstream}
+    calls = 0
+
+    while pending and time.time() < deadline:
+        now = time.time()
+        for k, u in list(pending.items()):
+            if next_at[k] > now:
+                continue
+            rows, retry_after = _get_dataflow_tx_history(u["group_id"], u["dataflow_id"], headers, top=1)
+            calls += 1
+            if retry_after is not None:
+                wait = max(float(retry_after), interval[k] * _DF_POLL_FACTOR)
+                interval[k] = min(float(cap_s), interval[k] * _DF_POLL_FACTOR)
+                next_at[k] = now + wait
+                logger.info("DF-WAIT: throttled em %s/%s — próxima checagem em %.0fs.", u["group_id"], u["dataflow_id"], wait)
+                continue
+
+            tx = rows[0] if rows else {"status": "", "startTime": "", "endTime": ""}
             st = _canon_df_status(tx.get("status") or "")
             s_raw = tx.get("startTime") or ""
             e_raw = tx.get("endTime") or ""
@@ -1261,22 +1618,42 @@ def _wait_for_dataflows(
                     u["group_id"], u["dataflow_id"], st, s_raw, e_raw,
                     started_after_base_utc, prev_end_map_utc.get(k), end_guard_pos_s
                 )
-                all_done = False
-                continue
-
-            status_map[k] = {**u, **tx, "status": st}
-            logger.debug(
-                "DF-WAIT: tx atual %s/%s status=%s start=%s end=%s (qualificado)",
-                u["group_id"], u["dataflow_id"], st, s_raw, e_raw
-            )
-
-            if st not in _DF_TERMINAL:
-                all_done = False
+            else:
+                status_map[k] = {**u, **tx, "status": st}
+                logger.debug(
+                    "DF-WAIT: tx atual %s/%s status=%s start=%s end=%s (qualificado)",
+                    u["group_id"], u["dataflow_id"], st, s_raw, e_raw
+                )
+                if st in _DF_TERMINAL:
+                    pending.pop(k)
+                    continue
 
-        if all_done:
-            logger.info("DF-WAIT: todos os dataflows atingiram estado terminal.")
+                # primeira checagem útil: perto do fim esperado (mediana histórica)
+                sdt = _to_dt(s_raw)
+                exp_s = expected.get(k)
+                if k not in eta_used and exp_s and sdt:
+                    eta_used.add(k)
+                    eta = sdt.timestamp() + exp_s * _DF_ETA_FRACTION
+                    if eta > now + interval[k]:
+                        next_at[k] = eta
+                        interval[k] = float(_DF_POLL_MIN_S)
+                        logger.debug("DF-WAIT: %s/%s típico=%.0fs — próxima checagem em %.0fs.",
+                                     u["group_id"], u["dataflow_id"], exp_s, eta - now)
+                        continue
+
+            next_at[k] = now + _jittered(interval[k])
+            interval[k] = min(float(cap_s), interval[k] * _DF_POLL_FACTOR)
+
+        if not pending:
             break
-        time.sleep(int(poll_s))
+        sleep_s = min(next_at[k] for k in pending) - time.time()
+        sleep_s = min(sleep_s, deadline - time.time())
+        if sleep_s > 0:
+            time.sleep(sleep_s)
+
+    all_done = not pending
+    if all_done:
+        logger.info("DF-WAIT: todos os dataflows atingiram estado terminal (%d consultas).", calls)
 
     if not all_done:
         logger.warning("DF-WAIT: timeout atingido após %ss — seguindo para o dataset mesmo assim.", int(timeout_s))
@@ -1300,13 +1677,14 @@ def cascade_refresh(
     *,
     wait_for_dataflows: bool = False,
     df_timeout_s: int = 1800,
-    poll_every_s: int = 15,
+    poll_every_s: Optional[int] = None,
     fail_on_dataflow_error: bool = True,
 ) -> dict:
     """
     Dispara refresh dos dataflows upstream (se houver) e depois do dataset.
     Por padrão NÃO aguarda conclusão (compatibilidade). Se wait_for_dataflows=True, só dispara
-    o dataset após todos os dataflows chegarem a estado terminal.
+    o dataset após todos os dataflows chegarem a estado terminal (polling adaptativo;
+    `poll_every_s` é o teto do intervalo entre checagens).
 
     Retorno:
       {
@@ -1329,6 +1707,9 @@ def cascade_refresh(
 
     override_db = _load_upstream_override_db(report_id, dataset_id, ds_group_id)
     upstream = _dedup(override_db)
+    if not upstream and bool(getattr(settings, "POWERBI_ENABLE_AUTO_DISCOVERY", False)):
+        # linhagem persistida: sem probes seriais no caminho do disparo
+        upstream = _dedup(get_upstream_lineage(dataset_id, ds_group_id, headers, report_id=report_id))
 
     if not upstream:
         logger.debug("PBI: nenhum upstream configurado via UI — somente dataset.")
@@ -1348,12 +1729,24 @@ def cascade_refresh(
             started_after = started_after.replace(tzinfo=dt.timezone.utc)
 
     # Baseline do último transaction *antes* do POST (anti-match de execuções antigas)
+    # — na mesma chamada, o histórico curto dá a duração típica de cada DF (agenda do polling)
     prev_tx_end: dict[tuple[str, str], timezone.datetime] = {}
+    expected_s: dict[tuple[str, str], float] = {}
     for u in upstream:
-        prev_tx = _get_latest_dataflow_tx(u["group_id"], u["dataflow_id"], headers)
+        k = (u["group_id"], u["dataflow_id"])
+        rows, _ = _get_dataflow_tx_history(u["group_id"], u["dataflow_id"], headers, top=_DF_HISTORY_TOP)
+        prev_tx = rows[0] if rows else {}
         end_dt = _to_dt(prev_tx.get("endTime") or "") or _to_dt(prev_tx.get("startTime") or "")
         if end_dt:
-            prev_tx_end[(u["group_id"], u["dataflow_id"])] = end_dt
+            prev_tx_end[k] = end_dt
+        median_s = _median_dataflow_duration_s(rows)
+        if median_s:
+            expected_s[k] = median_s
+            cache.set(_df_duration_key(*k), median_s, _DF_DURATION_TTL)
+        else:
+            cached_s = get_dataflow_expected_duration_s(*k)
+            if cached_s:
+                expected_s[k] = cached_s
 
     for u in upstream:
         ok, detail = trigger_dataflow_refresh(u["group_id"], u["dataflow_id"])
@@ -1378,6 +1771,7 @@ def cascade_refresh(
                 poll_s=poll_every_s,
                 started_after=started_after,
                 prev_tx_end=prev_tx_end,  # ← linha de base para garantir transaction *novo*
+                expected_duration_s=expected_s,
             )
             if fail_on_dataflow_error and any(d.get("status") in {"Failed", "Cancelled"} for d in df_status):
                 return {
@@ -1411,12 +1805,8 @@ def get_dataset_refreshes(*, group_id: str, dataset_id: str, after_epoch: Option
     if not access_token:
         return []
     headers = _auth_headers(access_token)
-    url = f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/datasets/{dataset_id}/refreshes?$top={int(top)}"
     try:
-        r = _request("GET", url, headers=headers)
-        if not r.ok:
-            return []
-        vals = (r.json() or {}).get("value") or []
+        vals = (get_dataset_refresh_history(group_id, dataset_id, headers, min_items=int(top)) or [])[:int(top)]
         out: list[dict] = []
         base = int(after_epoch or 0)
         guard_neg = int(getattr(settings, "POWERBI_REFRESH_START_GUARD_NEG_S", 10))
@@ -1451,15 +1841,9 @@ def get_dataset_last_update_epoch(*, group_id: str, dataset_id: str) -> Optional
     if not access_token:
         return None
     headers = _auth_headers(access_token)
-    url = f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/datasets/{dataset_id}/refreshes?$top=50"
-    try:
-        r = _request("GET", url, headers=headers)
-        if not r.ok:
-            return None
-        dt_last = _pick_newest_refresh_dt((r.json() or {}).get("value", []))
-        return int(dt_last.timestamp()) if dt_last else None
-    except requests.RequestException:
-        return None
+    rows = get_dataset_refresh_history(group_id, dataset_id, headers, need_completed=True)
+    dt_last = _pick_newest_refresh_dt(rows or [])
+    return int(dt_last.timestamp()) if dt_last else None
 
 def get_dataflow_refreshes(*, group_id: str, dataset_id: str, after_epoch: Optional[int] = None, report_id: str = "") -> list[dict]:
     """
@@ -1472,7 +1856,7 @@ def get_dataflow_refreshes(*, group_id: str, dataset_id: str, after_epoch: Optio
     headers = _auth_headers(access_token)
 
     # Descoberta de upstreams (não depende de report_id; passamos vazio só para hints por nome)
-    ups = _discover_upstream_dataflows(dataset_id, group_id, headers, report_id=report_id)
+    ups = get_upstream_lineage(dataset_id, group_id, headers, report_id=report_id)
     if not ups:
         return []
 
@@ -1499,6 +1883,167 @@ def get_dataflow_refreshes(*, group_id: str, dataset_id: str, after_epoch: Optio
             "status": st or "",
             "start_epoch": se,
             "end_epoch": ee,
+            "expected_duration_s": get_dataflow_expected_duration_s(u["group_id"], u["dataflow_id"]),
             "refresh_type": "scheduled",  # DF não expõe ViaApi/Scheduled de forma consistente; tratamos como “do serviço”
         })
     return out
+
+
+# ════════════════════════════════════════
+# 10) STATUS COMPARTILHADO – snapshot em cache alimentado por um único poller
+# ════════════════════════════════════════
+
+STATUS_POLL_INTERVAL_S = int(getattr(settings, "POWERBI_STATUS_POLL_INTERVAL_S", 10))
+STATUS_POLL_MAX_S = int(getattr(settings, "POWERBI_STATUS_POLL_MAX_S", 60 * 60))
+STATUS_POLL_EXPIRED_TTL_S = int(getattr(settings, "POWERBI_STATUS_POLL_EXPIRED_TTL_S", STATUS_POLL_MAX_S))
+STATUS_SNAPSHOT_TTL_IDLE = int(getattr(settings, "POWERBI_STATUS_SNAPSHOT_TTL_IDLE", 30))
+STATUS_SNAPSHOT_TTL_ACTIVE = int(getattr(settings, "POWERBI_STATUS_SNAPSHOT_TTL_ACTIVE", STATUS_POLL_INTERVAL_S * 6))
+_STATUS_POLLER_LOCK_TTL = STATUS_POLL_INTERVAL_S * 3 + 30
+
+_RUNNING_STATES = {"inprogress", "running", "queued", "pending", "notstarted"}
+
+def refresh_status_key(group_id: str, report_id: str) -> str:
+    return f"pbi:refresh-status:{str(group_id).lower()}:{str(report_id).lower()}"
+
+def refresh_poller_key(group_id: str, report_id: str) -> str:
+    return f"pbi:refresh-poller:{str(group_id).lower()}:{str(report_id).lower()}"
+
+def refresh_poller_expired_key(group_id: str, report_id: str) -> str:
+    return f"pbi:refresh-poller-expired:{str(group_id).lower()}:{str(report_id).lower()}"
+
+def last_update_key(group_id: str, report_id: str) -> str:
+    return f"pbi:lastupd:{group_id}:{report_id}"
+
+def _is_running_item(obj: dict) -> bool:
+    """Detecta “em andamento” num item de status (tolerante a formatos diferentes)."""
+    st = str(obj.get("status") or obj.get("state") or obj.get("refresh_status") or "").lower()
+    if st in _RUNNING_STATES:
+        return True
+    if obj.get("in_progress") or obj.get("running"):
+        return True
+    # heurística: tem start sem end
+    if (obj.get("start_epoch") or obj.get("startTime") or obj.get("startDateTime")) and not (
+        obj.get("end_epoch") or obj.get("endTime") or obj.get("endDateTime")
+    ):
+        return True
+    return False
+
+def build_refresh_status_snapshot(report_id: str, group_id: str) -> dict:
+    """
+    Consulta o Power BI e monta o snapshot consolidado de refresh do report:
+      - status “oficial” do dataset (último evento) em `items`;
+      - se houver “refresh hint” (alguém disparou via API) e o dataset ainda não virou,
+        sintetiza um item InProgress com origem `api`.
+    Retorna {ok, items, running, polled_at} ou {ok: False, error, ...}.
+    """
+    polled_at = int(time.time())
+    ds_status = get_latest_refresh_status(report_id, group_id)
+    if not ds_status.get("ok"):
+        return {"ok": False, "error": ds_status.get("error") or "unknown", "running": False, "polled_at": polled_at}
+
+    item_ds = dict(ds_status.get("item") or ds_status.get("data") or ds_status)
+    if "origin" not in item_ds and "refresh_type" in item_ds:
+        rt = (item_ds.get("refresh_type") or "").lower()
+        item_ds["origin"] = "api" if ("api" in rt or "sdk" in rt or "xmla" in rt) else "web"
+    items = [item_ds]
+    any_running = _is_running_item(item_ds)
+
+    try:
+        hint = get_refresh_hint(group_id, report_id)
+        if hint:
+            last_dt = get_report_last_refresh_time_rt(report_id=report_id, report_group_id=group_id)
+            last_epoch = int(last_dt.timestamp()) if last_dt else 0
+            started_at = int(hint.get("started_at", 0))
+
+            if last_epoch <= started_at and not any_running:
+                items.append({
+                    "status": "InProgress",
+                    "refresh_type": "api_hint",
+                    "origin": hint.get("origin", "api"),
+                    "start_epoch": started_at,
+                })
+            # Se já virou e nada está rodando -> limpar hint
+            if last_epoch > started_at and not any_running:
+                clear_refresh_hint(group_id, report_id)
+    except Exception:
+        logger.debug("PBI: falha avaliando refresh hint de %s/%s", group_id, report_id, exc_info=True)
+
+    return {
+        "ok": True,
+        "items": items,
+        "running": any(_is_running_item(x) for x in items),
+        "polled_at": polled_at,
+    }
+
+def get_refresh_status_snapshot(report_id: str, group_id: str) -> Optional[dict]:
+    """Lê o snapshot compartilhado (ou None se expirou / nunca foi gerado)."""
+    return cache.get(refresh_status_key(group_id, report_id))
+
+def store_refresh_status_snapshot(report_id: str, group_id: str, snapshot: dict) -> None:
+    """
+    Grava o snapshot; TTL curto quando ocioso (a próxima leitura agenda nova checagem)
+    e mais longo enquanto há refresh ativo (o poller o mantém atualizado).
+    Na transição “rodando → terminal”, invalida o cache de última atualização.
+    """
+    key = refresh_status_key(group_id, report_id)
+    prev = cache.get(key) or {}
+    running = bool(snapshot.get("running"))
+    cache.set(key, snapshot, STATUS_SNAPSHOT_TTL_ACTIVE if running else STATUS_SNAPSHOT_TTL_IDLE)
+    if prev.get("running") and not running:
+        cache.delete(last_update_key(group_id, report_id))
+
+def expire_refresh_status_poller(report_id: str, group_id: str, snapshot: dict) -> None:
+    """
+    Poller atingiu STATUS_POLL_MAX_S com o refresh ainda “rodando”: grava um snapshot terminal
+    (running=False, stale=True) e uma marca de expiração, ambos por STATUS_POLL_EXPIRED_TTL_S.
+    Enquanto a marca existir, ensure_refresh_status_poller não reabre o poller — sem isso o
+    snapshot “rodando” faria a próxima leitura agendar outro poller com started_at novo.
+    """
+    stale = {**snapshot, "running": False, "stale": True}
+    cache.set(refresh_status_key(group_id, report_id), stale, STATUS_POLL_EXPIRED_TTL_S)
+    cache.set(refresh_poller_expired_key(group_id, report_id), int(time.time()), STATUS_POLL_EXPIRED_TTL_S)
+    cache.delete(last_update_key(group_id, report_id))
+
+def mark_refresh_status_started(report_id: str, group_id: str, started_at_epoch: int, origin: str = "api") -> None:
+    """
+    Publica imediatamente um snapshot “InProgress” para quem estiver assistindo o report.
+    Um refresh novo libera o poller de uma eventual expiração anterior.
+    """
+    cache.delete(refresh_poller_expired_key(group_id, report_id))
+    store_refresh_status_snapshot(report_id, group_id, {
+        "ok": True,
+        "items": [{
+            "status": "InProgress",
+            "refresh_type": "api_hint",
+            "origin": origin,
+            "start_epoch": int(started_at_epoch),
+        }],
+        "running": True,
+        "polled_at": int(time.time()),
+    })
+
+def ensure_refresh_status_poller(report_id: str, group_id: str) -> bool:
+    """
+    Garante um único poller por (group, report). Retorna True se um novo poller foi agendado;
+    False se já havia um ativo, se o último expirou por tempo máximo (ver
+    expire_refresh_status_poller) ou se o broker estiver indisponível.
+    """
+    if cache.get(refresh_poller_expired_key(group_id, report_id)) is not None:
+        return False
+    lock_key = refresh_poller_key(group_id, report_id)
+    if not cache.add(lock_key, int(time.time()), timeout=_STATUS_POLLER_LOCK_TTL):
+        return False
+    try:
+        from .tasks import poll_refresh_status
+        poll_refresh_status.delay(report_id, group_id, int(time.time()))
+        return True
+    except Exception:
+        logger.warning("PBI: não foi possível agendar poller de status para %s/%s", group_id, report_id, exc_info=True)
+        cache.delete(lock_key)
+        return False
+
+def touch_refresh_status_poller(report_id: str, group_id: str) -> None:
+    cache.set(refresh_poller_key(group_id, report_id), int(time.time()), timeout=_STATUS_POLLER_LOCK_TTL)
+
+def release_refresh_status_poller(report_id: str, group_id: str) -> None:
+    cache.delete(refresh_poller_key(group_id, report_id))
@@ -1,12 +1,12 @@
 # bi/views.py – Django views para módulo BI com persistência de estado + LOG de atualização
 from __future__ import annotations
 
+import hashlib
 import json
 import time
 import logging
 import re
 import uuid
-from itertools import chain
 from typing import Any, Dict
 
 from django.conf import settings as django_settings
@@ -15,8 +15,9 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.models import Group
 from django.core.cache import cache
-from django.db.models import F, Value, CharField, IntegerField, Q
-from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import F, Value, CharField, IntegerField, Q, Sum, Count, Exists, OuterRef, Prefetch
+from django.http import JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
@@ -24,14 +25,21 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST, require_http_methods, require_GET
 
 from .forms import BIReportForm, BIReportEditForm
-from .models import BIReport, BIAccess, BIUserReportState, BISavedView
+from .access_log import record_access
+from .permissions import accessible_report_ids, acl_version, user_can_access_report
+from .state_store import load_state, save_state
+from .models import BIReport, BIAccessDaily, BISavedView
 from .utils import (
     get_embed_params_user_owns_data,
-    get_latest_refresh_status,        # status “oficial” do dataset (último evento)
     get_report_last_refresh_time_rt,  # última atualização efetiva do dataset (DateTime)
     trigger_dataset_refresh,          # dispara apenas dataset
     cascade_refresh,                  # dispara DF upstream + dataset (com opções de espera)
     list_workspace_dataflows,         # lista dataflows do workspace (para UI de edição)
+    set_refresh_hint,
+    last_update_key,
+    get_refresh_status_snapshot,      # snapshot compartilhado (alimentado pelo poller)
+    mark_refresh_status_started,
+    ensure_refresh_status_poller,
 )
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -54,22 +62,11 @@ _GUID = r"[0-9a-fA-F-]{36}"
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Refresh “hint” compartilhado (para pílula “via api” aparecer para todos)
+#   Mesmas chaves de bi.utils, para o poller de status enxergar o hint.
 # ─────────────────────────────────────────────────────────────────────────────
-_HINT_TTL_S = 20 * 60  # 20 min
-
-def _hint_key(group_id: str, report_id: str) -> str:
-    return f"pbi:refresh-hint:{group_id}:{report_id}"
 
 def _set_refresh_hint(group_id: str, report_id: str, started_at_epoch: int, origin: str = "api"):
-    cache.set(_hint_key(group_id, report_id),
-              {"origin": origin, "started_at": int(started_at_epoch)},
-              timeout=_HINT_TTL_S)
-
-def _get_refresh_hint(group_id: str, report_id: str):
-    return cache.get(_hint_key(group_id, report_id))
-
-def _clear_refresh_hint(group_id: str, report_id: str):
-    cache.delete(_hint_key(group_id, report_id))
+    set_refresh_hint(group_id, report_id, started_at_epoch, origin=origin)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -111,13 +108,8 @@ def _summarize_state(state: dict) -> Dict[str, Any]:
 
 
 def _perm_check(user, bi_report) -> bool:
-    return (
-        bi_report.all_users
-        or bi_report.allowed_users.filter(id=user.id).exists()
-        or Group.objects.filter(
-            id__in=bi_report.allowed_groups.values_list("id", flat=True), user=user
-        ).exists()
-    )
+    # resolvido pelo conjunto cacheado de relatórios do usuário (bi.permissions)
+    return user_can_access_report(user, bi_report)
 
 
 def _extract_group_report_from_embed(embed_code: str) -> tuple[str | None, str | None]:
@@ -280,10 +272,7 @@ def bi_report_list(request):
 def my_bi_report_list(request):
     user = request.user
     bi_reports = (
-        BIReport.objects.filter(
-            Q(all_users=True) | Q(allowed_users=user) | Q(allowed_groups__in=user.groups.all())
-        )
-        .distinct()
+        BIReport.objects.filter(pk__in=accessible_report_ids(user))
         .prefetch_related("allowed_users", "allowed_groups")
     )
     return render(request, "bi/listar_bi.html", {"bi_reports": bi_reports})
@@ -303,7 +292,8 @@ def bi_report_detail(request, pk):
         messages.error(request, "Você não tem permissão para este relatório.")
         return render(request, "bi/403.html")
 
-    BIAccess.objects.create(bi_report=bi_report, user=user)
+    # enfileirado no Redis; gravado em lote por bi.tasks.flush_bi_access_buffer
+    record_access(bi_report.pk, user.pk)
 
     embed = get_embed_params_user_owns_data(
         report_id=bi_report.report_id, group_id=bi_report.group_id
@@ -315,9 +305,7 @@ def bi_report_detail(request, pk):
         )
 
     # Estado padrão: último estado do usuário
-    state_obj = BIUserReportState.objects.filter(user=user, bi_report=bi_report).first()
-    last_state = state_obj.state if state_obj else {}
-    last_state_updated_at = state_obj.updated_at.isoformat() if state_obj else ""
+    last_state, last_state_updated_at = load_state(user.pk, bi_report.pk)
 
     # Override por visão compartilhada via token
     token = (request.GET.get("view") or "").strip()
@@ -400,11 +388,10 @@ def salvar_estado_relatorio(request):
         return JsonResponse({"error": "Acesso negado.", "trace_id": trace_id}, status=403)
 
     try:
-        obj, created = BIUserReportState.objects.update_or_create(
-            user=request.user, bi_report=bi_report, defaults={"state": state}
-        )
+        # write-behind: cache agora, banco após período de silêncio (bi.state_store)
+        updated_at, changed = save_state(request.user.pk, bi_report.pk, state)
         return JsonResponse(
-            {"ok": True, "updated_at": obj.updated_at.isoformat(), "trace_id": trace_id}
+            {"ok": True, "updated_at": updated_at, "changed": changed, "trace_id": trace_id}
         )
     except Exception:
         return JsonResponse({"error": "DB error", "trace_id": trace_id}, status=500)
@@ -414,19 +401,47 @@ def salvar_estado_relatorio(request):
 # ACESSOS / PERMISSÕES / BUSCA
 # ─────────────────────────────────────────────────────────────────────────────
 
+def _page_size(request, default: int = 100, maximum: int = 1000) -> int:
+    """?pp= itens por página; valor inválido cai no padrão."""
+    try:
+        size = int(request.GET.get("pp") or default)
+    except (TypeError, ValueError):
+        size = default
+    return min(max(size, 1), maximum)
+
+
 @login_required
 @permission_required("bi.view_access", raise_exception=True)
 def visualizar_acessos_bi(request, pk):
     bi_report = get_object_or_404(BIReport, pk=pk)
+    # lê o rollup diário (BIAccessDaily), não a tabela bruta de acessos
     acessos = (
-        BIAccess.objects.filter(bi_report=bi_report)
+        BIAccessDaily.objects.filter(bi_report=bi_report)
         .select_related("user")
-        .order_by("-accessed_at")
+        .order_by("-day", "-last_access")
     )
+    total = acessos.aggregate(n=Sum("views"))["n"] or 0
+
+    page_size = _page_size(request)
+    paginator = Paginator(acessos, page_size)
+    try:
+        page_obj = paginator.page(request.GET.get("page") or 1)
+    except (EmptyPage, PageNotAnInteger):
+        page_obj = paginator.page(1)
+
+    qs_page = request.GET.copy()
+    qs_page.pop("page", None)
+
     return render(
         request,
         "bi/visualizar_acessos.html",
-        {"bi_report": bi_report, "acessos": acessos, "total_acessos": acessos.count()},
+        {
+            "bi_report": bi_report,
+            "acessos": page_obj.object_list,
+            "page_obj": page_obj,
+            "page_query": qs_page.urlencode(),
+            "total_acessos": total,
+        },
     )
 
 
@@ -451,92 +466,163 @@ def relatorio_permissoes(request):
     group_text = (request.GET.get("group") or "").strip().lower()
     user_text = (request.GET.get("user") or "").strip().lower()
 
+    permissoes = _permissoes_union_qs(bi_text, group_text, user_text)
+
+    fmt = request.GET.get("formato", "html").lower()
+    if fmt == "json":
+        return _stream_permissoes_json(permissoes)
+    if fmt == "csv":
+        return _stream_permissoes_csv(permissoes)
+
+    page_size = _page_size(request)
+    paginator = Paginator(permissoes, page_size)
+    try:
+        page_obj = paginator.page(request.GET.get("page") or 1)
+    except (EmptyPage, PageNotAnInteger):
+        page_obj = paginator.page(1)
+
+    bi_opts = list(BIReport.objects.order_by("title").values_list("title", flat=True))
+    group_opts = list(Group.objects.order_by("name").values_list("name", flat=True))
+    User = get_user_model()
+    user_opts = list(User.objects.order_by("username").values_list("username", flat=True))
+
+    qs_csv = request.GET.copy()
+    qs_csv["formato"] = "csv"
+    qs_csv.pop("page", None)
+    export_url = f"{request.path}?{qs_csv.urlencode()}"
+
+    qs_page = request.GET.copy()
+    qs_page.pop("page", None)
+
+    return render(
+        request,
+        "bi/relatorio_permissoes.html",
+        {
+            "permissoes": page_obj.object_list,
+            "page_obj": page_obj,
+            "page_query": qs_page.urlencode(),
+            "bi_opts": bi_opts,
+            "group_opts": group_opts,
+            "user_opts": user_opts,
+            "bi_text": request.GET.get("bi", ""),
+            "group_text": request.GET.get("group", ""),
+            "user_text": request.GET.get("user", ""),
+            "export_url": export_url,
+        },
+    )
+
+
+_PERM_VIA_DIRECT = "Acesso individual"
+_PERM_VIA_ALL = "Todos os usuários"
+_PERM_USER_ALL = "— todos —"
+
+
+def _permissoes_union_qs(bi_text: str = "", group_text: str = "", user_text: str = ""):
+    """
+    Relatório de permissões como um único UNION ALL no banco
+    (acesso individual ∪ via grupo ∪ todos os usuários), já filtrado e ordenado.
+    Filtros de texto são aplicados em cada ramo antes da união.
+    """
     direct_qs = (
         BIReport.objects.filter(allowed_users__isnull=False)
-        .values(
+        .annotate(
             bi_id=F("id"),
             bi_title=F("title"),
-            user_id=F("allowed_users__id"),
+            perm_user_id=F("allowed_users__id"),
             username=F("allowed_users__username"),
-        )
-        .annotate(
-            via=Value("Acesso individual", output_field=CharField()),
+            via=Value(_PERM_VIA_DIRECT, output_field=CharField()),
             perm_group_id=Value(None, output_field=IntegerField()),
         )
     )
     group_qs = (
         BIReport.objects.filter(allowed_groups__user__isnull=False)
-        .values(
+        .annotate(
             bi_id=F("id"),
             bi_title=F("title"),
-            user_id=F("allowed_groups__user__id"),
+            perm_user_id=F("allowed_groups__user__id"),
             username=F("allowed_groups__user__username"),
-            perm_group_id=F("allowed_groups__id"),
             via=F("allowed_groups__name"),
+            perm_group_id=F("allowed_groups__id"),
         )
     )
     public_qs = (
         BIReport.objects.filter(all_users=True)
-        .values(bi_id=F("id"), bi_title=F("title"))
         .annotate(
-            user_id=Value(None, output_field=IntegerField()),
-            username=Value("— todos —", output_field=CharField()),
-            via=Value("Todos os usuários", output_field=CharField()),
+            bi_id=F("id"),
+            bi_title=F("title"),
+            perm_user_id=Value(None, output_field=IntegerField()),
+            username=Value(_PERM_USER_ALL, output_field=CharField()),
+            via=Value(_PERM_VIA_ALL, output_field=CharField()),
             perm_group_id=Value(None, output_field=IntegerField()),
         )
     )
 
-    permissoes = list(chain(direct_qs, group_qs, public_qs))
-
     if bi_text:
-        permissoes = [p for p in permissoes if bi_text in p["bi_title"].lower()]
+        direct_qs = direct_qs.filter(title__icontains=bi_text)
+        group_qs = group_qs.filter(title__icontains=bi_text)
+        public_qs = public_qs.filter(title__icontains=bi_text)
+    # filtros sobre os aliases anotados: reaproveitam o JOIN da linha emitida
+    # (filter(allowed_users__...) abriria um segundo JOIN e não restringiria a linha)
     if user_text:
-        permissoes = [p for p in permissoes if p["username"] and user_text in p["username"].lower()]
+        direct_qs = direct_qs.filter(username__icontains=user_text)
+        group_qs = group_qs.filter(username__icontains=user_text)
+        if user_text not in _PERM_USER_ALL.lower():
+            public_qs = public_qs.none()
     if group_text:
-        permissoes = [p for p in permissoes if group_text in p["via"].lower()]
+        group_qs = group_qs.filter(via__icontains=group_text)
+        if group_text not in _PERM_VIA_DIRECT.lower():
+            direct_qs = direct_qs.none()
+        if group_text not in _PERM_VIA_ALL.lower():
+            public_qs = public_qs.none()
 
-    permissoes.sort(
-        key=lambda p: (p["bi_title"].lower(), (p["username"] or "").lower(), p["via"].lower())
-    )
+    cols = ("bi_id", "bi_title", "perm_user_id", "username", "via", "perm_group_id")
+    branches = [q.values(*cols) for q in (direct_qs, group_qs, public_qs)]
+    # ordenação no banco (collation do MySQL já é case-insensitive)
+    return branches[0].union(*branches[1:], all=True).order_by("bi_title", "username", "via")
 
-    bi_opts = list(BIReport.objects.order_by("title").values_list("title", flat=True))
-    group_opts = list(Group.objects.order_by("name").values_list("name", flat=True))
-    User = get_user_model()
-    user_opts = list(User.objects.order_by("username").values_list("username", flat=True))
 
-    fmt = request.GET.get("formato", "html").lower()
-    if fmt == "json":
-        return JsonResponse(permissoes, safe=False)
+def _perm_row(p: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "bi_id": p["bi_id"],
+        "bi_title": p["bi_title"],
+        "user_id": p["perm_user_id"],
+        "username": p["username"],
+        "via": p["via"],
+        "perm_group_id": p["perm_group_id"],
+    }
 
-    if fmt == "csv":
-        from csv import writer
 
-        resp = HttpResponse(content_type="text/csv")
-        resp["Content-Disposition"] = 'attachment; filename="permissoes_bi.csv"'
-        w = writer(resp)
-        w.writerow(["bi", "usuario", "via"])
-        for p in permissoes:
-            w.writerow([p["bi_title"], p["username"], p["via"]])
-        return resp
+class _Echo:
+    """Pseudo-buffer para csv.writer: devolve a linha em vez de guardar."""
+    def write(self, value):
+        return value
 
-    qs_csv = request.GET.copy()
-    qs_csv["formato"] = "csv"
-    export_url = f"{request.path}?{qs_csv.urlencode()}"
 
-    return render(
-        request,
-        "bi/relatorio_permissoes.html",
-        {
-            "permissoes": permissoes,
-            "bi_opts": bi_opts,
-            "group_opts": group_opts,
-            "user_opts": user_opts,
-            "bi_text": request.GET.get("bi", ""),
-            "group_text": request.GET.get("group", ""),
-            "user_text": request.GET.get("user", ""),
-            "export_url": export_url,
-        },
-    )
+def _stream_permissoes_csv(qs) -> StreamingHttpResponse:
+    from csv import writer
+
+    w = writer(_Echo())
+
+    def _rows():
+        yield w.writerow(["bi", "usuario", "via"])
+        for p in qs.iterator(chunk_size=2000):
+            yield w.writerow([p["bi_title"], p["username"], p["via"]])
+
+    resp = StreamingHttpResponse(_rows(), content_type="text/csv")
+    resp["Content-Disposition"] = 'attachment; filename="permissoes_bi.csv"'
+    return resp
+
+
+def _stream_permissoes_json(qs) -> StreamingHttpResponse:
+    def _chunks():
+        yield "["
+        first = True
+        for p in qs.iterator(chunk_size=2000):
+            yield ("" if first else ",") + json.dumps(_perm_row(p), ensure_ascii=False)
+            first = False
+        yield "]"
+
+    return StreamingHttpResponse(_chunks(), content_type="application/json")
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -572,7 +658,17 @@ def get_last_update_rt(request):
         r["Cache-Control"] = "no-store, max-age=0, must-revalidate"
         return r
 
-    # --- helpers ---
+    resp = {**_last_update_payload(bi, report_id, group_id), "trace_id": trace_id}
+    r = JsonResponse(resp)
+    r["Cache-Control"] = "no-store, max-age=0, must-revalidate"
+    return r
+
+
+def _last_update_payload(bi: BIReport, report_id: str, group_id: str) -> Dict[str, Any]:
+    """
+    Monta {ok, tz, last_updated_*, next_update_*} priorizando o tempo real da API.
+    Usa cache curto (55s) compartilhado entre get_last_update_rt e o stream SSE.
+    """
     def _aware(dt):
         if not dt:
             return None
@@ -597,13 +693,11 @@ def get_last_update_rt(request):
             tzname = "UTC"
 
     # --- cache (evita martelar a API) ---
-    ckey = f"pbi:lastupd:{group_id}:{report_id}"
+    ckey = last_update_key(group_id, report_id)
     cached = cache.get(ckey)
     if cached:
-        cached["trace_id"] = trace_id
-        r = JsonResponse(cached)
-        r["Cache-Control"] = "no-store, max-age=0, must-revalidate"
-        return r
+        cached.pop("trace_id", None)
+        return cached
 
     # --- tempo real via Power BI API ---
     rt_dt = get_report_last_refresh_time_rt(report_id=report_id, report_group_id=group_id)
@@ -625,13 +719,10 @@ def get_last_update_rt(request):
         "last_updated_iso": to_iso(last_dt),
         "next_update_epoch": to_epoch(bi.next_update),
         "next_update_iso": to_iso(bi.next_update),
-        "trace_id": trace_id,
     }
 
     cache.set(ckey, resp, timeout=55)  # 55s para aliviar chamadas repetidas
-    r = JsonResponse(resp)
-    r["Cache-Control"] = "no-store, max-age=0, must-revalidate"
-    return r
+    return resp
 
 
 def _req_meta(request):
@@ -671,7 +762,7 @@ def refresh_now(request):
     Parâmetros opcionais no payload (válidos quando cascade=true):
       - wait_for_dataflows (bool, default False): espera dataflows concluírem antes de acionar o dataset
       - df_timeout_s (int, default 1800): timeout total para aguardar dataflows
-      - poll_every_s (int, default 15): intervalo de polling para checar status dos dataflows
+      - poll_every_s (int, opcional): teto do intervalo adaptativo de polling dos dataflows
       - fail_on_dataflow_error (bool, default True): se algum DF falhar/cancelar, não aciona o dataset
 
     Rate-limit por (group_id, report_id) usando cache.
@@ -689,7 +780,7 @@ def refresh_now(request):
     # novos flags opcionais
     wait_for_dataflows = bool(payload.get("wait_for_dataflows", False))
     df_timeout_s = int(payload.get("df_timeout_s", 1800))
-    poll_every_s = int(payload.get("poll_every_s", 15))
+    poll_every_s = int(payload["poll_every_s"]) if payload.get("poll_every_s") else None
     fail_on_dataflow_error = bool(payload.get("fail_on_dataflow_error", True))
 
     if not report_id or not group_id:
@@ -732,7 +823,11 @@ def refresh_now(request):
     # A partir daqui, em erro inesperado, liberamos o lock
     try:
         # cria o hint compartilhado ANTES de disparar, para todos verem “via api” imediatamente
-        _set_refresh_hint(group_id, report_id, started_at_epoch=int(time.time()), origin="api")
+        started_at = int(time.time())
+        _set_refresh_hint(group_id, report_id, started_at_epoch=started_at, origin="api")
+        # publica “InProgress” para quem já está assistindo e garante o poller compartilhado
+        mark_refresh_status_started(report_id, group_id, started_at, origin="api")
+        ensure_refresh_status_poller(report_id, group_id)
 
         # Se cascade=True mas não houver dataflows configurados, caímos para refresh do dataset apenas
         has_dfs = bool(bi.upstream_dataflows and isinstance(bi.upstream_dataflows, list))
@@ -776,10 +871,12 @@ def refresh_now(request):
 @login_required
 def get_refresh_status(request):
     """
-    Retorna status de refresh consolidado.
+    Retorna status de refresh consolidado, lido do snapshot compartilhado em cache
+    (ver bi.utils.build_refresh_status_snapshot).
     - Sempre inclui o status “oficial” do dataset em `items`.
     - Se existir “refresh hint” (alguém clicou via API) e o dataset ainda não virou,
       sintetiza um item InProgress com origem `api`, para todos verem a pílula.
+    - Sem snapshot ainda: agenda o poller e responde `pending: true` com `items` vazio.
     Body:
       { report_id, group_id, after_epoch?, include_dataflows? }
     Resposta:
@@ -814,66 +911,170 @@ def get_refresh_status(request):
         r["Cache-Control"] = "no-store, max-age=0, must-revalidate"
         return r
 
-    # 1) status “oficial” do dataset (último evento)
-    ds_status = get_latest_refresh_status(report_id, group_id)
-    if not ds_status.get("ok"):
-        ds_status["trace_id"] = trace_id
-        r = JsonResponse(ds_status, status=502)
+    # Lê apenas o snapshot compartilhado; a API do Power BI é consultada por um único
+    # poller por report (bi.tasks.poll_refresh_status), não por cada aba aberta.
+    snap = get_refresh_status_snapshot(report_id, group_id)
+    if snap is None or snap.get("running"):
+        ensure_refresh_status_poller(report_id, group_id)
+
+    if snap is None:
+        resp = {"ok": True, "items": [], "pending": True, "after_epoch": after_epoch, "trace_id": trace_id}
+    elif not snap.get("ok"):
+        r = JsonResponse({**snap, "trace_id": trace_id}, status=502)
         r["Cache-Control"] = "no-store, max-age=0, must-revalidate"
         return r
+    else:
+        resp = {
+            "ok": True,
+            "items": snap.get("items") or [],
+            "polled_at": snap.get("polled_at"),
+            "stale": bool(snap.get("stale")),  # poller expirou por tempo máximo; status pode estar defasado
+            "after_epoch": after_epoch,
+            "trace_id": trace_id,
+        }
+    r = JsonResponse(resp)
+    r["Cache-Control"] = "no-store, max-age=0, must-revalidate"
+    return r
 
-    # Normaliza como item (mantendo campos crus para o front deduzir)
-    items = []
-    item_ds = ds_status.get("item") or ds_status.get("data") or ds_status
-    # Marcação de origem padrão
-    if "origin" not in item_ds and "refresh_type" in item_ds:
-        rt = (item_ds.get("refresh_type") or "").lower()
-        item_ds["origin"] = "api" if ("api" in rt or "sdk" in rt or "xmla" in rt) else "web"
-    items.append(item_ds)
 
-    # 2) sticky server-side: se ninguém “in progress” mas temos hint válido e o dataset não virou, sintetiza
-    try:
-        hint = _get_refresh_hint(group_id, report_id)
-        if hint:
-            # última atualização confirmada do dataset
-            last_dt = get_report_last_refresh_time_rt(report_id=report_id, report_group_id=group_id)
-            last_epoch = int(last_dt.timestamp()) if last_dt else 0
-            started_at = int(hint.get("started_at", 0))
-
-            # Detecta “in progress” no item oficial
-            def _is_running(obj: dict) -> bool:
-                st = str(obj.get("status") or obj.get("state") or obj.get("refresh_status") or "").lower()
-                if st in {"inprogress", "running", "queued", "pending", "notstarted"}:
-                    return True
-                if obj.get("in_progress") or obj.get("running"):
-                    return True
-                # heurística: tem start sem end
-                if (obj.get("start_epoch") or obj.get("startTime") or obj.get("startDateTime")) and not (
-                    obj.get("end_epoch") or obj.get("endTime") or obj.get("endDateTime")
-                ):
-                    return True
-                return False
-
-            any_running = any(_is_running(x) for x in items)
-
-            if last_epoch <= started_at and not any_running:
-                # sintetiza um item “InProgress (api)”
-                items.append({
-                    "status": "InProgress",
-                    "refresh_type": "api_hint",
-                    "origin": hint.get("origin", "api"),
-                    "start_epoch": started_at,
-                })
-            # Se já virou e nada está rodando -> limpar hint
-            if last_epoch > started_at and not any_running:
-                _clear_refresh_hint(group_id, report_id)
-    except Exception:
-        # silencioso
-        pass
+# ─────────────────────────────────────────────────────────────────────────────
+# SSE: status de refresh + última atualização “empurrados” ao navegador
+# ─────────────────────────────────────────────────────────────────────────────
+# Stream longo só com worker assíncrono (ASGI/gevent): em worker síncrono do gunicorn cada
+# aba aberta prenderia um worker inteiro. Padrão: uma leitura do cache por conexão e o
+# EventSource reconecta após `retry:` — POWERBI_SSE_IDLE_RETRY_MS ocioso (>= sonda antiga
+# de 25s), POWERBI_SSE_POLL_RETRY_MS enquanto há refresh rodando (conclusão vista logo).
+_SSE_LONG_LIVED = bool(getattr(django_settings, "POWERBI_SSE_LONG_LIVED", False))
+_SSE_STREAM_SECONDS = int(getattr(django_settings, "POWERBI_SSE_STREAM_SECONDS", 120))
+_SSE_TICK_SECONDS = float(getattr(django_settings, "POWERBI_SSE_TICK_SECONDS", 2))
+_SSE_HEARTBEAT_SECONDS = 15
+_SSE_RETRY_MS = 3000
+_SSE_IDLE_RETRY_MS = int(getattr(django_settings, "POWERBI_SSE_IDLE_RETRY_MS", 30000))
+_SSE_POLL_RETRY_MS = int(getattr(django_settings, "POWERBI_SSE_POLL_RETRY_MS", 3000))
 
-    resp = {"ok": True, "items": items, "after_epoch": after_epoch, "trace_id": trace_id}
-    r = JsonResponse(resp)
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'), default=str)}\n\n"
+
+
+def _sse_event_id(running: bool, status_hash: str | None, lastupd_sig: tuple | None) -> str:
+    """
+    `id:` do SSE = estado já entregue ao cliente. O navegador o devolve em Last-Event-ID
+    ao reconectar, e a nova conexão só reenvia o que mudou.
+    """
+    st = status_hash or ""
+    lu = ",".join("" if v is None else str(v) for v in lastupd_sig) if lastupd_sig else ""
+    return f"{int(bool(running))}.{st}.{lu}"
+
+
+def _sse_parse_event_id(raw: str | None) -> tuple[bool, str | None, tuple | None]:
+    parts = (raw or "").split(".")
+    if len(parts) != 3:
+        return False, None, None
+    running, st, lu = parts
+    lastupd = tuple(int(v) if v.lstrip("-").isdigit() else None for v in lu.split(",")) if lu else None
+    return running == "1", st or None, lastupd
+
+
+@require_GET
+@login_required
+def refresh_events(request):
+    """
+    Stream SSE (text/event-stream) com as transições de refresh do report.
+    Lê somente o cache (snapshot do poller compartilhado + cache de última atualização);
+    nenhuma chamada ao Power BI é feita por conexão, exceto o “last_update” ao concluir.
+    Eventos:
+      - status:      { ok, running, items, polled_at }
+      - last_update: mesmo payload de get_last_update_rt
+    Com POWERBI_SSE_LONG_LIVED (worker assíncrono) a conexão dura POWERBI_SSE_STREAM_SECONDS;
+    sem ele, responde uma leitura e fecha na hora, com `retry:` longo quando ocioso e curto
+    durante um refresh. Nos dois casos o EventSource reconecta sozinho, e o `id:` (devolvido
+    em Last-Event-ID) evita reenviar eventos que o cliente já recebeu.
+    """
+    report_id = request.GET.get("report_id")
+    group_id = request.GET.get("group_id")
+    if not report_id or not group_id:
+        return HttpResponseBadRequest("missing report_id/group_id")
+
+    bi = BIReport.objects.filter(report_id=report_id, group_id=group_id).first()
+    if not bi:
+        return JsonResponse({"ok": False, "error": "not_found"}, status=404)
+    if not _perm_check(request.user, bi):
+        return JsonResponse({"ok": False, "error": "forbidden"}, status=403)
+
+    # reconexão: o que o cliente já tem (Last-Event-ID) não é reenviado
+    was_running, seen_status, seen_lastupd = _sse_parse_event_id(request.META.get("HTTP_LAST_EVENT_ID"))
+
+    def _stream():
+        long_lived = _SSE_LONG_LIVED
+        if long_lived:
+            yield f"retry: {_SSE_RETRY_MS}\n\n"
+        deadline = time.monotonic() + (_SSE_STREAM_SECONDS if long_lived else 0)
+        last_sent = time.monotonic()
+        status_hash = seen_status
+        running = was_running_now = was_running
+        lastupd_sig = seen_lastupd
+        need_last_update = seen_lastupd is None  # abertura sem histórico: consulta a última atualização
+
+        while True:
+            out = []
+
+            snap = get_refresh_status_snapshot(report_id, group_id)
+            if snap is None or snap.get("running"):
+                ensure_refresh_status_poller(report_id, group_id)
+            if snap is not None:
+                running = bool(snap.get("running"))
+                sig = json.dumps([snap.get("ok"), running, snap.get("items")], sort_keys=True, default=str)
+                sig_hash = hashlib.sha1(sig.encode("utf-8")).hexdigest()[:12]
+                if sig_hash != status_hash:
+                    status_hash = sig_hash
+                    out.append(_sse_event("status", {
+                        "ok": bool(snap.get("ok")),
+                        "running": running,
+                        "items": snap.get("items") or [],
+                        "polled_at": snap.get("polled_at"),
+                        "stale": bool(snap.get("stale")),
+                    }))
+                    if was_running_now and not running:
+                        need_last_update = True
+                    was_running_now = running
+
+            if need_last_update:
+                payload = _last_update_payload(bi, report_id, group_id)
+                need_last_update = False
+            else:
+                # outra aba/view pode ter renovado o cache — repassa sem consultar a API
+                payload = cache.get(last_update_key(group_id, report_id))
+            if payload:
+                sig = (payload.get("last_updated_epoch"), payload.get("next_update_epoch"))
+                if sig != lastupd_sig:
+                    lastupd_sig = sig
+                    out.append(_sse_event("last_update", payload))
+
+            if out:
+                out.append(f"id: {_sse_event_id(running, status_hash, lastupd_sig)}\n\n")
+
+            if not long_lived:
+                # long-poll curto: reconecta rápido só enquanto há refresh em andamento
+                out.append(f"retry: {_SSE_POLL_RETRY_MS if running else _SSE_IDLE_RETRY_MS}\n\n")
+                yield "".join(out)
+                return
+
+            now = time.monotonic()
+            if out:
+                last_sent = now
+                yield "".join(out)
+            elif now - last_sent >= _SSE_HEARTBEAT_SECONDS:
+                last_sent = now
+                yield ": ping\n\n"
+
+            if now >= deadline:
+                return
+            time.sleep(_SSE_TICK_SECONDS)
+
+    r = StreamingHttpResponse(_stream(), content_type="text/event-stream")
     r["Cache-Control"] = "no-store, max-age=0, must-revalidate"
+    r["X-Accel-Buffering"] = "no"  # nginx: não bufferizar o stream
     return r
 
 
@@ -899,12 +1100,54 @@ def saved_views_list(request):
         return JsonResponse({"ok": False, "error": "forbidden", "trace_id": trace_id}, status=403)
 
     u = request.user
+    ckey = _saved_views_cache_key(bi.pk, u.pk)
+    views_payload = cache.get(ckey)
+    if views_payload is None:
+        views_payload = _saved_views_payload(bi, u)
+        cache.set(ckey, views_payload, timeout=_SV_LIST_TTL)
+
+    return JsonResponse({"ok": True, "views": views_payload, "trace_id": trace_id})
+
+
+# Cache da listagem por (usuário, BI). A versão por BI é incrementada a cada
+# save/update/delete/set_default; a versão de ACL do usuário (bi.permissions, renovada
+# pelos signals de grupo) tira da chave a lista de quem entrou/saiu de um grupo —
+# ela traz os share tokens das visões compartilhadas com o grupo.
+_SV_LIST_TTL = 10 * 60
+
+
+def _saved_views_version(bi_pk: int) -> int:
+    return cache.get_or_set(f"pbi:sv:ver:{bi_pk}", 1, timeout=None)
+
+
+def _saved_views_bump(bi_pk: int) -> None:
+    key = f"pbi:sv:ver:{bi_pk}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, timeout=None)
+
+
+def _saved_views_cache_key(bi_pk: int, user_pk: int) -> str:
+    return f"pbi:sv:list:{bi_pk}:v{_saved_views_version(bi_pk)}:a{acl_version(user_pk)}:{user_pk}"
+
+
+def _saved_views_payload(bi: BIReport, u) -> list:
+    """Visões visíveis ao usuário: 1 query (visibilidade por EXISTS + contagens) + 2 prefetches."""
+    shared_with_user = BISavedView.objects.filter(pk=OuterRef("pk"), shared_users=u)
+    shared_with_groups = BISavedView.objects.filter(pk=OuterRef("pk"), shared_groups__user=u)
     qs = (
         BISavedView.objects.filter(bi_report=bi)
-        .filter(Q(owner=u) | Q(is_public=True) | Q(shared_users=u) | Q(shared_groups__in=u.groups.all()))
+        .filter(Q(owner=u) | Q(is_public=True) | Exists(shared_with_user) | Exists(shared_with_groups))
+        .annotate(
+            n_shared_users=Count("shared_users", distinct=True),
+            n_shared_groups=Count("shared_groups", distinct=True),
+        )
         .select_related("owner")
-        .prefetch_related("shared_users", "shared_groups")
-        .distinct()
+        .prefetch_related(
+            Prefetch("shared_users", queryset=get_user_model().objects.only("id")),
+            Prefetch("shared_groups", queryset=Group.objects.only("id")),
+        )
         .order_by("owner__username", "name")
     )
 
@@ -912,9 +1155,9 @@ def saved_views_list(request):
     for v in qs:
         if v.is_public:
             visibility = "public"
-        elif v.shared_users.exists():
+        elif v.n_shared_users:
             visibility = "users"
-        elif v.shared_groups.exists():
+        elif v.n_shared_groups:
             visibility = "groups"
         else:
             visibility = "private"
@@ -928,13 +1171,12 @@ def saved_views_list(request):
             "owner_name": v.owner.username,
             "owner_id": v.owner_id,
             "is_owner": (v.owner_id == u.id) or u.is_superuser,
-            "shared_user_ids": list(v.shared_users.values_list("id", flat=True)),
-            "shared_group_ids": list(v.shared_groups.values_list("id", flat=True)),
+            "shared_user_ids": [x.id for x in v.shared_users.all()],
+            "shared_group_ids": [x.id for x in v.shared_groups.all()],
             "updated_at": v.updated_at.isoformat(),
             "token": v.share_token,
         })
-
-    return JsonResponse({"ok": True, "views": views_payload, "trace_id": trace_id})
+    return views_payload
 
 
 @login_required
@@ -1034,6 +1276,7 @@ def saved_views_save(request):
 
     sv.is_default = is_default
     sv.save()  # garante share_token e default único
+    _saved_views_bump(bi.pk)
 
     apply_url = request.build_absolute_uri(
         reverse("bi:bi_report_detail", args=[bi.pk]) + f"?view={sv.share_token}"
@@ -1130,7 +1373,9 @@ def saved_views_delete(request):
     if sv.owner != request.user and not request.user.is_superuser:
         return JsonResponse({"error": "forbidden", "trace_id": trace_id}, status=403)
 
+    bi_pk = sv.bi_report_id
     sv.delete()
+    _saved_views_bump(bi_pk)
     return JsonResponse({"ok": True, "trace_id": trace_id})
 
 
@@ -1157,6 +1402,7 @@ def saved_views_set_default(request):
 
     sv.is_default = True
     sv.save()
+    _saved_views_bump(sv.bi_report_id)
     return JsonResponse({"ok": True, "trace_id": trace_id})
 
 
@@ -1253,6 +1499,7 @@ def saved_views_update(request):
 
     sv.is_default = bool(is_default)
     sv.save()  # (no seu modelo já garante share_token e default único)
+    _saved_views_bump(bi.pk)
 
     apply_url = request.build_absolute_uri(
         reverse("bi:bi_report_detail", args=[bi.pk]) + f"?view={sv.share_token}"
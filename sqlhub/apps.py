@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SqlhubConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sqlhub'
+
+    def ready(self):
+        import sqlhub.signals  # Invalidação do pool de conexões
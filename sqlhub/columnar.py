@@ -0,0 +1,201 @@
+# sqlhub/columnar.py – exportação colunar (Parquet / Arrow IPC) a partir dos lotes do cursor
+"""
+Os lotes (colunas, linhas) vindos do fetchmany são agrupados em blocos de
+SQLHUB_COLUMNAR_ROW_GROUP_ROWS linhas e convertidos em RecordBatch do Arrow; cada bloco
+vira um row group do Parquet ou uma mensagem do stream IPC, comprimidos
+(SQLHUB_COLUMNAR_COMPRESSION). A memória fica limitada a um bloco.
+
+O schema é inferido no primeiro bloco e fixado: coluna só com NULL ou com tipo que o
+Arrow não conhece (UUID, etc.) vira texto. Texto com poucos valores distintos vai com
+dictionary encoding (no Parquet o próprio formato já faz isso por coluna).
+"""
+from __future__ import annotations
+
+from contextlib import closing, nullcontext
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pa_ipc = pq = None
+
+COLUMNAR_ROW_GROUP_ROWS = int(getattr(settings, "SQLHUB_COLUMNAR_ROW_GROUP_ROWS", 65536))
+COLUMNAR_COMPRESSION = str(getattr(settings, "SQLHUB_COLUMNAR_COMPRESSION", "zstd"))
+COLUMNAR_DICTIONARY_MAX_RATIO = float(getattr(settings, "SQLHUB_COLUMNAR_DICTIONARY_MAX_RATIO", 0.5))
+
+PARQUET_CONTENT_TYPE = "application/vnd.apache.parquet"
+ARROW_STREAM_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
+Batches = Iterable[Tuple[List[str], List[Any]]]
+
+
+def _closing(batches):
+    # gerador do cursor: fechar aborta o comando no banco se o cliente desconectar
+    return closing(batches) if hasattr(batches, "close") else nullcontext(batches)
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def _require() -> None:
+    if pa is None:
+        raise ImportError("pyarrow não está instalado.")
+
+
+class _Sink:
+    """Arquivo só de escrita que acumula os bytes até o próximo drain (para o StreamingHttpResponse)."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def writable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts = []
+        return out
+
+
+# =========================
+# Linhas → RecordBatch
+# =========================
+
+def _as_text(values: List[Any]) -> List[Optional[str]]:
+    return [None if v is None else (bytes(v).hex() if isinstance(v, (bytes, bytearray, memoryview)) else str(v))
+            for v in values]
+
+
+def _infer_field(name: str, values: List[Any], dictionary: bool):
+    try:
+        arr = pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError, OverflowError):
+        arr = pa.array(_as_text(values), type=pa.string())
+
+    typ = arr.type
+    if pa.types.is_null(typ):
+        typ = pa.string()
+    elif pa.types.is_decimal(typ):
+        # precisão vem só do 1º bloco: alarga para caber os próximos
+        typ = pa.decimal128(38, typ.scale) if typ.precision <= 38 else pa.decimal256(76, typ.scale)
+    elif pa.types.is_large_string(typ):
+        typ = pa.string()
+
+    if dictionary and pa.types.is_string(typ) and len(arr):
+        distinct = len(pa.compute.unique(arr))
+        if distinct <= max(1, len(arr) * COLUMNAR_DICTIONARY_MAX_RATIO):
+            typ = pa.dictionary(pa.int32(), pa.string())
+    return pa.field(name, typ)
+
+
+def _to_array(field, values: List[Any]):
+    typ = field.type
+    if pa.types.is_dictionary(typ):
+        return _to_array(pa.field(field.name, typ.value_type), values).dictionary_encode()
+    try:
+        return pa.array(values, type=typ)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError, OverflowError):
+        if pa.types.is_string(typ):
+            return pa.array(_as_text(values), type=typ)
+        raise ValueError(f"Coluna '{field.name}' mudou de tipo no meio do resultado ({typ}).")
+
+
+def _unique_names(columns: List[str]) -> List[str]:
+    seen: dict = {}
+    out = []
+    for i, c in enumerate(columns):
+        name = str(c) if c not in (None, "") else f"col_{i + 1}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}_{seen[name]}"
+        else:
+            seen[name] = 0
+        out.append(name)
+    return out
+
+
+def iter_record_batches(batches: Batches, *, dictionary: bool = False) -> Iterator[Any]:
+    """
+    RecordBatch de até COLUMNAR_ROW_GROUP_ROWS linhas, todos com o schema do primeiro bloco.
+    Resultado vazio ainda produz um batch vazio (colunas como texto).
+    """
+    _require()
+    schema = None
+    names: List[str] = []
+    pending: List[Any] = []
+
+    def to_batch(rows: List[Any]):
+        nonlocal schema
+        cols = [list(c) for c in zip(*rows)] if rows else [[] for _ in names]
+        if schema is None:
+            schema = pa.schema([_infer_field(n, c, dictionary) for n, c in zip(names, cols)])
+        return pa.record_batch([_to_array(f, c) for f, c in zip(schema, cols)], schema=schema)
+
+    for columns, rows in batches:
+        if not names:
+            names = _unique_names(list(columns))
+        pending.extend(rows)
+        while len(pending) >= COLUMNAR_ROW_GROUP_ROWS:
+            head, pending = pending[:COLUMNAR_ROW_GROUP_ROWS], pending[COLUMNAR_ROW_GROUP_ROWS:]
+            yield to_batch(head)
+    if pending or schema is None:
+        yield to_batch(pending)
+
+
+# =========================
+# Writers
+# =========================
+
+def iter_parquet(batches: Batches) -> Iterator[bytes]:
+    """Parquet em streaming: um row group por bloco, enviado assim que escrito (footer no fim)."""
+    _require()
+    sink, writer = _Sink(), None
+    with _closing(batches) as it:
+        for rb in iter_record_batches(it):
+            if writer is None:
+                writer = pq.ParquetWriter(sink, rb.schema, compression=COLUMNAR_COMPRESSION, use_dictionary=True)
+            writer.write_batch(rb, row_group_size=COLUMNAR_ROW_GROUP_ROWS)
+            data = sink.drain()
+            if data:
+                yield data
+    writer.close()
+    yield sink.drain()
+
+
+def iter_arrow_stream(batches: Batches) -> Iterator[bytes]:
+    """Arrow IPC (formato stream), com compressão por buffer e dictionary encoding no texto."""
+    _require()
+    sink, writer = _Sink(), None
+    options = pa_ipc.IpcWriteOptions(compression=COLUMNAR_COMPRESSION)
+    with _closing(batches) as it:
+        for rb in iter_record_batches(it, dictionary=True):
+            if writer is None:
+                writer = pa_ipc.new_stream(sink, rb.schema, options=options)
+            writer.write_batch(rb)
+            data = sink.drain()
+            if data:
+                yield data
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,168 @@
+# sqlhub/counts.py – contagem de linhas: estimativa pelo plano + contagem exata assíncrona em cache
+"""
+`SELECT COUNT(*) FROM (<consulta>) t` custa o mesmo que rodar a consulta. Para a tela:
+
+1. contagem exata em cache (Django cache, chave = hash de conexão + versão, SQL normalizado e
+   filtros; TTL SQLHUB_COUNT_CACHE_TTL_S) → devolvida direto;
+2. senão, estimativa do otimizador, sem executar a consulta: PostgreSQL `EXPLAIN (FORMAT JSON)`
+   ("Plan Rows"), MySQL `EXPLAIN` (rows × filtered do SELECT externo), SQL Server plano estimado
+   (`SET SHOWPLAN_XML ON`, StatementEstRows). Firebird não tem → None;
+3. a contagem exata vai para um QueryJob KIND_COUNT no worker; ao terminar, jobs.run grava no
+   cache (remember). Pedidos repetidos do mesmo usuário reaproveitam o job em andamento.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import re
+from typing import Any, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import DBConnection, DBEngine, QueryJob, QueryJobStatus
+from .pool import connection_version
+
+logger = logging.getLogger(__name__)
+
+COUNT_CACHE_TTL_S = int(getattr(settings, "SQLHUB_COUNT_CACHE_TTL_S", 600))
+COUNT_ESTIMATE_TIMEOUT_S = int(getattr(settings, "SQLHUB_COUNT_ESTIMATE_TIMEOUT_S", 10))
+COUNT_JOB_REUSE_S = int(getattr(settings, "SQLHUB_COUNT_JOB_REUSE_S", 3600))
+
+_WS_RE = re.compile(r"\s+")
+_MSSQL_EST_RE = re.compile(r'StatementEstRows="([0-9.eE+-]+)"')
+
+
+# =========================
+# Cache da contagem exata
+# =========================
+
+def count_key(conn: DBConnection, sql_text: str, filters: Optional[list]) -> str:
+    payload = {
+        "c": conn.pk,
+        "cv": connection_version(conn),
+        "sql": _WS_RE.sub(" ", (sql_text or "").strip().rstrip(";")),
+        "f": filters or [],
+    }
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), cls=DjangoJSONEncoder)
+    return "sqlhub:count:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cached(conn: DBConnection, sql_text: str, filters: Optional[list]) -> Optional[int]:
+    try:
+        return cache.get(count_key(conn, sql_text, filters))
+    except Exception:
+        return None
+
+
+def remember(conn: DBConnection, sql_text: str, filters: Optional[list], total: int) -> None:
+    try:
+        cache.set(count_key(conn, sql_text, filters), int(total), COUNT_CACHE_TTL_S)
+    except Exception:
+        logger.warning("sqlhub: não foi possível gravar a contagem no cache", exc_info=True)
+
+
+# =========================
+# Estimativa pelo plano
+# =========================
+
+def _plan_json(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value).decode("utf-8")
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def _estimate_postgres(cur, sql: str, params: List[Any]) -> Optional[int]:
+    cur.execute(f"EXPLAIN (FORMAT JSON) {sql}", params or None)
+    row = cur.fetchone()
+    plan = _plan_json(row[0]) if row else None
+    if not plan:
+        return None
+    return int(round(float(plan[0]["Plan"]["Plan Rows"])))
+
+
+def _estimate_mysql(cur, sql: str, params: List[Any]) -> Optional[int]:
+    cur.execute(f"EXPLAIN {sql}", params or None)
+    rows = cur.fetchall()
+    names = [str(d[0]).lower() for d in (cur.description or [])]
+    if not rows or "rows" not in names:
+        return None
+    i_id, i_rows = names.index("id"), names.index("rows")
+    i_filtered = names.index("filtered") if "filtered" in names else None
+    top = min(r[i_id] for r in rows if r[i_id] is not None)
+    total = 1.0
+    # junções do SELECT externo: nested loop → produto de rows × filtered%
+    for r in rows:
+        if r[i_id] != top or r[i_rows] is None:
+            continue
+        pct = float(r[i_filtered]) / 100.0 if i_filtered is not None and r[i_filtered] is not None else 1.0
+        total *= float(r[i_rows]) * pct
+    return int(round(total))
+
+
+def _estimate_mssql(cur, sql: str, params: List[Any]) -> Optional[int]:
+    cur.execute("SET SHOWPLAN_XML ON")
+    try:
+        if params:
+            cur.execute(sql, params)
+        else:
+            cur.execute(sql)
+        row = cur.fetchone()
+    finally:
+        cur.execute("SET SHOWPLAN_XML OFF")
+    m = _MSSQL_EST_RE.search(str(row[0])) if row else None
+    return int(round(float(m.group(1)))) if m else None
+
+
+_ESTIMATORS = {
+    DBEngine.POSTGRES: _estimate_postgres,
+    DBEngine.MYSQL: _estimate_mysql,
+    DBEngine.SQLSERVER: _estimate_mssql,
+}
+
+
+def supports_estimate(engine: str) -> bool:
+    return engine in _ESTIMATORS
+
+
+def estimate(engine: str, cur, sql: str, params: Optional[List[Any]] = None) -> Optional[int]:
+    """Linhas estimadas pelo otimizador (a consulta não roda). Levanta se o EXPLAIN falhar."""
+    fn = _ESTIMATORS.get(engine)
+    if fn is None:
+        return None
+    return fn(cur, sql, list(params or []))
+
+
+# =========================
+# Contagem exata (job)
+# =========================
+
+def _job_key(user, key: str) -> str:
+    return f"{key}:job:{getattr(user, 'pk', '')}"
+
+
+def exact_job(user, conn: DBConnection, sql_text: str, filters: Optional[list]) -> QueryJob:
+    """Job KIND_COUNT em andamento para a mesma contagem, ou um novo (concluído já está no cache)."""
+    from . import jobs
+
+    key = _job_key(user, count_key(conn, sql_text, filters))
+    try:
+        job_id = cache.get(key)
+    except Exception:
+        job_id = None
+    if job_id:
+        job = QueryJob.objects.filter(
+            pk=job_id, created_by=user, status__in=(QueryJobStatus.QUEUED, QueryJobStatus.RUNNING)
+        ).first()
+        if job is not None:
+            return job
+
+    job = jobs.submit(user, conn, sql_text, filters or [], kind=QueryJob.KIND_COUNT)
+    if job.status != QueryJobStatus.FAILED:
+        try:
+            cache.set(key, str(job.pk), COUNT_JOB_REUSE_S)
+        except Exception:
+            pass
+    return job
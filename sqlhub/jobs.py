@@ -0,0 +1,327 @@
+# sqlhub/jobs.py – jobs assíncronos de consulta: submissão, execução no worker, spool e leitura
+"""
+O request web só cria o QueryJob e agenda `run_query_job` no Celery; nunca espera o banco
+de origem. O worker executa o SELECT (ou COUNT) e grava as linhas em lotes de
+SQLHUB_JOB_CHUNK_ROWS no spool local (um .json.gz por lote, escrito de forma atômica);
+`rows_done` só avança depois que o lote está em disco, então quem lê nunca pega lote pela metade.
+Decimal, datas, bytes e UUID vão marcados no JSON e voltam com o tipo original, para a
+exportação (xlsx/parquet/arrow) gerar colunas tipadas como a exportação direta.
+
+Cancelamento: a flag vai para o cache (e para o banco); um watchdog no worker a vê em
+~SQLHUB_JOB_CANCEL_POLL_S e cancela o comando no servidor (pool.cancel_statement).
+
+O spool precisa ser visível para web e worker (mesmo host ou volume compartilhado).
+"""
+from __future__ import annotations
+
+import base64
+import datetime as dt
+import decimal
+import gzip
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from typing import Any, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+
+from .models import DBConnection, DBEngine, QueryJob, QueryJobStatus
+from .pool import apply_statement_timeout, borrow, cancel_statement
+
+logger = logging.getLogger(__name__)
+
+JOB_SPOOL_DIR = str(getattr(settings, "SQLHUB_JOB_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "sqlhub_jobs")))
+JOB_CHUNK_ROWS = int(getattr(settings, "SQLHUB_JOB_CHUNK_ROWS", 5000))
+JOB_MAX_ROWS = int(getattr(settings, "SQLHUB_JOB_MAX_ROWS", 1_000_000))
+JOB_CANCEL_POLL_S = float(getattr(settings, "SQLHUB_JOB_CANCEL_POLL_S", 1.0))
+JOB_RETENTION_H = int(getattr(settings, "SQLHUB_JOB_RETENTION_H", 24))
+JOB_STATEMENT_TIMEOUT_S = int(getattr(settings, "SQLHUB_JOB_STATEMENT_TIMEOUT_S", 3600))
+
+_FINAL = (QueryJobStatus.DONE, QueryJobStatus.FAILED, QueryJobStatus.CANCELED)
+
+
+class JobCanceled(Exception):
+    pass
+
+
+# =========================
+# Spool
+# =========================
+
+def spool_dir(job_id) -> str:
+    return os.path.join(JOB_SPOOL_DIR, str(job_id))
+
+
+def _chunk_path(job_id, idx: int) -> str:
+    return os.path.join(spool_dir(job_id), f"{idx:06d}.json.gz")
+
+
+_TYPE_TAG = "__sqlhub_t"
+
+# tipo → (marca, serialização); a ordem importa: datetime é subclasse de date
+_SPOOL_TYPES = (
+    (decimal.Decimal, "dec", str),
+    (dt.datetime, "dt", lambda v: v.isoformat()),
+    (dt.date, "d", lambda v: v.isoformat()),
+    (dt.time, "t", lambda v: v.isoformat()),
+    (dt.timedelta, "td", lambda v: v.total_seconds()),
+    ((bytes, bytearray, memoryview), "b", lambda v: base64.b64encode(bytes(v)).decode("ascii")),
+    (uuid.UUID, "uuid", str),
+)
+_SPOOL_DECODERS = {
+    "dec": decimal.Decimal,
+    "dt": dt.datetime.fromisoformat,
+    "d": dt.date.fromisoformat,
+    "t": dt.time.fromisoformat,
+    "td": lambda v: dt.timedelta(seconds=v),
+    "b": base64.b64decode,
+    "uuid": uuid.UUID,
+}
+
+
+class _SpoolEncoder(json.JSONEncoder):
+    """Marca os tipos que o JSON não tem ({"__sqlhub_t": marca, "v": valor}); o resto vira texto."""
+
+    def default(self, o):
+        for types, tag, dump in _SPOOL_TYPES:
+            if isinstance(o, types):
+                return {_TYPE_TAG: tag, "v": dump(o)}
+        return str(o)
+
+
+def _spool_hook(obj: dict) -> Any:
+    tag = obj.get(_TYPE_TAG)
+    if tag not in _SPOOL_DECODERS or len(obj) != 2:
+        return obj
+    return _SPOOL_DECODERS[tag](obj["v"])
+
+
+def _write_chunk(job_id, idx: int, rows: List[List[Any]]) -> None:
+    path = _chunk_path(job_id, idx)
+    tmp = f"{path}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=5) as fh:
+        json.dump(rows, fh, separators=(",", ":"), cls=_SpoolEncoder)
+    os.replace(tmp, path)
+
+
+def _read_chunk(job_id, idx: int) -> List[List[Any]]:
+    try:
+        with gzip.open(_chunk_path(job_id, idx), "rt", encoding="utf-8") as fh:
+            return json.load(fh, object_hook=_spool_hook)
+    except FileNotFoundError:
+        return []
+
+
+def read_page(job: QueryJob, offset: int, limit: int) -> Tuple[List[List[Any]], bool]:
+    """Linhas [offset, offset+limit) do spool: abre só os lotes que cobrem a página."""
+    offset, limit = max(0, int(offset)), max(1, int(limit))
+    size = job.chunk_rows or JOB_CHUNK_ROWS
+    rows: List[List[Any]] = []
+    pos = offset
+    while len(rows) < limit and pos < job.rows_done:
+        chunk = _read_chunk(job.pk, pos // size)
+        take = chunk[pos % size: pos % size + (limit - len(rows))]
+        if not take:
+            break
+        rows.extend(take)
+        pos += len(take)
+    has_more = pos < job.rows_done or job.status in (QueryJobStatus.QUEUED, QueryJobStatus.RUNNING)
+    return rows, has_more
+
+
+def iter_rows(job: QueryJob) -> Iterator[List[List[Any]]]:
+    """Lotes do spool em ordem (para exportação)."""
+    size = job.chunk_rows or JOB_CHUNK_ROWS
+    for idx in range((job.rows_done + size - 1) // size):
+        yield _read_chunk(job.pk, idx)
+
+
+# =========================
+# Submissão / cancelamento (lado web)
+# =========================
+
+def _cancel_key(job_id) -> str:
+    return f"sqlhub:job:{job_id}:cancel"
+
+
+def submit(user, conn: DBConnection, sql_text: str, filters: list, kind: str = QueryJob.KIND_SELECT) -> QueryJob:
+    from .views import _validate_select
+
+    _validate_select(sql_text)
+    job = QueryJob.objects.create(
+        connection=conn, kind=kind, sql_text=sql_text, filters=filters or [], created_by=user,
+    )
+    try:
+        from .tasks import run_query_job
+        run_query_job.delay(str(job.pk))
+    except Exception:
+        logger.warning("sqlhub: não foi possível agendar o job %s", job.pk, exc_info=True)
+        QueryJob.objects.filter(pk=job.pk).update(
+            status=QueryJobStatus.FAILED, error="Fila de execução indisponível.", finished_at=timezone.now()
+        )
+        job.refresh_from_db()
+    return job
+
+
+def request_cancel(job: QueryJob) -> None:
+    QueryJob.objects.filter(pk=job.pk, status__in=(QueryJobStatus.QUEUED, QueryJobStatus.RUNNING)) \
+        .update(cancel_requested=True)
+    try:
+        cache.set(_cancel_key(job.pk), 1, 3600)
+    except Exception:
+        pass
+    # ainda na fila: encerra aqui; o worker ignora ao pegar
+    QueryJob.objects.filter(pk=job.pk, status=QueryJobStatus.QUEUED) \
+        .update(status=QueryJobStatus.CANCELED, finished_at=timezone.now())
+
+
+def _cancel_wanted(job_id, *, check_db: bool = True) -> bool:
+    try:
+        if cache.get(_cancel_key(job_id)):
+            return True
+    except Exception:
+        check_db = True
+    return check_db and QueryJob.objects.filter(pk=job_id, cancel_requested=True).exists()
+
+
+# =========================
+# Execução (worker)
+# =========================
+
+def _watchdog(job_id, conn: DBConnection, py_conn, cur, stop: threading.Event, canceled: threading.Event) -> None:
+    """Roda ao lado do execute/fetch: ao ver o pedido de cancelamento, aborta o comando no servidor."""
+    ticks = 0
+    try:
+        while not stop.wait(JOB_CANCEL_POLL_S):
+            ticks += 1
+            if _cancel_wanted(job_id, check_db=(ticks % 5 == 0)):
+                canceled.set()
+                cancel_statement(conn, py_conn, cur)
+                return
+    finally:
+        connections.close_all()  # conexões Django abertas por esta thread
+
+
+def _streaming_cursor(conn: DBConnection, py_conn):
+    """Cursor do lado do servidor onde o driver bufferiza tudo por padrão (psycopg2, PyMySQL)."""
+    if conn.engine == DBEngine.POSTGRES:
+        return py_conn.cursor(name=f"sqlhub_job_{uuid.uuid4().hex[:12]}")
+    if conn.engine == DBEngine.MYSQL:
+        import pymysql.cursors
+        return py_conn.cursor(pymysql.cursors.SSCursor)
+    return py_conn.cursor()
+
+
+def run(job_id) -> None:
+    from .views import _build_sql_with_filters
+
+    claimed = QueryJob.objects.filter(pk=job_id, status=QueryJobStatus.QUEUED) \
+        .update(status=QueryJobStatus.RUNNING, started_at=timezone.now())
+    if not claimed:
+        return  # cancelado na fila ou já pego por outro worker
+    job = QueryJob.objects.select_related("connection").get(pk=job_id)
+    conn = job.connection
+
+    stop, canceled = threading.Event(), threading.Event()
+    py_conn = cur = watchdog = timer = None
+    try:
+        final_sql, params = _build_sql_with_filters(job.sql_text, conn.engine, job.filters or [])
+        py_conn = borrow(conn)
+        if job.kind == QueryJob.KIND_COUNT:
+            final_sql = f"SELECT COUNT(*) FROM ({final_sql}) t"
+            cur = py_conn.cursor()
+        else:
+            cur = _streaming_cursor(conn, py_conn)
+        timer = apply_statement_timeout(conn, py_conn, cur, JOB_STATEMENT_TIMEOUT_S)
+        watchdog = threading.Thread(
+            target=_watchdog, args=(job.pk, conn, py_conn, cur, stop, canceled),
+            name=f"sqlhub-job-{job.pk}", daemon=True,
+        )
+        watchdog.start()
+
+        if params:
+            cur.execute(final_sql, params)
+        else:
+            cur.execute(final_sql)
+
+        if job.kind == QueryJob.KIND_COUNT:
+            row = cur.fetchone()
+            total = int(row[0]) if row else 0
+            QueryJob.objects.filter(pk=job.pk).update(
+                status=QueryJobStatus.DONE, result={"count": total}, finished_at=timezone.now()
+            )
+            from .counts import remember
+            remember(conn, job.sql_text, job.filters, total)
+            return
+
+        os.makedirs(spool_dir(job.pk), exist_ok=True)
+        done = idx = 0
+        truncated = False
+        batch = cur.fetchmany(min(JOB_CHUNK_ROWS, JOB_MAX_ROWS))
+        # cursor nomeado do psycopg2 só preenche description depois do 1º fetch
+        columns = [d[0] for d in (cur.description or [])]
+        QueryJob.objects.filter(pk=job.pk).update(columns=columns, chunk_rows=JOB_CHUNK_ROWS)
+        while batch:
+            if canceled.is_set():
+                raise JobCanceled()
+            _write_chunk(job.pk, idx, [list(r) for r in batch])
+            idx += 1
+            done += len(batch)
+            QueryJob.objects.filter(pk=job.pk).update(rows_done=done)
+            if done >= JOB_MAX_ROWS:
+                truncated = cur.fetchone() is not None
+                break
+            batch = cur.fetchmany(min(JOB_CHUNK_ROWS, JOB_MAX_ROWS - done))
+        if canceled.is_set():
+            raise JobCanceled()
+
+        QueryJob.objects.filter(pk=job.pk).update(
+            status=QueryJobStatus.DONE, truncated=truncated, finished_at=timezone.now()
+        )
+    except Exception as e:
+        if canceled.is_set() or _cancel_wanted(job.pk):
+            if py_conn is not None:
+                getattr(py_conn, "invalidate", lambda: None)()  # sessão cancelada não volta ao pool
+            QueryJob.objects.filter(pk=job.pk).update(status=QueryJobStatus.CANCELED, finished_at=timezone.now())
+        else:
+            logger.warning("sqlhub: job %s falhou: %s", job.pk, e)
+            QueryJob.objects.filter(pk=job.pk).update(
+                status=QueryJobStatus.FAILED, error=str(e)[:2000], finished_at=timezone.now()
+            )
+    finally:
+        stop.set()
+        if timer is not None:
+            timer.stop()
+        if watchdog is not None:
+            watchdog.join(timeout=5)
+        for obj in (cur, py_conn):
+            try:
+                if obj is not None:
+                    obj.close()
+            except Exception:
+                pass
+
+
+# =========================
+# Retenção
+# =========================
+
+def purge_old_jobs(hours: Optional[int] = None) -> int:
+    """Apaga jobs (e spool) criados há mais de `hours` horas; presos em execução viram FAILED antes."""
+    hours = JOB_RETENTION_H if hours is None else int(hours)
+    horizon = timezone.now() - dt.timedelta(hours=hours)
+    old = QueryJob.objects.filter(created_at__lt=horizon)
+    old.exclude(status__in=_FINAL).update(
+        status=QueryJobStatus.FAILED, error="Expirado sem concluir.", finished_at=timezone.now()
+    )
+    ids = list(old.values_list("pk", flat=True))
+    for job_id in ids:
+        shutil.rmtree(spool_dir(job_id), ignore_errors=True)
+    return QueryJob.objects.filter(pk__in=ids).delete()[0] if ids else 0
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-19 11:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sqlhub', '0011_alter_dbconnection_options_alter_savedquery_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dbconnection',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_column='atualizado_em', default=django.utils.timezone.now, verbose_name='Atualizado em'),
+            preserve_default=False,
+        ),
+    ]
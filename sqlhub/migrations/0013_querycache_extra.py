@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-19 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sqlhub', '0012_dbconnection_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='querycache',
+            name='extra',
+            field=models.JSONField(blank=True, db_column='extra', default=dict, verbose_name='Extra'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.2 on 2026-10-19 16:20
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sqlhub', '0013_querycache_extra'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('select', 'Linhas'), ('count', 'Contagem')], db_column='tipo', default='select', max_length=10, verbose_name='Tipo')),
+                ('sql_text', models.TextField(db_column='sql_texto', verbose_name='SQL')),
+                ('filters', models.JSONField(blank=True, db_column='filtros', default=list, verbose_name='Filtros')),
+                ('status', models.CharField(choices=[('queued', 'Na fila'), ('running', 'Executando'), ('done', 'Concluído'), ('failed', 'Falhou'), ('canceled', 'Cancelado')], db_column='situacao', db_index=True, default='queued', max_length=10, verbose_name='Situação')),
+                ('columns', models.JSONField(blank=True, db_column='colunas', default=list, verbose_name='Colunas')),
+                ('rows_done', models.PositiveIntegerField(db_column='linhas_gravadas', default=0, verbose_name='Linhas gravadas')),
+                ('chunk_rows', models.PositiveIntegerField(db_column='linhas_por_lote', default=0, verbose_name='Linhas por lote')),
+                ('truncated', models.BooleanField(db_column='truncado', default=False, verbose_name='Truncado')),
+                ('result', models.JSONField(blank=True, db_column='resultado', default=dict, verbose_name='Resultado')),
+                ('error', models.TextField(blank=True, db_column='erro', default='', verbose_name='Erro')),
+                ('cancel_requested', models.BooleanField(db_column='cancelar', default=False, verbose_name='Cancelamento pedido')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_column='criado_em', db_index=True, verbose_name='Criado em')),
+                ('started_at', models.DateTimeField(blank=True, db_column='iniciado_em', null=True, verbose_name='Iniciado em')),
+                ('finished_at', models.DateTimeField(blank=True, db_column='finalizado_em', null=True, verbose_name='Finalizado em')),
+                ('connection', models.ForeignKey(db_column='conexao_id', on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='sqlhub.dbconnection', verbose_name='Conexão')),
+                ('created_by', models.ForeignKey(db_column='criado_por_id', on_delete=django.db.models.deletion.CASCADE, related_name='sqlhub_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Criado por')),
+            ],
+            options={
+                'verbose_name': 'Job de consulta',
+                'verbose_name_plural': 'Jobs de consulta',
+                'db_table': 'sqlhub_job_consulta',
+                'ordering': ['-created_at'],
+                'permissions': [],
+                'default_permissions': (),
+            },
+        ),
+    ]
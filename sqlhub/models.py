@@ -1,4 +1,6 @@
 # sqlhub/models.py
+import uuid
+
 from django.db import models
 from django.conf import settings
 from .fields import EncryptedTextField
@@ -71,6 +73,8 @@ class DBConnection(models.Model):
         db_column="criado_por_id",
     )
     created_at = models.DateTimeField("Criado em", auto_now_add=True, db_column="criado_em")
+    # versão da conexão: o pool (sqlhub.pool) descarta conexões abertas com dados antigos
+    updated_at = models.DateTimeField("Atualizado em", auto_now=True, db_column="atualizado_em")
 
     class Meta:
         ordering = ["-created_at"]
@@ -143,6 +147,7 @@ class QueryCache(models.Model):
     params_hash = models.CharField("Hash dos parâmetros", max_length=64, db_index=True, db_column="hash_parametros")
     rows = models.JSONField("Linhas", default=list, blank=True, db_column="linhas")  # [[v1,v2,...],...]
     columns = models.JSONField("Colunas", default=list, blank=True, db_column="colunas")  # ["col","col2",...]
+    extra = models.JSONField("Extra", default=dict, blank=True, db_column="extra")  # {"has_more":..., "next_cursor":...}
     expires_at = models.DateTimeField("Expira em", db_index=True, db_column="expira_em")
 
     class Meta:
@@ -158,3 +163,70 @@ class QueryCache(models.Model):
 
     def __str__(self) -> str:  # pragma: no cover
         return f"Cache {self.query_id} #{self.params_hash[:8]}..."
+
+
+class QueryJobStatus(models.TextChoices):
+    QUEUED = ("queued", "Na fila")
+    RUNNING = ("running", "Executando")
+    DONE = ("done", "Concluído")
+    FAILED = ("failed", "Falhou")
+    CANCELED = ("canceled", "Cancelado")
+
+
+class QueryJob(models.Model):
+    """
+    Execução assíncrona (Celery) de um SELECT ad-hoc. O worker grava o resultado em lotes
+    no spool local (sqlhub.jobs); o navegador acompanha o progresso e lê páginas do spool.
+    """
+    KIND_SELECT = "select"
+    KIND_COUNT = "count"
+    KIND_CHOICES = [(KIND_SELECT, "Linhas"), (KIND_COUNT, "Contagem")]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    connection = models.ForeignKey(
+        DBConnection,
+        on_delete=models.CASCADE,
+        related_name="jobs",
+        verbose_name="Conexão",
+        db_column="conexao_id",
+    )
+    kind = models.CharField("Tipo", max_length=10, choices=KIND_CHOICES, default=KIND_SELECT, db_column="tipo")
+    sql_text = models.TextField("SQL", db_column="sql_texto")
+    filters = models.JSONField("Filtros", default=list, blank=True, db_column="filtros")
+    status = models.CharField(
+        "Situação", max_length=10, choices=QueryJobStatus.choices, default=QueryJobStatus.QUEUED,
+        db_index=True, db_column="situacao",
+    )
+    columns = models.JSONField("Colunas", default=list, blank=True, db_column="colunas")
+    rows_done = models.PositiveIntegerField("Linhas gravadas", default=0, db_column="linhas_gravadas")
+    chunk_rows = models.PositiveIntegerField("Linhas por lote", default=0, db_column="linhas_por_lote")
+    truncated = models.BooleanField("Truncado", default=False, db_column="truncado")
+    result = models.JSONField("Resultado", default=dict, blank=True, db_column="resultado")  # ex.: {"count": 123}
+    error = models.TextField("Erro", blank=True, default="", db_column="erro")
+    cancel_requested = models.BooleanField("Cancelamento pedido", default=False, db_column="cancelar")
+
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="sqlhub_jobs",
+        verbose_name="Criado por",
+        db_column="criado_por_id",
+    )
+    created_at = models.DateTimeField("Criado em", auto_now_add=True, db_index=True, db_column="criado_em")
+    started_at = models.DateTimeField("Iniciado em", null=True, blank=True, db_column="iniciado_em")
+    finished_at = models.DateTimeField("Finalizado em", null=True, blank=True, db_column="finalizado_em")
+
+    class Meta:
+        db_table = "sqlhub_job_consulta"
+        ordering = ["-created_at"]
+        default_permissions = ()
+        permissions = []
+        verbose_name = "Job de consulta"
+        verbose_name_plural = "Jobs de consulta"
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"Job {self.pk} ({self.status})"
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (QueryJobStatus.DONE, QueryJobStatus.FAILED, QueryJobStatus.CANCELED)
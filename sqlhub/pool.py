@@ -0,0 +1,490 @@
+# sqlhub/pool.py – pool de conexões DBAPI por DBConnection (processo inteiro)
+"""
+Cada DBConnection ganha um pool próprio, identificado por (id, updated_at): editar a
+conexão gera nova versão e o pool antigo é descartado (signals + checagem de versão).
+
+- checkout reaproveita conexões ociosas; se ficaram paradas mais que SQLHUB_POOL_PING_AFTER_S,
+  passam por um SELECT 1 antes de voltar ao uso (quebradas são descartadas);
+- devolução faz rollback (encerra snapshot/locks de leitura) e guarda a conexão;
+- ociosas além de SQLHUB_POOL_IDLE_TIMEOUT_S são fechadas, mantendo SQLHUB_POOL_MIN_SIZE;
+- no máximo SQLHUB_POOL_MAX_SIZE conexões por DBConnection; excedente espera
+  até SQLHUB_POOL_CHECKOUT_TIMEOUT_S.
+
+O objeto devolvido imita a conexão do driver: `close()` devolve ao pool em vez de fechar.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.http import Http404
+
+from .models import DBConnection, DBEngine
+
+logger = logging.getLogger(__name__)
+
+POOL_ENABLED = bool(getattr(settings, "SQLHUB_POOL_ENABLED", True))
+POOL_MIN_SIZE = int(getattr(settings, "SQLHUB_POOL_MIN_SIZE", 1))
+POOL_MAX_SIZE = int(getattr(settings, "SQLHUB_POOL_MAX_SIZE", 5))
+POOL_IDLE_TIMEOUT_S = float(getattr(settings, "SQLHUB_POOL_IDLE_TIMEOUT_S", 300))
+POOL_CHECKOUT_TIMEOUT_S = float(getattr(settings, "SQLHUB_POOL_CHECKOUT_TIMEOUT_S", 10))
+POOL_PING_AFTER_S = float(getattr(settings, "SQLHUB_POOL_PING_AFTER_S", 5))
+# Timeout de comando (s) das telas; DBConnection.options / SavedQuery.meta["statement_timeout_s"] sobrescrevem
+STATEMENT_TIMEOUT_S = int(getattr(settings, "SQLHUB_STATEMENT_TIMEOUT_S", 60))
+
+
+class DriverMissing(Exception):
+    pass
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+# =========================
+# Abertura “crua” por engine
+# =========================
+
+def connect_raw(conn: DBConnection):
+    """Abre uma conexão nova do driver adequado (sem pool)."""
+    engine = conn.engine
+    host = conn.host or "localhost"
+    port = conn.port
+    db = (conn.database or "").strip()
+    user = conn.username
+    pwd = conn.password
+    opts: Dict[str, Any] = conn.options or {}
+
+    if engine == DBEngine.POSTGRES:
+        try:
+            import psycopg2
+        except Exception:
+            raise DriverMissing("psycopg2 não instalado.")
+        return psycopg2.connect(
+            host=host,
+            port=port or 5432,
+            dbname=db,
+            user=user,
+            password=pwd,
+            connect_timeout=opts.get("connect_timeout", 5),
+        )
+
+    if engine == DBEngine.MYSQL:
+        try:
+            import pymysql
+        except Exception:
+            raise DriverMissing("pymysql não instalado.")
+        return pymysql.connect(
+            host=host,
+            port=int(port or 3306),
+            user=user,
+            password=pwd,
+            database=db,
+            connect_timeout=int(opts.get("connect_timeout", 5)),
+            charset=opts.get("charset", "utf8mb4"),
+            cursorclass=pymysql.cursors.Cursor,
+        )
+
+    if engine == DBEngine.SQLSERVER:
+        try:
+            import pyodbc
+        except Exception:
+            raise DriverMissing("pyodbc não instalado.")
+        driver = opts.get("odbc_driver", "ODBC Driver 18 for SQL Server")
+        encrypt = opts.get("Encrypt", "yes")
+        trust = opts.get("TrustServerCertificate", "yes")
+        port_part = f",{port}" if port else ""
+        parts = [
+            f"DRIVER={{{driver}}}",
+            f"SERVER={host}{port_part}",
+            f"UID={user}",
+            f"PWD={pwd}",
+            f"Encrypt={encrypt}",
+            f"TrustServerCertificate={trust}",
+        ]
+        if db:
+            parts.append(f"DATABASE={db}")
+        cn_str = ";".join(parts) + ";"
+        return pyodbc.connect(cn_str, timeout=int(opts.get("connect_timeout", 5)))
+
+    if engine == DBEngine.FIREBIRD:
+        try:
+            from firebird.driver import connect as fb_connect
+            dsn = f"{host}/{port or 3050}:{db}" if host else db
+            return fb_connect(
+                dsn=dsn,
+                user=user,
+                password=pwd,
+                timeout=int(opts.get("connect_timeout", 5)),
+                charset=opts.get("charset", "UTF8"),
+            )
+        except Exception:
+            try:
+                import fdb
+                return fdb.connect(
+                    host=host or "localhost",
+                    port=port or 3050,
+                    database=db,
+                    user=user,
+                    password=pwd,
+                    charset=opts.get("charset", "UTF8"),
+                )
+            except Exception:
+                raise DriverMissing("firebird-driver/fdb não instalado(s).")
+
+    raise Http404("Engine não suportado.")
+
+
+def ping_sql(engine: str) -> str:
+    return "SELECT 1 FROM RDB$DATABASE" if engine == DBEngine.FIREBIRD else "SELECT 1"
+
+
+def cancel_statement(conn: DBConnection, py_conn, cur) -> bool:
+    """
+    Pede ao banco de origem que aborte o comando em execução em `py_conn`/`cur`.
+    Feito para ser chamado de outra thread (watchdog). True se o pedido foi enviado.
+    """
+    engine = conn.engine
+    try:
+        if engine == DBEngine.POSTGRES:
+            py_conn.cancel()  # psycopg2: PQcancel, seguro entre threads
+        elif engine == DBEngine.MYSQL:
+            # KILL QUERY precisa de outra sessão; a original segue viva
+            thread_id = int(py_conn.thread_id())
+            killer = connect_raw(conn)
+            try:
+                kcur = killer.cursor()
+                kcur.execute("KILL QUERY %s", (thread_id,))
+                kcur.close()
+            finally:
+                _safe_close(killer)
+        elif engine == DBEngine.SQLSERVER:
+            cur.cancel()  # pyodbc: SQLCancel
+        elif engine == DBEngine.FIREBIRD:
+            cancel = getattr(py_conn, "cancel_operation", None)  # firebird-driver (fdb não tem)
+            if cancel is None:
+                return False
+            cancel()
+        else:
+            return False
+        return True
+    except Exception:
+        logger.warning("sqlhub: falha ao cancelar comando na conexão %s", conn.pk, exc_info=True)
+        return False
+
+
+# =========================
+# Timeout de comando por engine
+# =========================
+
+def statement_timeout_for(conn: DBConnection, query=None, default: Optional[int] = None) -> int:
+    """Segundos: SavedQuery.meta > DBConnection.options > `default` (SQLHUB_STATEMENT_TIMEOUT_S). 0 = sem limite."""
+    for src in (getattr(query, "meta", None), conn.options):
+        raw = (src or {}).get("statement_timeout_s")
+        if raw not in (None, ""):
+            try:
+                return max(0, int(raw))
+            except (TypeError, ValueError):
+                logger.warning("sqlhub: statement_timeout_s inválido (%r) — ignorado.", raw)
+    return STATEMENT_TIMEOUT_S if default is None else int(default)
+
+
+class StatementTimer:
+    """Watchdog para engines sem timeout de sessão (Firebird): cancela no servidor ao estourar."""
+
+    def __init__(self, conn: DBConnection, py_conn, cur, seconds: float):
+        self.fired = False
+        self._timer = threading.Timer(seconds, self._fire, args=(conn, py_conn, cur))
+        self._timer.daemon = True
+
+    def _fire(self, conn, py_conn, cur) -> None:
+        self.fired = True
+        logger.info("sqlhub: comando na conexão %s estourou o timeout — cancelando.", conn.pk)
+        cancel_statement(conn, py_conn, cur)
+
+    def start(self) -> "StatementTimer":
+        self._timer.start()
+        return self
+
+    def stop(self) -> None:
+        self._timer.cancel()
+
+
+def apply_statement_timeout(conn: DBConnection, py_conn, cur, seconds: int) -> Optional[StatementTimer]:
+    """
+    Limita o próximo comando da sessão: statement_timeout (PostgreSQL), max_execution_time
+    (MySQL; max_statement_time no MariaDB), timeout do pyodbc (SQL Server) ou StatementTimer
+    (Firebird — devolvido para o chamador parar; conexões do pool param sozinhas ao devolver).
+    Sempre aplicado, inclusive 0, para não herdar o limite do uso anterior da conexão do pool.
+    """
+    seconds = max(0, int(seconds or 0))
+    engine = conn.engine
+    try:
+        if engine in (DBEngine.POSTGRES, DBEngine.MYSQL):
+            # cursor próprio: o do chamador pode ser nomeado/streaming (jobs)
+            c = py_conn.cursor()
+            try:
+                if engine == DBEngine.POSTGRES:
+                    c.execute(f"SET statement_timeout = {seconds * 1000}")
+                else:
+                    try:
+                        c.execute(f"SET SESSION max_execution_time = {seconds * 1000}")
+                    except Exception:
+                        c.execute(f"SET SESSION max_statement_time = {seconds}")
+            finally:
+                try: c.close()
+                except Exception: pass
+        elif engine == DBEngine.SQLSERVER:
+            getattr(py_conn, "driver_connection", py_conn).timeout = seconds
+        elif engine == DBEngine.FIREBIRD and seconds:
+            timer = StatementTimer(conn, py_conn, cur, seconds).start()
+            if isinstance(py_conn, PooledConnection):
+                py_conn.on_release(timer.stop)
+            return timer
+    except Exception:
+        logger.warning("sqlhub: não foi possível aplicar timeout de %ss na conexão %s", seconds, conn.pk, exc_info=True)
+    return None
+
+
+def _safe_close(raw) -> None:
+    try:
+        raw.close()
+    except Exception:
+        pass
+
+
+# =========================
+# Pool
+# =========================
+
+class PooledConnection:
+    """Empréstimo de uma conexão do pool; `close()` devolve em vez de fechar."""
+
+    def __init__(self, pool: "DBAPIPool", raw):
+        self._pool = pool
+        self._raw = raw
+        self._broken = False
+        self._release_hooks: list = []
+
+    @property
+    def driver_connection(self):
+        """Conexão do driver (para atributos graváveis, ex.: pyodbc.Connection.timeout)."""
+        return self._raw
+
+    def on_release(self, fn: Callable[[], None]) -> None:
+        """Chamado antes de devolver ao pool (ex.: parar o StatementTimer)."""
+        self._release_hooks.append(fn)
+
+    def cursor(self, *args, **kwargs):
+        try:
+            return self._raw.cursor(*args, **kwargs)
+        except Exception:
+            self._broken = True
+            raise
+
+    def invalidate(self) -> None:
+        """Marca a conexão como inutilizável (será fechada na devolução)."""
+        self._broken = True
+
+    def close(self) -> None:
+        hooks, self._release_hooks = self._release_hooks, []
+        for fn in hooks:
+            try:
+                fn()
+            except Exception:
+                pass
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw, broken=self._broken)
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise AttributeError(name)
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DBAPIPool:
+    def __init__(self, opener: Callable[[], Any], *, engine: str = "", min_size: int = POOL_MIN_SIZE,
+                 max_size: int = POOL_MAX_SIZE, idle_timeout_s: float = POOL_IDLE_TIMEOUT_S,
+                 checkout_timeout_s: float = POOL_CHECKOUT_TIMEOUT_S, ping_after_s: float = POOL_PING_AFTER_S):
+        self._opener = opener
+        self._engine = engine
+        self.min_size = max(0, int(min_size))
+        self.max_size = max(1, int(max_size))
+        self.idle_timeout_s = idle_timeout_s
+        self.checkout_timeout_s = checkout_timeout_s
+        self.ping_after_s = ping_after_s
+        self._idle: deque = deque()  # (raw, devolvida_em)
+        self._size = 0               # conexões abertas (ociosas + emprestadas)
+        self._closed = False
+        self._cond = threading.Condition()
+        self.stats = {"opened": 0, "reused": 0, "discarded": 0, "waited": 0}
+
+    def _ping(self, raw) -> bool:
+        try:
+            cur = raw.cursor()
+            try:
+                cur.execute(ping_sql(self._engine))
+                cur.fetchone()
+            finally:
+                try: cur.close()
+                except Exception: pass
+            return True
+        except Exception:
+            return False
+
+    def _reap_locked(self, now: float) -> list:
+        """Tira da fila as ociosas vencidas (acima do mínimo); fecha fora do lock."""
+        victims = []
+        while len(self._idle) > self.min_size and now - self._idle[0][1] > self.idle_timeout_s:
+            victims.append(self._idle.popleft()[0])
+            self._size -= 1
+        return victims
+
+    def acquire(self) -> PooledConnection:
+        deadline = time.monotonic() + self.checkout_timeout_s
+        while True:
+            raw = None
+            open_new = False
+            with self._cond:
+                if self._closed:
+                    raise PoolExhausted("pool encerrado")
+                victims = self._reap_locked(time.monotonic())
+                if self._idle:
+                    raw, since = self._idle.pop()  # LIFO: a mais “quente”
+                elif self._size < self.max_size:
+                    self._size += 1
+                    open_new = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhausted(f"sem conexão livre após {self.checkout_timeout_s:.0f}s")
+                    self.stats["waited"] += 1
+                    self._cond.wait(remaining)
+                    continue
+            for v in victims:
+                _safe_close(v)
+
+            if open_new:
+                try:
+                    raw = self._opener()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                self.stats["opened"] += 1
+                return PooledConnection(self, raw)
+
+            if time.monotonic() - since > self.ping_after_s and not self._ping(raw):
+                logger.debug("sqlhub-pool: conexão ociosa falhou no ping — descartando.")
+                self._discard(raw)
+                continue
+            self.stats["reused"] += 1
+            return PooledConnection(self, raw)
+
+    def _discard(self, raw) -> None:
+        _safe_close(raw)
+        with self._cond:
+            self._size -= 1
+            self.stats["discarded"] += 1
+            self._cond.notify()
+
+    def release(self, raw, *, broken: bool = False) -> None:
+        if not broken:
+            try:
+                raw.rollback()  # encerra a transação de leitura (snapshot/locks)
+            except Exception:
+                broken = True
+        with self._cond:
+            if not broken and not self._closed:
+                self._idle.append((raw, time.monotonic()))
+                self._cond.notify()
+                return
+        self._discard(raw)
+
+    def close(self) -> None:
+        """Fecha as ociosas; as emprestadas são fechadas quando voltarem."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for raw, _ in idle:
+            _safe_close(raw)
+
+
+# =========================
+# Registro por DBConnection
+# =========================
+
+_POOLS: Dict[int, tuple] = {}   # conn_id → (versão, DBAPIPool)
+_POOLS_LOCK = threading.Lock()
+_POOLS_PID = os.getpid()
+
+
+def connection_version(conn: DBConnection) -> str:
+    ts = getattr(conn, "updated_at", None)
+    return ts.isoformat() if ts else ""
+
+
+def _pool_for(conn: DBConnection) -> DBAPIPool:
+    global _POOLS_PID
+    version = connection_version(conn)
+    stale = None
+    with _POOLS_LOCK:
+        if _POOLS_PID != os.getpid():
+            # processo filho (fork): sockets herdados não são nossos — recomeça sem fechar
+            _POOLS.clear()
+            _POOLS_PID = os.getpid()
+        entry = _POOLS.get(conn.pk)
+        if entry and entry[0] == version:
+            return entry[1]
+        if entry:
+            stale = entry[1]
+        conn_id = conn.pk
+
+        def opener():
+            # lê a versão corrente (senha descriptografada só ao abrir conexão física)
+            fresh = DBConnection.objects.get(pk=conn_id)
+            return connect_raw(fresh)
+
+        pool = DBAPIPool(opener, engine=conn.engine)
+        _POOLS[conn.pk] = (version, pool)
+    if stale is not None:
+        logger.info("sqlhub-pool: conexão %s alterada — descartando pool antigo.", conn.pk)
+        stale.close()
+    return pool
+
+
+def borrow(conn: DBConnection):
+    """Conexão para uso imediato: do pool (padrão) ou avulsa se SQLHUB_POOL_ENABLED=False."""
+    if not POOL_ENABLED:
+        return connect_raw(conn)
+    return _pool_for(conn).acquire()
+
+
+def invalidate(conn_id: int) -> None:
+    with _POOLS_LOCK:
+        entry = _POOLS.pop(int(conn_id), None)
+    if entry:
+        entry[1].close()
+
+
+def close_all() -> None:
+    with _POOLS_LOCK:
+        entries = list(_POOLS.values())
+        _POOLS.clear()
+    for _, pool in entries:
+        pool.close()
@@ -0,0 +1,128 @@
+# sqlhub/result_cache.py – cache de resultados de consultas salvas (tabela QueryCache)
+"""
+Preview/página de uma SavedQuery com `meta["cache_ttl"]` (segundos) ficam gravados em
+QueryCache, compartilhados por todos os workers. A chave é um hash de
+(conexão + versão, consulta + versão, SQL normalizado, filtros, página/limite): editar a
+conexão ou a consulta muda a chave, e as entradas antigas apenas expiram.
+
+Hit não abre conexão com o banco de origem. Resultados grandes (SQLHUB_RESULT_CACHE_MAX_ROWS /
+_MAX_BYTES) não são gravados; cada consulta guarda no máximo
+SQLHUB_RESULT_CACHE_MAX_ENTRIES entradas. A task purge_sqlhub_query_cache apaga as vencidas.
+"""
+from __future__ import annotations
+
+import datetime as dt
+import hashlib
+import json
+import logging
+import re
+from typing import Any, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import QueryCache, SavedQuery
+from .pool import connection_version
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_DEFAULT_TTL_S = int(getattr(settings, "SQLHUB_RESULT_CACHE_DEFAULT_TTL_S", 0))  # 0 = só com meta
+RESULT_CACHE_MAX_TTL_S = int(getattr(settings, "SQLHUB_RESULT_CACHE_MAX_TTL_S", 86400))
+RESULT_CACHE_MAX_ROWS = int(getattr(settings, "SQLHUB_RESULT_CACHE_MAX_ROWS", 5000))
+RESULT_CACHE_MAX_BYTES = int(getattr(settings, "SQLHUB_RESULT_CACHE_MAX_BYTES", 2 * 1024 * 1024))
+RESULT_CACHE_MAX_ENTRIES = int(getattr(settings, "SQLHUB_RESULT_CACHE_MAX_ENTRIES", 200))
+RESULT_CACHE_PURGE_BATCH = 1000
+
+_WS_RE = re.compile(r"\s+")
+
+
+def ttl_for(query: SavedQuery) -> int:
+    """TTL (s) da consulta: meta["cache_ttl"] ou SQLHUB_RESULT_CACHE_DEFAULT_TTL_S; 0 desliga."""
+    raw = (query.meta or {}).get("cache_ttl", RESULT_CACHE_DEFAULT_TTL_S)
+    try:
+        ttl = int(raw or 0)
+    except (TypeError, ValueError):
+        return 0
+    return max(0, min(ttl, RESULT_CACHE_MAX_TTL_S))
+
+
+def make_key(query: SavedQuery, kind: str, **parts: Any) -> str:
+    """Hash estável de tudo que muda o resultado (inclui versões da conexão e da consulta)."""
+    payload = {
+        "k": kind,
+        "c": query.connection_id,
+        "cv": connection_version(query.connection),
+        "q": query.pk,
+        "qv": query.updated_at.isoformat() if query.updated_at else "",
+        "sql": _WS_RE.sub(" ", (query.sql_text or "").strip().rstrip(";")),
+        "p": parts,
+    }
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), cls=DjangoJSONEncoder)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get(query: SavedQuery, key: str) -> Optional[dict]:
+    """{"columns", "rows", **extra} da entrada válida ou None."""
+    hit = (
+        QueryCache.objects.filter(query=query, params_hash=key, expires_at__gt=timezone.now())
+        .order_by("-expires_at")
+        .values("columns", "rows", "extra")
+        .first()
+    )
+    if hit is None:
+        return None
+    return {**(hit["extra"] or {}), "columns": hit["columns"], "rows": hit["rows"]}
+
+
+def put(query: SavedQuery, key: str, columns: list, rows: list, ttl: int, **extra: Any) -> bool:
+    """Grava (substitui) a entrada; devolve False se o resultado excede os limites."""
+    if ttl <= 0 or len(rows) > RESULT_CACHE_MAX_ROWS:
+        return False
+    try:
+        # datas/Decimal viram texto como no JsonResponse; tipos não serializáveis (bytes) não cacheiam
+        raw = json.dumps([columns, rows, extra], cls=DjangoJSONEncoder)
+    except (TypeError, ValueError):
+        return False
+    if len(raw) > RESULT_CACHE_MAX_BYTES:
+        return False
+    columns, rows, extra = json.loads(raw)
+
+    QueryCache.objects.filter(query=query, params_hash=key).delete()
+    QueryCache.objects.create(
+        query=query,
+        params_hash=key,
+        columns=columns,
+        rows=rows,
+        extra=extra,
+        expires_at=timezone.now() + dt.timedelta(seconds=ttl),
+    )
+    _trim(query)
+    return True
+
+
+def _trim(query: SavedQuery) -> None:
+    """Mantém no máximo RESULT_CACHE_MAX_ENTRIES por consulta (descarta as que vencem antes)."""
+    stale = list(
+        QueryCache.objects.filter(query=query)
+        .order_by("-expires_at")
+        .values_list("pk", flat=True)[RESULT_CACHE_MAX_ENTRIES:]
+    )
+    if stale:
+        QueryCache.objects.filter(pk__in=stale).delete()
+
+
+def forget(query_id: int) -> int:
+    return QueryCache.objects.filter(query_id=query_id).delete()[0]
+
+
+def purge_expired() -> int:
+    """Apaga as entradas vencidas, em lotes."""
+    qs = QueryCache.objects.filter(expires_at__lte=timezone.now())
+    deleted = 0
+    while True:
+        ids = list(qs.values_list("pk", flat=True)[:RESULT_CACHE_PURGE_BATCH])
+        if not ids:
+            break
+        deleted += QueryCache.objects.filter(pk__in=ids).delete()[0]
+    return deleted
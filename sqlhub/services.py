@@ -1,10 +1,24 @@
 # sqlhub/services.py
+import logging
+import threading
+from typing import Iterator
+
+from django.conf import settings
 from sqlalchemy import create_engine, text
-from sqlalchemy.engine.url import URL
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
 from urllib.parse import quote_plus
-from datetime import datetime, timedelta
-from django.utils import timezone
-from .models import DBConnection, SavedQuery, QueryCache
+from .models import DBConnection, DBEngine, SavedQuery
+from .pool import apply_statement_timeout, connection_version, statement_timeout_for
+
+logger = logging.getLogger(__name__)
+
+ENGINE_POOL_SIZE = int(getattr(settings, "SQLHUB_ENGINE_POOL_SIZE", 5))
+ENGINE_MAX_OVERFLOW = int(getattr(settings, "SQLHUB_ENGINE_MAX_OVERFLOW", 5))
+ENGINE_POOL_TIMEOUT_S = int(getattr(settings, "SQLHUB_ENGINE_POOL_TIMEOUT_S", 10))
+ENGINE_POOL_RECYCLE_S = int(getattr(settings, "SQLHUB_ENGINE_POOL_RECYCLE_S", 300))
+RUN_SELECT_MAX_ROWS = int(getattr(settings, "SQLHUB_RUN_SELECT_MAX_ROWS", 50000))
+RUN_SELECT_BATCH = 1000
 
 def build_sqlalchemy_url(conn: DBConnection) -> str:
     u, p, h, prt, db = conn.username, conn.password, conn.host or "localhost", conn.port, conn.database
@@ -24,6 +38,43 @@ def build_sqlalchemy_url(conn: DBConnection) -> str:
         return f"firebird+firebirdsql://{quote_plus(u)}:{quote_plus(p)}@{hostport}:{db}?charset={charset}"
     raise ValueError("Engine não suportado.")
 
+# ====== Registro de engines (um por conexão e versão) ======
+
+_ENGINES: dict[int, tuple[str, Engine]] = {}
+_ENGINES_LOCK = threading.Lock()
+
+def get_engine(conn: DBConnection) -> Engine:
+    """
+    Engine SQLAlchemy reaproveitado por (conn.id, conn.updated_at), com pool dimensionado
+    e pool_pre_ping. Conexão editada → engine antigo descartado (dispose).
+    """
+    version = connection_version(conn)
+    stale = None
+    with _ENGINES_LOCK:
+        entry = _ENGINES.get(conn.pk)
+        if entry and entry[0] == version:
+            return entry[1]
+        if entry:
+            stale = entry[1]
+        engine = create_engine(
+            build_sqlalchemy_url(conn),
+            pool_size=ENGINE_POOL_SIZE,
+            max_overflow=ENGINE_MAX_OVERFLOW,
+            pool_timeout=ENGINE_POOL_TIMEOUT_S,
+            pool_recycle=ENGINE_POOL_RECYCLE_S,
+            pool_pre_ping=True,
+        )
+        _ENGINES[conn.pk] = (version, engine)
+    if stale is not None:
+        stale.dispose()
+    return engine
+
+def dispose_engine(conn_id: int) -> None:
+    with _ENGINES_LOCK:
+        entry = _ENGINES.pop(int(conn_id), None)
+    if entry:
+        entry[1].dispose()
+
 def _assert_select_only(sql: str):
     s = (sql or "").strip().lower()
     # bloqueios simples: precisa começar com select; sem ; extra; sem ddl/dml óbvios
@@ -37,25 +88,62 @@ def _assert_select_only(sql: str):
 
 def test_connection(conn: DBConnection) -> tuple[bool, str]:
     try:
-        url = build_sqlalchemy_url(conn)
-        engine = create_engine(url, pool_pre_ping=True, pool_recycle=300)
+        if conn.pk:
+            engine = get_engine(conn)
+        else:
+            # conexão ainda não salva (formulário): engine descartável, sem pool
+            engine = create_engine(build_sqlalchemy_url(conn), poolclass=NullPool)
         with engine.connect() as cx:
             cx.execute(text("SELECT 1"))
         return True, "Conexão OK"
     except Exception as e:
         return False, str(e)
 
-def run_select(query: SavedQuery, *, limit: int | None = None, timeout_s: int = 5, params: dict | None = None):
+def iter_select(query: SavedQuery, *, limit: int | None = None, params: dict | None = None,
+                batch_size: int = RUN_SELECT_BATCH, max_rows: int | None = None,
+                timeout_s: int | None = None) -> Iterator[tuple[list[str], list[list]]]:
+    """
+    Executa o SELECT com cursor de streaming e produz (colunas, lote) a cada `batch_size` linhas.
+    Para em min(limit, max_rows, SQLHUB_RUN_SELECT_MAX_ROWS) — a memória fica limitada a um lote.
+    `timeout_s` (None → statement_timeout_for) limita o comando no servidor.
+    """
     _assert_select_only(query.sql_text)
-    url = build_sqlalchemy_url(query.connection)
-    engine = create_engine(url, pool_pre_ping=True, pool_recycle=300)
-    sql = query.sql_text.strip()
-    if limit and "limit" not in sql.lower():
+    conn = query.connection
+    cap = min(int(max_rows or RUN_SELECT_MAX_ROWS), RUN_SELECT_MAX_ROWS)
+    if limit:
+        cap = min(cap, int(limit))
+
+    sql = query.sql_text.strip().rstrip(";")
+    if limit and conn.engine in (DBEngine.POSTGRES, DBEngine.MYSQL) and "limit" not in sql.lower():
         sql = f"{sql}\nLIMIT {int(limit)}"
-    # Execução com timeout (genérico). Alguns dialetos têm “statement_timeout”; aqui usamos nível de driver.
-    with engine.connect() as cx:
-        cx = cx.execution_options(stream_results=False)
-        res = cx.execute(text(sql), params or {})
-        cols = list(res.keys())
-        rows = [list(r) for r in res.fetchall()]
+
+    if timeout_s is None:
+        timeout_s = statement_timeout_for(conn, query)
+
+    with get_engine(conn).connect() as cx:
+        timer = apply_statement_timeout(conn, cx.connection.dbapi_connection, None, timeout_s)
+        try:
+            res = cx.execution_options(stream_results=True, max_row_buffer=batch_size).execute(text(sql), params or {})
+            cols = list(res.keys())
+            sent = 0
+            while sent < cap:
+                batch = res.fetchmany(min(batch_size, cap - sent))
+                if not batch:
+                    if not sent:
+                        yield cols, []  # sem linhas: quem consome ainda recebe as colunas
+                    return
+                sent += len(batch)
+                yield cols, [list(r) for r in batch]
+            if (not limit or cap < int(limit)) and res.fetchone() is not None:
+                logger.warning("sqlhub: consulta %s truncada em %s linhas.", query.pk, cap)
+            res.close()
+        finally:
+            if timer is not None:
+                timer.stop()
+
+def run_select(query: SavedQuery, *, limit: int | None = None, timeout_s: int = 5, params: dict | None = None):
+    cols: list[str] = []
+    rows: list[list] = []
+    for cols, batch in iter_select(query, limit=limit, params=params, timeout_s=timeout_s):
+        rows.extend(batch)
     return cols, rows
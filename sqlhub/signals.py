@@ -0,0 +1,29 @@
+# sqlhub/signals.py – descarta pool DBAPI e engine SQLAlchemy quando a conexão é editada/apagada;
+# apaga o cache de resultados (QueryCache) da consulta editada
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import DBConnection, SavedQuery
+from .pool import invalidate
+from .result_cache import forget
+from .services import dispose_engine
+
+
+@receiver(post_save, sender=DBConnection)
+def dbconnection_saved(sender, instance, created, **kwargs):
+    if not created:
+        invalidate(instance.pk)
+        dispose_engine(instance.pk)
+
+
+@receiver(post_delete, sender=DBConnection)
+def dbconnection_deleted(sender, instance, **kwargs):
+    invalidate(instance.pk)
+    dispose_engine(instance.pk)
+
+
+@receiver(post_save, sender=SavedQuery)
+def savedquery_saved(sender, instance, created, **kwargs):
+    # a chave já muda com updated_at; aqui só liberamos as linhas que ninguém mais vai ler
+    if not created:
+        forget(instance.pk)
@@ -0,0 +1,42 @@
+# sqlhub/tasks.py
+import logging
+
+from celery import shared_task
+
+logger = logging.getLogger(__name__)  # ex.: "sqlhub.tasks"
+
+
+@shared_task(ignore_result=True)
+def purge_sqlhub_query_cache():
+    """Periódica (ex.: a cada 15 min): apaga os resultados vencidos do cache de consultas (QueryCache)."""
+    from .result_cache import purge_expired
+
+    try:
+        n = purge_expired()
+    except Exception:
+        logger.exception("SQLHUB: erro ao limpar cache de resultados")
+        return
+    if n:
+        logger.info("SQLHUB: %d resultado(s) vencido(s) removido(s) do cache.", n)
+
+
+@shared_task(ignore_result=True, acks_late=True)
+def run_query_job(job_id: str):
+    """Executa um QueryJob (sqlhub.jobs.run): SELECT/COUNT no banco de origem, resultado no spool."""
+    from .jobs import run
+
+    run(job_id)
+
+
+@shared_task(ignore_result=True)
+def purge_sqlhub_jobs(hours=None):
+    """Periódica (ex.: de hora em hora): apaga jobs de consulta antigos e seus arquivos de spool."""
+    from .jobs import purge_old_jobs
+
+    try:
+        n = purge_old_jobs(hours)
+    except Exception:
+        logger.exception("SQLHUB: erro ao limpar jobs antigos")
+        return
+    if n:
+        logger.info("SQLHUB: %d job(s) de consulta antigo(s) removido(s).", n)
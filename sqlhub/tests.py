@@ -1,3 +1,726 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
-# Create your tests here.
+from .pool import DBAPIPool, PoolExhausted
+
+
+class _FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if not self.conn.alive:
+            raise RuntimeError("conexão perdida")
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class _FakeConn:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        return _FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class DBAPIPoolTestCase(SimpleTestCase):
+    def _pool(self, **kw):
+        opened = []
+
+        def opener():
+            c = _FakeConn()
+            opened.append(c)
+            return c
+
+        return DBAPIPool(opener, **{"max_size": 2, "checkout_timeout_s": 0.05, "ping_after_s": 0, **kw}), opened
+
+    def test_reaproveita_conexao_e_respeita_tamanho_maximo(self):
+        pool, opened = self._pool()
+        a = pool.acquire()
+        a.close()
+        b = pool.acquire()
+        self.assertEqual(len(opened), 1)
+        self.assertEqual(opened[0].rollbacks, 1)
+
+        c = pool.acquire()
+        with self.assertRaises(PoolExhausted):
+            pool.acquire()
+        b.close()
+        c.close()
+        self.assertEqual(pool.stats["opened"], 2)
+
+    def test_ping_descarta_conexao_morta_e_close_do_pool_fecha_ociosas(self):
+        pool, opened = self._pool()
+        pool.acquire().close()
+        opened[0].alive = False
+
+        lease = pool.acquire()
+        self.assertTrue(opened[0].closed)
+        self.assertEqual(len(opened), 2)
+        lease.close()
+
+        pool.close()
+        self.assertTrue(opened[1].closed)
+
+
+class DBConnectionPoolInvalidationTestCase(TestCase):
+    def test_editar_conexao_descarta_pool(self):
+        from django.contrib.auth import get_user_model
+        from . import pool as pool_mod
+        from .models import DBConnection
+
+        user = get_user_model().objects.create(username="dba")
+        conn = DBConnection.objects.create(name="erp", engine="mysql", username="u", password="p", created_by=user)
+        pool = pool_mod._pool_for(conn)
+        self.assertIs(pool_mod._pool_for(conn), pool)
+
+        conn.host = "outro-host"
+        conn.save()
+        self.assertNotIn(conn.pk, pool_mod._POOLS)
+        self.assertIsNot(pool_mod._pool_for(conn), pool)
+
+
+class EngineRegistryTestCase(TestCase):
+    def test_engine_reaproveitado_e_select_em_lotes_com_teto(self):
+        import os
+        import tempfile
+        from unittest.mock import patch
+        from django.contrib.auth import get_user_model
+        from sqlalchemy import text
+        from . import services
+        from .models import DBConnection, SavedQuery
+
+        fd, path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        user = get_user_model().objects.create(username="dba")
+        conn = DBConnection.objects.create(name="erp", engine="mysql", username="u", password="p", created_by=user)
+        q = SavedQuery.objects.create(name="itens", connection=conn, sql_text="SELECT n FROM t ORDER BY n", created_by=user)
+
+        with patch.object(services, "build_sqlalchemy_url", return_value=f"sqlite:///{path}"), \
+                patch.object(services, "RUN_SELECT_MAX_ROWS", 25):
+            engine = services.get_engine(conn)
+            with engine.begin() as cx:
+                cx.execute(text("CREATE TABLE t (n INTEGER)"))
+                cx.execute(text("INSERT INTO t (n) VALUES (:n)"), [{"n": i} for i in range(40)])
+
+            self.assertIs(services.get_engine(conn), engine)
+            lotes = [len(b) for _, b in services.iter_select(q, batch_size=10)]
+            self.assertEqual(lotes, [10, 10, 5])
+            cols, rows = services.run_select(q, limit=3)
+            self.assertEqual((cols, rows), (["n"], [[0], [1], [2]]))
+
+            conn.save()  # nova versão → engine descartado
+            self.assertIsNot(services.get_engine(conn), engine)
+        services.dispose_engine(conn.pk)
+
+
+class PaginationPushdownTestCase(SimpleTestCase):
+    def _sqlite(self):
+        import sqlite3
+
+        raw = sqlite3.connect(":memory:")
+        raw.execute("CREATE TABLE t (n INTEGER)")
+        raw.executemany("INSERT INTO t (n) VALUES (?)", [(i,) for i in range(50)])
+        raw.commit()  # o fallback faz rollback antes de reexecutar
+        executed = []
+
+        class Cursor:
+            def __init__(self):
+                self._cur = raw.cursor()
+
+            def execute(self, sql, params=()):
+                executed.append(sql)
+                if params:  # formata como o driver (pyformat): %s → ?, %% → %
+                    sql = sql % tuple("?" for _ in params)
+                return self._cur.execute(sql, params or ())
+
+            def __getattr__(self, name):
+                return getattr(self._cur, name)
+
+        return raw, Cursor(), executed
+
+    def test_sql_de_paginacao_por_engine(self):
+        from .views import _build_sql_with_filters
+
+        sql, params = _build_sql_with_filters("SELECT a FROM t", "postgresql", [], page=(20, 11))
+        self.assertTrue(sql.endswith(") src LIMIT 11 OFFSET 20"))
+        self.assertEqual(params, [])
+        sql, params = _build_sql_with_filters("SELECT a FROM t WHERE b LIKE 'A%'", "mysql", [], page=("0", "10"))
+        self.assertEqual(params, [])  # sem parâmetros o driver não formata o '%' literal
+        self.assertTrue(sql.endswith("LIMIT 10 OFFSET 0"))
+
+        sql, _ = _build_sql_with_filters("SELECT a FROM t", "mssql", [], page=(20, 11))
+        self.assertTrue(sql.endswith("ORDER BY (SELECT NULL) OFFSET 20 ROWS FETCH NEXT 11 ROWS ONLY"))
+        sql, _ = _build_sql_with_filters("SELECT a FROM t ORDER BY a", "mssql", [], page=(20, 11))
+        self.assertEqual(sql, "SELECT a FROM t ORDER BY a OFFSET 20 ROWS FETCH NEXT 11 ROWS ONLY")
+        filtros = [{"field": "a", "op": "eq", "value": 1}]
+        sql, _ = _build_sql_with_filters("SELECT a FROM t ORDER BY a", "mssql", filtros, page=(20, 11))
+        self.assertNotIn("FETCH", sql)
+
+        sql, params = _build_sql_with_filters("SELECT a FROM t", "firebird", filtros, page=(20, 11))
+        self.assertTrue(sql.endswith("WHERE src.a = ? ROWS 21 TO 31"))
+        self.assertEqual(params, [1])
+
+    def test_pagina_vem_do_banco_e_fallback_descarta_no_cliente(self):
+        from types import SimpleNamespace
+        from unittest.mock import patch
+        from . import views
+
+        raw, cur, executed = self._sqlite()
+        conn = SimpleNamespace(engine="mysql")
+        with patch.object(views, "_open_dbapi", return_value=(raw, cur)):
+            cols, rows, more = views._fetch_page(conn, "SELECT n FROM t ORDER BY n", offset=40, limit=5)
+        self.assertEqual((cols, rows, more), (["n"], [[40], [41], [42], [43], [44]], True))
+        self.assertIn("LIMIT 6 OFFSET 40", executed[-1])  # +1 para saber se há mais
+
+        # SQL Server não roda no sqlite: a falha do SQL paginado cai no descarte no cliente
+        raw, cur, executed = self._sqlite()
+        conn = SimpleNamespace(engine="mssql")
+        with patch.object(views, "_open_dbapi", return_value=(raw, cur)):
+            cols, rows, more = views._fetch_page(conn, "SELECT n FROM t ORDER BY n", offset=45, limit=10)
+        self.assertEqual((rows, more), ([[45], [46], [47], [48], [49]], False))
+        self.assertEqual(len(executed), 2)
+        self.assertNotIn("FETCH", executed[-1])
+
+    def test_fallback_reaplica_statement_timeout_depois_do_rollback(self):
+        from types import SimpleNamespace
+        from unittest.mock import patch
+        from . import views
+
+        raw, cur, executed = self._sqlite()
+
+        class Cur(type(cur)):
+            def execute(self, sql, params=()):
+                if "LIMIT" in sql:
+                    raise RuntimeError("coluna sem nome na tabela derivada")
+                return super().execute(sql, params)
+
+        conn, paged = SimpleNamespace(pk=1, engine="postgresql", options={}), Cur()
+        with patch.object(views, "_open_dbapi", return_value=(raw, paged)), \
+                patch.object(views, "apply_statement_timeout") as apply:
+            cols, rows, more = views._fetch_page(conn, "SELECT n FROM t ORDER BY n", offset=10, limit=2, timeout_s=7)
+        self.assertEqual(rows, [[10], [11]])
+        apply.assert_called_once_with(conn, raw, paged, 7)
+
+    def test_keyset_percorre_paginas_pelo_cursor(self):
+        from types import SimpleNamespace
+        from unittest.mock import patch
+        from . import views
+
+        raw, cur, executed = self._sqlite()
+        conn = SimpleNamespace(engine="mysql")
+        vistos, cursor = [], None
+        with patch.object(views, "_open_dbapi", side_effect=lambda *_: (SimpleNamespace(close=lambda: None), type(cur)())):
+            while True:
+                cols, rows, cursor = views._fetch_keyset_page(conn, "SELECT n, n % 3 AS g FROM t", ["g", "n"], cursor, limit=20)
+                vistos += rows
+                if cursor is None:
+                    break
+        self.assertEqual(len(executed), 3)
+        self.assertEqual(vistos, sorted(vistos, key=lambda r: (r[1], r[0])))
+        self.assertEqual(sorted(r[0] for r in vistos), list(range(50)))
+        self.assertIn("WHERE ((src.g > %s) OR (src.g = %s AND src.n > %s)) ORDER BY src.g, src.n LIMIT", executed[-1])
+        self.assertNotIn("OFFSET", executed[-1].replace("LIMIT 21 OFFSET 0", ""))
+
+        with self.assertRaises(ValueError):
+            views._decode_cursor(views._encode_cursor(["g", "n"], [0, 1]), ["n"])
+
+    def test_keyset_com_percent_literal_no_sql(self):
+        import sqlite3
+        from types import SimpleNamespace
+        from unittest.mock import patch
+        from . import views
+
+        raw = sqlite3.connect(":memory:")
+        raw.execute("CREATE TABLE t (nome TEXT)")
+        raw.executemany("INSERT INTO t VALUES (?)", [(f"A{i:02d}",) for i in range(12)] + [("B",)])
+
+        class PyformatCursor:
+            # como psycopg2/PyMySQL: só formata (e exige '%%') quando há parâmetros
+            def __init__(self):
+                self._cur = raw.cursor()
+
+            def execute(self, sql, params=None):
+                if params:
+                    sql = sql % tuple("?" for _ in params)
+                return self._cur.execute(sql, params or ())
+
+            def __getattr__(self, name):
+                return getattr(self._cur, name)
+
+        conn = SimpleNamespace(engine="postgresql")
+        vistos, cursor = [], None
+        with patch.object(views, "_open_dbapi", side_effect=lambda *_: (SimpleNamespace(close=lambda: None), PyformatCursor())):
+            while True:
+                _, rows, cursor = views._fetch_keyset_page(conn, "SELECT nome FROM t WHERE nome LIKE 'A%'", ["nome"], cursor, limit=5)
+                vistos += [r[0] for r in rows]
+                if cursor is None:
+                    break
+        self.assertEqual(vistos, [f"A{i:02d}" for i in range(12)])
+
+
+class QueryResultCacheTestCase(TestCase):
+    def test_hit_nao_abre_conexao_e_edicao_invalida(self):
+        import datetime as dt
+        from unittest.mock import patch
+        from django.contrib.auth import get_user_model
+        from django.test import RequestFactory
+        from django.utils import timezone
+        from . import result_cache, views
+        from .models import DBConnection, QueryCache, SavedQuery
+
+        user = get_user_model().objects.create(username="dash")
+        conn = DBConnection.objects.create(name="erp", engine="mysql", username="u", password="p", created_by=user)
+        q = SavedQuery.objects.create(name="vendas", connection=conn, sql_text="SELECT 1 AS n",
+                                      meta={"cache_ttl": 60}, created_by=user)
+        rf = RequestFactory()
+
+        with patch.object(views, "_fetch_preview", return_value=(["n"], [[1]])) as fetch:
+            statuses = [views.query_preview(rf.get("/", {"limit": 10}), q.pk)["X-SQLHub-Cache"] for _ in range(3)]
+            self.assertEqual(statuses, ["MISS", "HIT", "HIT"])
+            self.assertEqual(fetch.call_count, 1)
+
+            q.sql_text = "SELECT 2 AS n"
+            q.save()  # nova versão: chave muda e as entradas antigas são apagadas
+            self.assertFalse(QueryCache.objects.filter(query=q).exists())
+            self.assertEqual(views.query_preview(rf.get("/", {"limit": 10}), q.pk)["X-SQLHub-Cache"], "MISS")
+            self.assertEqual(fetch.call_count, 2)
+
+        QueryCache.objects.update(expires_at=timezone.now() - dt.timedelta(seconds=1))
+        self.assertEqual(result_cache.purge_expired(), 1)
+
+        q.meta = {}
+        q.save()
+        with patch.object(views, "_fetch_preview", return_value=(["n"], [[1]])):
+            self.assertEqual(views.query_preview(rf.get("/"), q.pk)["X-SQLHub-Cache"], "BYPASS")
+        self.assertFalse(QueryCache.objects.exists())
+
+
+class OptionsSharedCacheTestCase(TestCase):
+    def test_opcoes_vem_do_cache_compartilhado_e_edicao_invalida(self):
+        from types import SimpleNamespace
+        from unittest.mock import patch
+        from django.contrib.auth import get_user_model
+        from django.core.cache import cache
+        from django.test import RequestFactory
+        from . import views
+        from .models import DBConnection, SavedQuery
+
+        user = get_user_model().objects.create(username="form")
+        conn = DBConnection.objects.create(name="erp", engine="mysql", username="u", password="p", created_by=user)
+        q = SavedQuery.objects.create(name="clientes", connection=conn, sql_text="SELECT id, nome FROM c", created_by=user)
+
+        class Cur:
+            description = (("id",), ("nome",))
+
+            def __init__(self):
+                self.rows = [(1, "Ana"), (2, "Bia")]
+
+            def execute(self, sql, params=None):
+                pass
+
+            def fetchmany(self, n):
+                out, self.rows = self.rows[:n], self.rows[n:]
+                return out
+
+            def close(self):
+                pass
+
+        rf = RequestFactory()
+        args = {"value_field": "id", "label_field": "nome"}
+        self.addCleanup(cache.clear)
+        with patch.object(views, "_fetch_preview", return_value=(["id", "nome"], [[1, "Ana"]])) as preview, \
+                patch.object(views, "_open_dbapi", side_effect=lambda *_: (SimpleNamespace(close=lambda: None), Cur())):
+            r1 = views.query_options_api(rf.get("/", args), q.pk)
+            views._OPTIONS_CACHE.clear()  # simula outro worker: só o cache compartilhado
+            r2 = views.query_options_api(rf.get("/", args), q.pk)
+            self.assertEqual(r1.content, r2.content)
+            self.assertEqual(preview.call_count, 1)
+
+            q.save()  # nova versão → nova chave
+            views.query_options_api(rf.get("/", args), q.pk)
+            self.assertEqual(preview.call_count, 2)
+
+        views._mark_bad_col(q, "nome")
+        self.assertEqual(views._bad_cols(q, ["id", "nome"]), {"nome"})
+
+
+class TTLCacheTestCase(SimpleTestCase):
+    def test_expiracao_preguicosa_lru_e_estatisticas(self):
+        from unittest.mock import patch
+        from . import views
+
+        clock = [1000.0]
+        with patch.object(views.time, "monotonic", side_effect=lambda: clock[0]):
+            c = views._TTLCache(maxsize=3, ttl=10)
+            for k in "abc":
+                c.set(k, k.upper())
+            self.assertEqual(c.get("a"), "A")  # "a" passa a ser a mais usada
+            c.set("d", "D")                     # estoura maxsize: sai "b" (LRU)
+            self.assertIsNone(c.get("b"))
+            self.assertEqual(c.stats["evicted"], 1)
+
+            clock[0] += 11
+            self.assertIsNone(c.get("a"))       # vencida: descobre na leitura
+            c.set("e", "E")                     # drena a cabeça vencida da fila
+            self.assertEqual(list(c.data), ["e"])
+            self.assertEqual(c.stats, {"hits": 1, "misses": 2, "expired": 3, "evicted": 1})
+
+            for i in range(500):                # regravações não deixam a fila crescer sem limite
+                c.set("e", i)
+            self.assertLessEqual(len(c._expiry), 2 * c.maxsize + 64)
+            self.assertEqual(c.get("e"), 499)
+
+
+class QueryJobTestCase(TestCase):
+    def setUp(self):
+        import sqlite3
+        import tempfile
+        from unittest.mock import patch
+        from django.contrib.auth import get_user_model
+        from . import jobs
+        from .models import DBConnection
+
+        self.user = get_user_model().objects.create(username="analista")
+        self.conn = DBConnection.objects.create(name="erp", engine="mssql", username="u", password="p", created_by=self.user)
+
+        raw = sqlite3.connect(":memory:", check_same_thread=False)
+        raw.execute("CREATE TABLE t (n INTEGER)")
+        raw.executemany("INSERT INTO t (n) VALUES (?)", [(i,) for i in range(25)])
+
+        class Lease:
+            def cursor(self):
+                return raw.cursor()
+
+            def close(self):
+                pass
+
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        for p in (patch.object(jobs, "borrow", return_value=Lease()),
+                  patch.object(jobs, "JOB_SPOOL_DIR", spool.name),
+                  patch.object(jobs, "JOB_CHUNK_ROWS", 10),
+                  patch("sqlhub.tasks.run_query_job.delay")):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_worker_grava_spool_em_lotes_e_pagina_le_do_disco(self):
+        from . import jobs
+        from .models import QueryJobStatus
+
+        job = jobs.submit(self.user, self.conn, "SELECT n FROM t ORDER BY n", [])
+        self.assertEqual(job.status, QueryJobStatus.QUEUED)
+        jobs.run(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_done, job.columns), (QueryJobStatus.DONE, 25, ["n"]))
+
+        rows, more = jobs.read_page(job, 8, 5)  # atravessa dois lotes
+        self.assertEqual((rows, more), ([[8], [9], [10], [11], [12]], True))
+        rows, more = jobs.read_page(job, 20, 10)
+        self.assertEqual((len(rows), more), (5, False))
+        self.assertEqual(sum(len(c) for c in jobs.iter_rows(job)), 25)
+
+        count = jobs.submit(self.user, self.conn, "SELECT n FROM t", [], kind="count")
+        jobs.run(count.pk)
+        count.refresh_from_db()
+        self.assertEqual(count.result, {"count": 25})
+
+    def test_spool_preserva_tipos_para_exportacao(self):
+        import datetime
+        import io
+        import os
+        import uuid
+        from decimal import Decimal
+        from django.urls import reverse
+        import pyarrow.parquet as pq
+        from . import jobs
+        from .models import QueryJob, QueryJobStatus
+
+        linha = [Decimal("1.50"), datetime.datetime(2024, 5, 1, 8, 30), datetime.date(2024, 5, 1),
+                 b"\x00\xff", uuid.UUID(int=1), {"__sqlhub_t": "x"}, None]
+        job = QueryJob.objects.create(connection=self.conn, sql_text="SELECT 1", created_by=self.user,
+                                      status=QueryJobStatus.DONE, columns=list("abcdefg"), rows_done=1,
+                                      chunk_rows=10)
+        os.makedirs(jobs.spool_dir(job.pk))
+        jobs._write_chunk(job.pk, 0, [linha])
+        self.assertEqual(jobs.read_page(job, 0, 10)[0], [linha])
+
+        self.client.force_login(self.user)
+        resp = self.client.get(reverse("sqlhub:query_job_page", args=[job.pk]))
+        self.assertEqual(resp.json()["rows"][0][3], "00ff")
+
+        resp = self.client.get(reverse("sqlhub:query_job_export", args=[job.pk]), {"format": "parquet"})
+        tabela = pq.read_table(io.BytesIO(b"".join(resp.streaming_content)))
+        self.assertEqual(tabela.column("a")[0].as_py(), Decimal("1.50"))
+        self.assertEqual(str(tabela.schema.field("b").type), "timestamp[us]")
+        self.assertEqual(str(tabela.schema.field("c").type), "date32[day]")
+
+    def test_editor_le_preview_e_exporta_pelo_job(self):
+        from django.urls import reverse
+
+        self.client.force_login(self.user)
+        html = self.client.get(reverse("sqlhub:query_new")).content.decode()
+        for nome in ("query_job_submit", "query_job_page", "query_job_export"):
+            self.assertIn(reverse(f"sqlhub:{nome}", args=[] if nome == "query_job_submit"
+                                  else ["00000000-0000-0000-0000-000000000000"]), html)
+
+    def test_cancelar_job_na_fila(self):
+        from . import jobs
+        from .models import QueryJobStatus
+
+        job = jobs.submit(self.user, self.conn, "SELECT n FROM t", [])
+        jobs.request_cancel(job)
+        jobs.run(job.pk)  # worker pega depois: não executa
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_done), (QueryJobStatus.CANCELED, 0))
+
+
+class StatementTimeoutTestCase(SimpleTestCase):
+    def test_precedencia_e_comando_por_engine(self):
+        from types import SimpleNamespace
+        from .pool import apply_statement_timeout, statement_timeout_for
+
+        conn = SimpleNamespace(pk=1, engine="postgresql", options={"statement_timeout_s": 20})
+        self.assertEqual(statement_timeout_for(conn), 20)
+        self.assertEqual(statement_timeout_for(conn, SimpleNamespace(meta={"statement_timeout_s": "5"})), 5)
+        self.assertEqual(statement_timeout_for(SimpleNamespace(options={}), default=7), 7)
+
+        executed = []
+        raw = _FakeConn()
+        raw.cursor = lambda: SimpleNamespace(execute=executed.append, close=lambda: None)
+        apply_statement_timeout(conn, raw, None, 20)
+        self.assertEqual(executed, ["SET statement_timeout = 20000"])
+
+        odbc = SimpleNamespace(timeout=0)
+        apply_statement_timeout(SimpleNamespace(pk=2, engine="mssql"), odbc, None, 9)
+        self.assertEqual(odbc.timeout, 9)
+
+    def test_firebird_watchdog_cancela_e_para_ao_devolver(self):
+        import threading
+        from types import SimpleNamespace
+        from .pool import DBAPIPool, apply_statement_timeout
+
+        fired = threading.Event()
+        raw = _FakeConn()
+        raw.cancel_operation = fired.set
+        conn = SimpleNamespace(pk=3, engine="firebird")
+
+        lease = DBAPIPool(lambda: raw, engine="firebird").acquire()
+        timer = apply_statement_timeout(conn, lease, None, 1)
+        timer._timer.join(3)
+        self.assertTrue(fired.is_set() and timer.fired)
+
+        fired.clear()
+        timer = apply_statement_timeout(conn, lease, None, 1)
+        lease.close()  # devolução para o watchdog: não cancela o próximo uso da conexão
+        timer._timer.join(3)
+        self.assertFalse(fired.is_set())
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        import datetime
+        import sqlite3
+        from decimal import Decimal
+        from types import SimpleNamespace
+        from unittest.mock import patch
+        from django.contrib.auth import get_user_model
+        from . import views
+        from .models import DBConnection
+
+        user = get_user_model().objects.create(username="analista")
+        self.client.force_login(user)
+        self.conn = DBConnection.objects.create(name="erp", engine="mysql", username="u", password="p", created_by=user)
+
+        raw = sqlite3.connect(":memory:")
+        raw.execute("CREATE TABLE t (n INTEGER, preco TEXT, criado TEXT, nome TEXT)")
+        self.dia = datetime.datetime(2024, 5, 1, 8, 30)
+        raw.executemany("INSERT INTO t VALUES (?, ?, ?, ?)",
+                        [(i, "1.50", self.dia.isoformat(), f"=SOMA(A{i})") for i in range(7)])
+
+        class Cursor:
+            # sqlite devolve texto: converte como um driver real faria
+            def __init__(self):
+                self._cur = raw.cursor()
+
+            def execute(self, sql, params=()):
+                return self._cur.execute(sql.replace("%s", "?"), params)
+
+            def fetchmany(self, size):
+                return [(n, Decimal(p), datetime.datetime.fromisoformat(c), s)
+                        for n, p, c, s in self._cur.fetchmany(size)]
+
+            def __getattr__(self, name):
+                return getattr(self._cur, name)
+
+        p = patch.object(views, "_open_dbapi", side_effect=lambda *_: (SimpleNamespace(close=lambda: None), Cursor()))
+        p.start()
+        self.addCleanup(p.stop)
+
+    def _post(self, **extra):
+        from django.urls import reverse
+
+        data = {"connection_id": self.conn.pk, "sql_text": "SELECT n, preco, criado, nome FROM t ORDER BY n", **extra}
+        return self.client.post(reverse("sqlhub:query_export_adhoc"), data)
+
+    def test_csv_continua_padrao(self):
+        resp = self._post()
+        self.assertEqual(resp.status_code, 200)
+        body = b"".join(resp.streaming_content).decode("utf-8")
+        self.assertTrue(body.startswith("\ufeffn;preco;criado;nome\n0;1.50;"))
+        self.assertEqual(body.count("\n"), 8)
+
+    def test_xlsx_celulas_tipadas_e_nova_aba_no_limite(self):
+        import io
+        from decimal import Decimal
+        from unittest.mock import patch
+        from openpyxl import load_workbook
+        from . import views
+
+        with patch.object(views, "_XLSX_MAX_ROWS", 5):
+            resp = self._post(format="xlsx", filename="dados.xlsx")
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("spreadsheetml", resp["Content-Type"])
+            wb = load_workbook(io.BytesIO(b"".join(resp.streaming_content)))
+
+        self.assertEqual(wb.sheetnames, ["Dados", "Dados (2)"])
+        primeira, segunda = (list(ws.iter_rows(values_only=True)) for ws in wb.worksheets)
+        self.assertEqual(primeira[0], ("n", "preco", "criado", "nome"))
+        self.assertEqual((len(primeira), len(segunda)), (6, 3))
+        n, preco, criado, nome = primeira[1]
+        self.assertEqual((n, Decimal(str(preco)), criado), (0, Decimal("1.50"), self.dia))
+        self.assertEqual(nome, "=SOMA(A0)")
+        self.assertNotEqual(wb.worksheets[0]["D2"].data_type, "f")  # texto não vira fórmula
+        self.assertEqual(segunda[-1][0], 6)
+
+        self.assertEqual(self._post(format="pdf").status_code, 400)
+
+    def test_parquet_e_arrow_colunares_em_blocos(self):
+        import io
+        from decimal import Decimal
+        from unittest.mock import patch
+        import pyarrow.ipc as pa_ipc
+        import pyarrow.parquet as pq
+        from . import columnar
+
+        with patch.object(columnar, "COLUMNAR_ROW_GROUP_ROWS", 3):
+            resp = self._post(format="parquet")
+            self.assertEqual(resp["Content-Type"], columnar.PARQUET_CONTENT_TYPE)
+            arquivo = pq.ParquetFile(io.BytesIO(b"".join(resp.streaming_content)))
+            resp = self._post(format="arrow")
+            tabela = pa_ipc.open_stream(b"".join(resp.streaming_content)).read_all()
+
+        self.assertEqual(arquivo.metadata.num_row_groups, 3)
+        self.assertEqual(arquivo.metadata.row_group(0).column(0).compression, "ZSTD")
+        lido = arquivo.read()
+        self.assertEqual(lido.column("n").to_pylist(), list(range(7)))
+        self.assertEqual(lido.column("preco")[0].as_py(), Decimal("1.50"))
+        self.assertEqual(lido.column("criado")[0].as_py(), self.dia)
+
+        self.assertEqual(tabela.num_rows, 7)
+        self.assertEqual(str(tabela.schema.field("n").type), "int64")
+        self.assertEqual(str(tabela.schema.field("criado").type), "timestamp[us]")
+
+    def test_colunar_texto_repetido_vira_dicionario(self):
+        from . import columnar
+
+        lotes = [(["uf", "vazio"], []), (["uf", "vazio"], [("SC", None), ("PR", None), ("SC", None), ("SC", None)])]
+        (rb,) = list(columnar.iter_record_batches(lotes, dictionary=True))
+        self.assertTrue(str(rb.schema.field("uf").type).startswith("dictionary"))
+        self.assertEqual(rb.column(0).to_pylist(), ["SC", "PR", "SC", "SC"])
+        self.assertEqual(rb.column(1).null_count, 4)
+
+
+class CountEstimateTestCase(TestCase):
+    def setUp(self):
+        import sqlite3
+        from types import SimpleNamespace
+        from unittest.mock import patch
+        from django.contrib.auth import get_user_model
+        from django.core.cache import cache
+        from . import jobs, views
+        from .models import DBConnection
+
+        cache.clear()
+        user = get_user_model().objects.create(username="analista")
+        self.client.force_login(user)
+        self.conn = DBConnection.objects.create(name="erp", engine="mysql", username="u", password="p", created_by=user)
+
+        raw = sqlite3.connect(":memory:", check_same_thread=False)
+        raw.execute("CREATE TABLE t (n INTEGER)")
+        raw.executemany("INSERT INTO t (n) VALUES (?)", [(i,) for i in range(30)])
+        lease = SimpleNamespace(cursor=raw.cursor, close=lambda: None)
+        self.delay = patch("sqlhub.tasks.run_query_job.delay").start()
+        for p in (patch.object(jobs, "borrow", return_value=lease),
+                  patch.object(views, "_open_dbapi", side_effect=lambda *_: (lease, raw.cursor())),
+                  patch.object(views.counts, "estimate", return_value=25)):
+            p.start()
+        self.addCleanup(patch.stopall)
+
+    def _post(self, sql="SELECT n FROM t"):
+        from django.urls import reverse
+
+        return self.client.post(reverse("sqlhub:query_count_adhoc"), {"connection_id": self.conn.pk, "sql_text": sql}).json()
+
+    def test_estimativa_imediata_e_exata_em_cache_depois_do_job(self):
+        from . import jobs
+
+        first = self._post()
+        self.assertEqual((first["count"], first["exact"]), (25, False))
+        self.assertEqual(self._post("SELECT  n\nFROM t")["job_id"], first["job_id"])  # mesmo job
+        self.assertEqual(self.delay.call_count, 1)
+
+        jobs.run(first["job_id"])
+        again = self._post()
+        self.assertEqual((again["count"], again["exact"], again["cached"]), (30, True, True))
+
+    def test_sem_fila_conta_na_hora(self):
+        self.delay.side_effect = RuntimeError("broker fora")
+        data = self._post()
+        self.assertEqual((data["count"], data["exact"], data["job_id"]), (30, True, None))
+        self.assertTrue(self._post()["cached"])
+
+
+class CountEstimatorTestCase(SimpleTestCase):
+    def test_estimadores_por_engine(self):
+        from .counts import estimate
+
+        class Cur:
+            def __init__(self, rows, description=None):
+                self.rows, self.description, self.executed = rows, description, []
+
+            def execute(self, sql, params=None):
+                self.executed.append(sql)
+
+            def fetchone(self):
+                return self.rows[0]
+
+            def fetchall(self):
+                return self.rows
+
+        pg = Cur([('[{"Plan": {"Node Type": "Hash Join", "Plan Rows": 1234.0}}]',)])
+        self.assertEqual(estimate("postgresql", pg, "SELECT 1"), 1234)
+        self.assertTrue(pg.executed[0].startswith("EXPLAIN (FORMAT JSON) "))
+
+        desc = [("id",), ("table",), ("rows",), ("filtered",)]
+        my = Cur([(1, "a", 1000, 10.0), (1, "b", 3, 100.0), (2, "c", 99, 100.0)], desc)
+        self.assertEqual(estimate("mysql", my, "SELECT 1"), 300)
+
+        ms = Cur([('<ShowPlanXML><StmtSimple StatementEstRows="42.7" /></ShowPlanXML>',)])
+        self.assertEqual(estimate("mssql", ms, "SELECT 1"), 43)
+        self.assertEqual(ms.executed, ["SET SHOWPLAN_XML ON", "SELECT 1", "SET SHOWPLAN_XML OFF"])
+
+        self.assertIsNone(estimate("firebird", None, "SELECT 1"))
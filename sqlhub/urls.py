@@ -17,12 +17,20 @@ urlpatterns = [
     path("queries/<int:pk>/edit/", views.QueryUpdate.as_view(), name="query_edit"),
     path("queries/<int:pk>/preview/", views.query_preview, name="query_preview"),
     path("queries/<int:pk>/columns/", views.query_columns, name="query_columns"),
+    path("queries/<int:pk>/page/", views.query_page, name="query_page"),
 
     # Ad-hoc (editor)
     path("queries/adhoc-preview/", views.query_preview_adhoc, name="query_preview_adhoc"),
     path("queries/adhoc-export/", views.query_export_adhoc, name="query_export_adhoc"),
     path("queries/adhoc-page/", views.query_page_adhoc, name="query_page_adhoc"),
 
+    # Jobs assíncronos (worker + spool)
+    path("jobs/", views.query_job_submit, name="query_job_submit"),
+    path("jobs/<uuid:job_id>/", views.query_job_status, name="query_job_status"),
+    path("jobs/<uuid:job_id>/page/", views.query_job_page, name="query_job_page"),
+    path("jobs/<uuid:job_id>/cancel/", views.query_job_cancel, name="query_job_cancel"),
+    path("jobs/<uuid:job_id>/export/", views.query_job_export, name="query_job_export"),
+
     # API de opções (selects)
     path("api/query/<int:pk>/options/", views.query_options_api, name="query_options_api"),
     path("api/query/adhoc/count/", views.query_count_adhoc, name="query_count_adhoc"),
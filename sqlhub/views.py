@@ -2,31 +2,52 @@
 from __future__ import annotations
 
 import csv
+import datetime
 import io
+import hashlib
+import json
 import re
+import tempfile
 import unicodedata
 import logging
+import threading
 import time
-from collections import OrderedDict
+import zlib
+from collections import OrderedDict, deque
+from contextlib import closing
+from decimal import Decimal
 from typing import Any, Dict, Iterable, List, Tuple, Set, Optional
 
 from django import forms
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core import signing
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.http import (
-    Http404,
     HttpRequest,
     JsonResponse,
     StreamingHttpResponse,
 )
 from django.shortcuts import get_object_or_404
 from django.urls import reverse_lazy
+from django.utils import timezone
 from django.views.decorators.http import require_POST
 from django.views.generic import CreateView, ListView, UpdateView
 
-from .models import DBConnection, SavedQuery, DBEngine
+from .models import DBConnection, SavedQuery, DBEngine, QueryJob, QueryJobStatus
+from . import columnar, counts, jobs, result_cache
+from .pool import (
+    DriverMissing,
+    apply_statement_timeout,
+    borrow,
+    cancel_statement,
+    connection_version,
+    statement_timeout_for,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -76,102 +97,29 @@ class SavedQueryForm(forms.ModelForm):
 # Helpers / Execução
 # =========================
 
-class DriverMissing(Exception):
-    pass
-
-
-def _open_dbapi(conn: DBConnection):
-    engine = conn.engine
-    host = conn.host or "localhost"
-    port = conn.port
-    db = (conn.database or "").strip()
-    user = conn.username
-    pwd = conn.password
-    opts: Dict[str, Any] = conn.options or {}
-
-    if engine == DBEngine.POSTGRES:
-        try:
-            import psycopg2
-        except Exception:
-            raise DriverMissing("psycopg2 não instalado.")
-        py_conn = psycopg2.connect(
-            host=host,
-            port=port or 5432,
-            dbname=db,
-            user=user,
-            password=pwd,
-            connect_timeout=opts.get("connect_timeout", 5),
-        )
-        return py_conn, py_conn.cursor()
-
-    if engine == DBEngine.MYSQL:
-        try:
-            import pymysql
-        except Exception:
-            raise DriverMissing("pymysql não instalado.")
-        py_conn = pymysql.connect(
-            host=host,
-            port=int(port or 3306),
-            user=user,
-            password=pwd,
-            database=db,
-            connect_timeout=int(opts.get("connect_timeout", 5)),
-            charset=opts.get("charset", "utf8mb4"),
-            cursorclass=pymysql.cursors.Cursor,
-        )
-        return py_conn, py_conn.cursor()
+# Exportação lê o resultado inteiro: limite maior que o das telas (DBConnection.options ainda sobrescreve)
+EXPORT_STATEMENT_TIMEOUT_S = int(getattr(settings, "SQLHUB_EXPORT_STATEMENT_TIMEOUT_S", 600))
 
-    if engine == DBEngine.SQLSERVER:
-        try:
-            import pyodbc
-        except Exception:
-            raise DriverMissing("pyodbc não instalado.")
-        driver = opts.get("odbc_driver", "ODBC Driver 18 for SQL Server")
-        encrypt = opts.get("Encrypt", "yes")
-        trust = opts.get("TrustServerCertificate", "yes")
-        port_part = f",{port}" if port else ""
-        parts = [
-            f"DRIVER={{{driver}}}",
-            f"SERVER={host}{port_part}",
-            f"UID={user}",
-            f"PWD={pwd}",
-            f"Encrypt={encrypt}",
-            f"TrustServerCertificate={trust}",
-        ]
-        if db:
-            parts.append(f"DATABASE={db}")
-        cn_str = ";".join(parts) + ";"
-        py_conn = pyodbc.connect(cn_str, timeout=int(opts.get("connect_timeout", 5)))
-        return py_conn, py_conn.cursor()
+def _open_dbapi(conn: DBConnection, timeout_s: Optional[int] = None):
+    """
+    (conexão, cursor) emprestados do pool da DBConnection (sqlhub.pool).
+    `conexão.close()` devolve ao pool — os chamadores continuam fechando normalmente.
+    O comando fica limitado a `timeout_s` (None → statement_timeout_for da conexão).
+    """
+    py_conn = borrow(conn)
+    try:
+        cur = py_conn.cursor()
+    except Exception:
+        getattr(py_conn, "invalidate", lambda: None)()
+        py_conn.close()
+        raise
+    apply_statement_timeout(conn, py_conn, cur, statement_timeout_for(conn) if timeout_s is None else timeout_s)
+    return py_conn, cur
 
-    if engine == DBEngine.FIREBIRD:
-        try:
-            from firebird.driver import connect as fb_connect
-            dsn = f"{host}/{port or 3050}:{db}" if host else db
-            py_conn = fb_connect(
-                dsn=dsn,
-                user=user,
-                password=pwd,
-                timeout=int(opts.get("connect_timeout", 5)),
-                charset=opts.get("charset", "UTF8"),
-            )
-            return py_conn, py_conn.cursor()
-        except Exception:
-            try:
-                import fdb
-                py_conn = fdb.connect(
-                    host=host or "localhost",
-                    port=port or 3050,
-                    database=db,
-                    user=user,
-                    password=pwd,
-                    charset=opts.get("charset", "UTF8"),
-                )
-                return py_conn, py_conn.cursor()
-            except Exception:
-                raise DriverMissing("firebird-driver/fdb não instalado(s).")
 
-    raise Http404("Engine não suportado.")
+def _saved_queries():
+    # senha fica de fora: só o pool a lê, e apenas ao abrir conexão física
+    return SavedQuery.objects.select_related("connection").defer("connection__password")
 
 
 def _validate_select(sql: str) -> None:
@@ -228,15 +176,138 @@ def _parse_where_filters(request: HttpRequest) -> List[Dict[str, Any]]:
     return out
 
 
-def _build_sql_with_filters(base_sql: str, engine: str, filters: List[Dict[str, Any]]):
+def _top_level_order_by(sql: str) -> int:
+    """Posição do último ORDER BY fora de parênteses (-1 se não houver)."""
+    low = sql.lower()
+    pos = -1
+    for m in re.finditer(r"\border\s+by\b", low):
+        if low.count("(", 0, m.start()) == low.count(")", 0, m.start()):
+            pos = m.start()
+    return pos
+
+
+def _pushdown_supported(base_sql: str, engine: str, filters: List[Dict[str, Any]], keyset: bool = False) -> bool:
+    """
+    Dá para paginar no banco? SQL Server não aceita ORDER BY dentro de tabela derivada:
+    com ORDER BY próprio e sem filtros/keyset o OFFSET/FETCH vai direto no SQL; com eles, não.
+    """
+    if engine not in (DBEngine.POSTGRES, DBEngine.MYSQL, DBEngine.SQLSERVER, DBEngine.FIREBIRD):
+        return False
+    if engine == DBEngine.SQLSERVER:
+        base_sql = (base_sql or "").strip().rstrip(";")
+        return not ((filters or keyset) and _top_level_order_by(base_sql) >= 0)
+    return True
+
+
+def _paginate_sql(sql: str, engine: str, offset: int, limit: int, wrapped: bool) -> Tuple[str, List[Any]]:
+    """Acrescenta a paginação nativa do engine (LIMIT/OFFSET, OFFSET/FETCH, ROWS m TO n)."""
+    offset, limit = max(0, int(offset)), max(1, int(limit))
+
+    if engine in (DBEngine.POSTGRES, DBEngine.MYSQL):
+        if not wrapped:
+            sql = f"SELECT * FROM (\n{sql}\n) src"
+        # inteiros no SQL (como nos outros engines): sem parâmetros, um '%' literal da
+        # consulta (LIKE 'A%') não passa pela formatação do driver
+        return f"{sql} LIMIT {limit} OFFSET {offset}", []
+
+    if engine == DBEngine.SQLSERVER:
+        # OFFSET/FETCH exige ORDER BY; sem ordem própria, (SELECT NULL) mantém a do plano
+        if _top_level_order_by(sql) < 0:
+            if not wrapped:
+                sql = f"SELECT * FROM (\n{sql}\n) src"
+            sql += " ORDER BY (SELECT NULL)"
+        return f"{sql} OFFSET {offset} ROWS FETCH NEXT {limit} ROWS ONLY", []
+
+    if engine == DBEngine.FIREBIRD:
+        # ROWS m TO n (1-based, inclusivo) vale depois do ORDER BY da tabela derivada
+        if not wrapped:
+            sql = f"SELECT * FROM (\n{sql}\n) src"
+        return f"{sql} ROWS {offset + 1} TO {offset + limit}", []
+
+    return sql, []
+
+
+# ----- Paginação por chave (keyset/seek) -----
+
+_KEYSET_SALT = "sqlhub.keyset"
+
+
+class _CursorSerializer:
+    """JSON do signing aceitando datas/Decimal da última linha (viram texto ISO/decimal)."""
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), cls=DjangoJSONEncoder).encode("latin-1")
+
+    def loads(self, data: bytes):
+        return json.loads(data.decode("latin-1"))
+
+
+def _parse_keyset(raw: Any) -> List[str]:
+    """Colunas da chave de ordenação: "a,b" ou ["a", "b"]; precisam ser identificadores simples."""
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    cols = [str(c).strip() for c in (raw or []) if str(c).strip()]
+    bad = [c for c in cols if not _VALID_FIELD_RE.match(c)]
+    if bad:
+        raise ValueError(f"Coluna de chave inválida: {bad[0]}")
+    return cols
+
+
+def _encode_cursor(keyset: List[str], values: List[Any]) -> str:
+    return signing.dumps({"k": keyset, "v": values}, salt=_KEYSET_SALT, serializer=_CursorSerializer, compress=True)
+
+
+def _decode_cursor(token: str, keyset: List[str]) -> List[Any]:
+    try:
+        data = signing.loads(token, salt=_KEYSET_SALT, serializer=_CursorSerializer)
+    except signing.BadSignature:
+        raise ValueError("Cursor inválido.")
+    if data.get("k") != keyset or len(data.get("v") or []) != len(keyset):
+        raise ValueError("Cursor não corresponde à chave de ordenação.")
+    return data["v"]
+
+
+def _keyset_predicate(engine: str, keyset: List[str], values: List[Any]) -> Tuple[str, List[Any]]:
+    """
+    Linhas depois da última chave: comparação de tupla no PostgreSQL; nos demais, forma
+    expandida (a > ? OR a = ? AND b > ?). A chave deve ser única e sem NULL.
+    """
+    ph = _engine_placeholder(engine)
+    if engine == DBEngine.POSTGRES:
+        cols = ", ".join(f"src.{c}" for c in keyset)
+        return f"({cols}) > ({', '.join([ph] * len(keyset))})", list(values)
+
+    ors, params = [], []
+    for i, col in enumerate(keyset):
+        parts = [f"src.{c} = {ph}" for c in keyset[:i]] + [f"src.{col} > {ph}"]
+        ors.append("(" + " AND ".join(parts) + ")")
+        params += list(values[: i + 1])
+    return "(" + " OR ".join(ors) + ")", params
+
+
+def _build_sql_with_filters(
+    base_sql: str,
+    engine: str,
+    filters: List[Dict[str, Any]],
+    *,
+    page: Optional[Tuple[int, int]] = None,
+    keyset: Optional[List[str]] = None,
+    after: Optional[List[Any]] = None,
+):
+    """
+    SQL final com os filtros (sobre a consulta embrulhada como `src`).
+    `page=(offset, limit)` empurra a paginação para o banco quando o engine permite
+    (ver _pushdown_supported); caso contrário o SQL sai sem paginação.
+    `keyset` ordena pelas colunas da chave e, com `after` (valores da última linha),
+    só traz as linhas seguintes — cada página custa o mesmo que a primeira.
+    """
     base_sql = (base_sql or "").strip().rstrip(";")
-    if not filters:
-        return base_sql, []
+    sql, params, wrapped = base_sql, [], False
 
     ph = _engine_placeholder(engine)
-    conditions, params = [], []
+    conditions = []
 
-    for f in filters:
+    for f in filters or []:
         field = (f.get("field") or "").strip()
         op = (f.get("op") or "eq").strip().lower()
         value = f.get("value", "")
@@ -269,12 +340,30 @@ def _build_sql_with_filters(base_sql: str, engine: str, filters: List[Dict[str,
         else:
             continue
 
-    if not conditions:
-        return base_sql, []
+    if keyset and after is not None:
+        pred, pred_params = _keyset_predicate(engine, keyset, after)
+        conditions.append(pred)
+        params += pred_params
 
-    where_sql = " AND ".join(conditions)
-    wrapped = f"SELECT * FROM (\n{base_sql}\n) src WHERE {where_sql}"
-    return wrapped, params
+    if conditions:
+        where_sql = " AND ".join(conditions)
+        sql = f"SELECT * FROM (\n{base_sql}\n) src WHERE {where_sql}"
+        wrapped = True
+    elif keyset:
+        sql = f"SELECT * FROM (\n{base_sql}\n) src"
+        wrapped = True
+
+    if keyset:
+        sql += " ORDER BY " + ", ".join(f"src.{c}" for c in keyset)
+
+    if page is not None and _pushdown_supported(base_sql, engine, filters, keyset=bool(keyset)):
+        sql, page_params = _paginate_sql(sql, engine, page[0], page[1], wrapped)
+        params += page_params
+
+    if params and engine in (DBEngine.POSTGRES, DBEngine.MYSQL) and "%" in base_sql:
+        # com parâmetros o driver formata o SQL inteiro: '%' literal da consulta vira '%%'
+        sql = sql.replace(base_sql, base_sql.replace("%", "%%"), 1)
+    return sql, params
 
 
 # ====== Normalização util ======
@@ -313,50 +402,172 @@ def _find_col_index(cols: List[str], name: str | None, default: int = 0) -> int:
 # ====== Cache LRU/TTL curto ======
 
 class _TTLCache:
+    """
+    LRU com TTL fixo (contado do set), thread-safe e O(1) por operação:
+    - get confere a validade só da chave pedida (expiração preguiçosa);
+    - set anota (vencimento, chave) numa fila em ordem de inserção — com TTL fixo é também a
+      ordem de vencimento — e drena só a cabeça vencida, poucas entradas por chamada;
+    - acima de maxsize sai a menos usada (ordem do OrderedDict).
+    """
+
+    _DRAIN_PER_SET = 8
+
     def __init__(self, maxsize=512, ttl=45.0):
-        self.data = OrderedDict()
+        self.data: OrderedDict = OrderedDict()  # chave → (vence_em, valor), da menos à mais usada
+        self._expiry: deque = deque()           # (vence_em, chave), em ordem de inserção
         self.maxsize = maxsize
         self.ttl = ttl
-    def _purge(self):
-        now = time.monotonic()
-        for k in list(self.data.keys()):
-            t, _ = self.data[k]
-            if now - t > self.ttl:
-                self.data.pop(k, None)
-        while len(self.data) > self.maxsize:
-            self.data.popitem(last=False)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    def __len__(self):
+        return len(self.data)
+
     def get(self, key):
-        self._purge()
-        item = self.data.pop(key, None)
-        if not item:
-            return None
-        t, v = item
-        if time.monotonic() - t > self.ttl:
-            return None
-        self.data[key] = (time.monotonic(), v)
-        return v
+        now = time.monotonic()
+        with self._lock:
+            item = self.data.get(key)
+            if item is None:
+                self.stats["misses"] += 1
+                return None
+            expires_at, v = item
+            if now >= expires_at:
+                del self.data[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self.data.move_to_end(key)
+            self.stats["hits"] += 1
+            return v
+
     def set(self, key, value):
-        self._purge()
-        self.data[key] = (time.monotonic(), value)
+        now = time.monotonic()
+        expires_at = now + self.ttl
+        with self._lock:
+            self.data[key] = (expires_at, value)
+            self.data.move_to_end(key)
+            self._expiry.append((expires_at, key))
+            self._drain(now)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    def clear(self):
+        with self._lock:
+            self.data.clear()
+            self._expiry.clear()
+
+    def _drain(self, now: float) -> None:
+        q = self._expiry
+        for _ in range(self._DRAIN_PER_SET):
+            if not q or q[0][0] > now:
+                break
+            expires_at, key = q.popleft()
+            item = self.data.get(key)
+            # a chave pode ter sido regravada (vencimento novo) ou já ter saído por LRU
+            if item is not None and item[0] == expires_at:
+                del self.data[key]
+                self.stats["expired"] += 1
+        if len(q) > 2 * self.maxsize + 64:
+            # muitas regravações da mesma chave: reconstrói a fila (raro → O(1) amortizado)
+            self._expiry = deque(sorted(((exp, k) for k, (exp, _) in self.data.items()), key=lambda e: e[0]))
 
-_OPTIONS_CACHE = _TTLCache(maxsize=512, ttl=45.0)
-_BADCOLS_CACHE  = _TTLCache(maxsize=256, ttl=300.0)
 
-def _badkey(qpk: int, col: str) -> tuple:
-    return ("badcol", int(qpk), (col or "").upper())
+# ====== Cache compartilhado de opções / colunas ruins (cache do Django → Redis) ======
+# Chaves levam a versão da consulta (updated_at da SavedQuery e da conexão): editar invalida.
+# _OPTIONS_CACHE vira só um L1 de poucos segundos por processo, na frente do Redis.
 
-def _mark_bad_col(qpk: int, col: str) -> None:
+OPTIONS_CACHE_TTL_S = int(getattr(settings, "SQLHUB_OPTIONS_CACHE_TTL_S", 45))
+OPTIONS_L1_TTL_S = float(getattr(settings, "SQLHUB_OPTIONS_L1_TTL_S", 5))
+OPTIONS_LOCK_TTL_S = int(getattr(settings, "SQLHUB_OPTIONS_LOCK_TTL_S", 30))
+OPTIONS_LOCK_WAIT_S = float(getattr(settings, "SQLHUB_OPTIONS_LOCK_WAIT_S", 5))
+BADCOLS_CACHE_TTL_S = int(getattr(settings, "SQLHUB_BADCOLS_CACHE_TTL_S", 300))
+
+_OPTIONS_CACHE = _TTLCache(maxsize=512, ttl=OPTIONS_L1_TTL_S)
+
+
+def _query_version(q: SavedQuery) -> str:
+    raw = f"{q.updated_at.isoformat() if q.updated_at else ''}|{connection_version(q.connection)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def _options_key(q: SavedQuery, params: Dict[str, Any]) -> str:
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return f"sqlhub:opt:{q.pk}:{_query_version(q)}:{digest}"
+
+
+def _pack(payload: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(payload, separators=(",", ":"), cls=DjangoJSONEncoder).encode("utf-8"), 6)
+
+
+def _unpack(raw: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(raw))
+
+
+def _options_get(key: str) -> Optional[Dict[str, Any]]:
+    hit = _OPTIONS_CACHE.get(key)
+    if hit is not None:
+        return hit
+    try:
+        raw = cache.get(key)
+        hit = _unpack(raw) if raw is not None else None
+    except Exception:
+        logger.debug("options cache: falha ao ler %s", key, exc_info=True)
+        return None
+    if hit is not None:
+        _OPTIONS_CACHE.set(key, hit)
+    return hit
+
+
+def _options_set(key: Optional[str], payload: Dict[str, Any]) -> None:
+    if not key:
+        return
+    _OPTIONS_CACHE.set(key, payload)
+    try:
+        cache.set(key, _pack(payload), OPTIONS_CACHE_TTL_S)
+    except Exception:
+        logger.debug("options cache: falha ao gravar %s", key, exc_info=True)
+
+
+def _options_wait(key: str) -> Optional[Dict[str, Any]]:
+    """Outro worker está calculando a mesma chave: espera o resultado (até OPTIONS_LOCK_WAIT_S)."""
+    deadline = time.monotonic() + OPTIONS_LOCK_WAIT_S
+    delay = 0.05
+    while time.monotonic() < deadline:
+        time.sleep(delay)
+        hit = _options_get(key)
+        if hit is not None:
+            return hit
+        if cache.get(f"{key}:lock") is None:
+            break  # dono do lock terminou sem gravar (erro): calcula aqui
+        delay = min(delay * 2, 0.5)
+    return None
+
+
+def _badkey(q: SavedQuery, col: str) -> str:
+    return f"sqlhub:badcol:{q.pk}:{_query_version(q)}:{(col or '').upper()}"
+
+def _mark_bad_col(q: SavedQuery, col: str) -> None:
     try:
-        _BADCOLS_CACHE.set(_badkey(qpk, col), True)
+        cache.set(_badkey(q, col), 1, BADCOLS_CACHE_TTL_S)
     except Exception:
         pass
 
-def _is_bad_col(qpk: int, col: str) -> bool:
+def _is_bad_col(q: SavedQuery, col: str) -> bool:
     try:
-        return bool(_BADCOLS_CACHE.get(_badkey(qpk, col)))
+        return bool(cache.get(_badkey(q, col)))
     except Exception:
         return False
 
+def _bad_cols(q: SavedQuery, cols: Iterable[str]) -> Set[str]:
+    """Colunas marcadas como ruins, numa ida só ao cache."""
+    keys = {_badkey(q, c): c for c in cols}
+    try:
+        found = cache.get_many(list(keys))
+    except Exception:
+        return set()
+    return {keys[k] for k, v in found.items() if v}
+
 
 # ====== SQL genérico para busca por engine, sem amarrar a nomes ======
 
@@ -455,7 +666,7 @@ def _build_options_db_filter_sql(
 
 
 def _dbfilter_firebird_greedy(
-    qpk: int,
+    qobj: SavedQuery,
     conn: DBConnection,
     base_sql: str,
     search_cols: List[str],
@@ -463,6 +674,7 @@ def _dbfilter_firebird_greedy(
     limit: int,
     vf_idx: int,
     text_cols: Optional[Set[str]],
+    timeout_s: Optional[int] = None,
 ) -> Tuple[List[List[Any]], List[str], List[str]]:
     """
     Firebird: Tenta prefixo por coluna; se necessário, tenta contains.
@@ -482,7 +694,7 @@ def _dbfilter_firebird_greedy(
                 base_sql, DBEngine.FIREBIRD, [col], qtext=qtext, limit=rem, q_mode="prefix", text_cols=text_cols
             )
             logger.debug("fb-greedy col=%s sql=%s", col, sql_col)
-            py_conn, cur = _open_dbapi(conn)
+            py_conn, cur = _open_dbapi(conn, timeout_s)
             try:
                 cur.execute(sql_col, params)
                 got_any = False
@@ -510,7 +722,7 @@ def _dbfilter_firebird_greedy(
         except Exception as e:
             bad_cols.append(col)
             if "Malformed string" in str(e) or "SQLCODE: -104" in str(e):
-                _mark_bad_col(qpk, col)
+                _mark_bad_col(qobj, col)
             logger.debug("fb-greedy(prefix): pulando coluna %s por erro %r", col, e)
 
         if len(rows) >= limit:
@@ -519,7 +731,7 @@ def _dbfilter_firebird_greedy(
     # 2ª passada: contains
     if len(rows) < limit:
         for col in search_cols:
-            if col in good_cols or col in bad_cols or _is_bad_col(qpk, col):
+            if col in good_cols or col in bad_cols or _is_bad_col(qobj, col):
                 continue
             try:
                 rem = max(1, limit - len(rows))
@@ -527,7 +739,7 @@ def _dbfilter_firebird_greedy(
                     base_sql, DBEngine.FIREBIRD, [col], qtext=qtext, limit=rem, q_mode="contains", text_cols=text_cols
                 )
                 logger.debug("fb-greedy (contains) col=%s sql=%s", col, sql_col)
-                py_conn, cur = _open_dbapi(conn)
+                py_conn, cur = _open_dbapi(conn, timeout_s)
                 try:
                     cur.execute(sql_col, params)
                     got_any = False
@@ -555,7 +767,7 @@ def _dbfilter_firebird_greedy(
             except Exception as e:
                 bad_cols.append(col)
                 if "Malformed string" in str(e) or "SQLCODE: -104" in str(e):
-                    _mark_bad_col(qpk, col)
+                    _mark_bad_col(qobj, col)
                 logger.debug("fb-greedy(contains): pulando coluna %s por erro %r", col, e)
 
             if len(rows) >= limit:
@@ -568,23 +780,52 @@ def _dbfilter_firebird_greedy(
 # Execução de preview/página
 # =========================
 
+def _execute_paged(cur, py_conn, conn: DBConnection, sql: str, filters: List[Dict[str, Any]],
+                   offset: int, limit: int, timeout_s: Optional[int] = None) -> int:
+    """
+    Executa com a paginação no banco; devolve quantas linhas ainda precisam ser puladas
+    no cliente (0 se o banco paginou). Se o engine não suporta ou o SQL embrulhado falha
+    (ex.: coluna sem nome em tabela derivada), cai no modo antigo: SQL sem paginação +
+    descarte de `offset` linhas com fetchmany.
+    """
+    engine = conn.engine
+    if _pushdown_supported(sql, engine, filters):
+        final_sql, params = _build_sql_with_filters(sql, engine, filters, page=(offset, limit))
+        try:
+            if params:
+                cur.execute(final_sql, params)
+            else:
+                cur.execute(final_sql)
+            return 0
+        except Exception as e:
+            logger.info("sqlhub: paginação no banco falhou (%s) — usando descarte no cliente.", e)
+            try: py_conn.rollback()
+            except Exception: pass
+            if engine == DBEngine.POSTGRES:
+                # o SET statement_timeout estava na transação desfeita: reaplica antes do fallback
+                apply_statement_timeout(conn, py_conn, cur, statement_timeout_for(conn) if timeout_s is None else timeout_s)
+
+    final_sql, params = _build_sql_with_filters(sql, engine, filters)
+    if params:
+        cur.execute(final_sql, params)
+    else:
+        cur.execute(final_sql)
+    return offset
+
+
 def _fetch_preview(
     conn: DBConnection,
     sql: str,
     limit: int,
     filters: List[Dict[str, Any]] | None = None,
+    timeout_s: Optional[int] = None,
 ) -> Tuple[List[str], List[List[Any]]]:
     _validate_select(sql)
     limit = _clamp_limit(limit)
-    engine = conn.engine
-    final_sql, params = _build_sql_with_filters(sql, engine, filters or [])
 
-    py_conn, cur = _open_dbapi(conn)
+    py_conn, cur = _open_dbapi(conn, timeout_s)
     try:
-        if params:
-            cur.execute(final_sql, params)
-        else:
-            cur.execute(final_sql)
+        _execute_paged(cur, py_conn, conn, sql, filters or [], 0, limit, timeout_s)
 
         columns = [d[0] for d in (cur.description or [])]
         rows: List[List[Any]] = []
@@ -609,24 +850,19 @@ def _fetch_page(
     limit: int,
     filters: List[Dict[str, Any]] | None = None,
     skip_batch: int = 1000,
+    timeout_s: Optional[int] = None,
 ) -> Tuple[List[str], List[List[Any]], bool]:
     _validate_select(sql)
     offset = max(0, int(offset))
     limit = _clamp_limit(limit, soft_max=2000)
 
-    engine = conn.engine
-    final_sql, params = _build_sql_with_filters(sql, engine, filters or [])
-
-    py_conn, cur = _open_dbapi(conn)
+    py_conn, cur = _open_dbapi(conn, timeout_s)
     try:
-        if params:
-            cur.execute(final_sql, params)
-        else:
-            cur.execute(final_sql)
+        # limit + 1: a linha extra só indica se há próxima página
+        to_skip = _execute_paged(cur, py_conn, conn, sql, filters or [], offset, limit + 1, timeout_s)
 
         columns = [d[0] for d in (cur.description or [])]
 
-        to_skip = offset
         while to_skip > 0:
             n = min(skip_batch, to_skip)
             chunk = cur.fetchmany(n)
@@ -647,6 +883,57 @@ def _fetch_page(
         except Exception: pass
 
 
+def _fetch_keyset_page(
+    conn: DBConnection,
+    sql: str,
+    keyset: List[str],
+    cursor: str | None,
+    limit: int,
+    filters: List[Dict[str, Any]] | None = None,
+    timeout_s: Optional[int] = None,
+) -> Tuple[List[str], List[List[Any]], str | None]:
+    """
+    Página por chave: ORDER BY chave + WHERE chave > última (do cursor) + limite no banco.
+    Devolve (colunas, linhas, próximo cursor ou None na última página).
+    """
+    _validate_select(sql)
+    limit = _clamp_limit(limit, soft_max=2000)
+    engine = conn.engine
+    if not keyset:
+        raise ValueError("Informe as colunas da chave de ordenação.")
+    if not _pushdown_supported(sql, engine, filters or [], keyset=True):
+        raise ValueError("Para paginar por chave no SQL Server, remova o ORDER BY da consulta (a ordem vem da chave).")
+    after = _decode_cursor(cursor, keyset) if cursor else None
+
+    final_sql, params = _build_sql_with_filters(
+        sql, engine, filters or [], page=(0, limit + 1), keyset=keyset, after=after
+    )
+    py_conn, cur = _open_dbapi(conn, timeout_s)
+    try:
+        if params:
+            cur.execute(final_sql, params)
+        else:
+            cur.execute(final_sql)
+        columns = [d[0] for d in (cur.description or [])]
+        rows = [list(r) for r in cur.fetchmany(limit + 1)]
+    finally:
+        try: cur.close()
+        except Exception: pass
+        try: py_conn.close()
+        except Exception: pass
+
+    lower = [str(c).lower() for c in columns]
+    missing = [k for k in keyset if k.lower() not in lower]
+    if missing:
+        raise ValueError(f"Coluna de chave ausente no resultado: {missing[0]}")
+
+    if len(rows) <= limit:
+        return columns, rows, None
+    rows = rows[:limit]
+    idx = [lower.index(k.lower()) for k in keyset]
+    return columns, rows, _encode_cursor(keyset, [rows[-1][i] for i in idx])
+
+
 # =========================
 # Conexões (CBVs)
 # =========================
@@ -687,7 +974,7 @@ class ConnectionUpdate(LoginRequiredMixin, UpdateView):
 
 @login_required
 def test_connection_view(request: HttpRequest, pk: int) -> JsonResponse:
-    conn = get_object_or_404(DBConnection, pk=pk)
+    conn = get_object_or_404(DBConnection.objects.defer("password"), pk=pk)
     try:
         py_conn, cur = _open_dbapi(conn)
         try:
@@ -754,14 +1041,51 @@ class QueryUpdate(LoginRequiredMixin, UpdateView):
 
 
 
+def _cached_result(q: SavedQuery, kind: str, compute, **parts) -> Tuple[Dict[str, Any], str]:
+    """
+    Resultado de consulta salva via QueryCache quando a consulta tem TTL (meta["cache_ttl"]).
+    `compute()` devolve {"columns", "rows", ...}; só roda no miss. Devolve (dados, HIT|MISS|BYPASS).
+    """
+    ttl = result_cache.ttl_for(q)
+    if not ttl:
+        return compute(), "BYPASS"
+    key = result_cache.make_key(q, kind, **parts)
+    try:
+        hit = result_cache.get(q, key)
+    except Exception:
+        logger.warning("sqlhub: falha ao ler cache de resultados da consulta %s", q.pk, exc_info=True)
+        hit = None
+    if hit is not None:
+        return hit, "HIT"
+
+    data = compute()
+    extra = {k: v for k, v in data.items() if k not in ("columns", "rows")}
+    try:
+        result_cache.put(q, key, data["columns"], data["rows"], ttl, **extra)
+    except Exception:
+        logger.warning("sqlhub: falha ao gravar cache de resultados da consulta %s", q.pk, exc_info=True)
+    return data, "MISS"
+
+
+def _cached_response(data: Dict[str, Any], status: str) -> JsonResponse:
+    resp = JsonResponse({"ok": True, **data})
+    resp["X-SQLHub-Cache"] = status
+    return resp
+
+
 def query_preview(request: HttpRequest, pk: int) -> JsonResponse:
-    q = get_object_or_404(SavedQuery, pk=pk, is_active=True)
+    q = get_object_or_404(_saved_queries(), pk=pk, is_active=True)
     limit = _clamp_limit(request.GET.get("limit") or q.default_limit or 100)
     filters = _parse_where_filters(request)
 
+    def compute():
+        cols, rows = _fetch_preview(q.connection, q.sql_text, limit=limit, filters=filters,
+                                    timeout_s=statement_timeout_for(q.connection, q))
+        return {"columns": cols, "rows": rows}
+
     try:
-        cols, rows = _fetch_preview(q.connection, q.sql_text, limit=limit, filters=filters)
-        return JsonResponse({"ok": True, "columns": cols, "rows": rows})
+        data, status = _cached_result(q, "preview", compute, limit=limit, filters=filters)
+        return _cached_response(data, status)
     except DriverMissing as e:
         return JsonResponse({"ok": False, "message": f"Driver ausente: {e}"}, status=400)
     except ValueError as e:
@@ -770,12 +1094,63 @@ def query_preview(request: HttpRequest, pk: int) -> JsonResponse:
         return JsonResponse({"ok": False, "message": f"Erro ao executar preview: {e}"}, status=400)
 
 
+@login_required
+def query_page(request: HttpRequest, pk: int) -> JsonResponse:
+    """
+    GET /sqlhub/queries/<id>/page/?limit=&offset= | &cursor=
+    Com `keyset` (parâmetro ou SavedQuery.meta["keyset"]) pagina por chave e devolve
+    `next_cursor`; sem chave, por OFFSET (empurrado para o banco).
+    """
+    q = get_object_or_404(_saved_queries(), pk=pk, is_active=True)
+    filters = _parse_where_filters(request)
+
+    try:
+        limit = _clamp_limit(request.GET.get("limit") or q.default_limit or 1000, soft_max=2000)
+        keyset = _parse_keyset(request.GET.get("keyset") or (q.meta or {}).get("keyset"))
+        if keyset:
+            cursor = request.GET.get("cursor") or None
+
+            def compute():
+                cols, rows, next_cursor = _fetch_keyset_page(
+                    q.connection, q.sql_text, keyset, cursor, limit=limit, filters=filters,
+                    timeout_s=statement_timeout_for(q.connection, q),
+                )
+                return {"columns": cols, "rows": rows, "next_cursor": next_cursor, "has_more": next_cursor is not None}
+
+            data, status = _cached_result(q, "keyset", compute, limit=limit, filters=filters, keyset=keyset, cursor=cursor)
+            return _cached_response(data, status)
+
+        offset = max(0, int(request.GET.get("offset") or 0))
+
+        def compute():
+            cols, rows, has_more = _fetch_page(q.connection, q.sql_text, offset=offset, limit=limit, filters=filters,
+                                               timeout_s=statement_timeout_for(q.connection, q))
+            return {"columns": cols, "rows": rows, "next_offset": offset + len(rows), "has_more": has_more}
+
+        data, status = _cached_result(q, "page", compute, limit=limit, offset=offset, filters=filters)
+        return _cached_response(data, status)
+    except DriverMissing as e:
+        return JsonResponse({"ok": False, "message": f"Driver ausente: {e}"}, status=400)
+    except ValueError as e:
+        return JsonResponse({"ok": False, "message": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"ok": False, "message": f"Erro ao carregar página: {e}"}, status=400)
+
+
 @login_required
 def query_columns(request: HttpRequest, pk: int) -> JsonResponse:
-    q = get_object_or_404(SavedQuery, pk=pk, is_active=True)
+    q = get_object_or_404(_saved_queries(), pk=pk, is_active=True)
+
+    def compute():
+        cols, _ = _fetch_preview(q.connection, q.sql_text, limit=1, filters=None,
+                                 timeout_s=statement_timeout_for(q.connection, q))
+        return {"columns": cols, "rows": []}
+
     try:
-        cols, _ = _fetch_preview(q.connection, q.sql_text, limit=1, filters=None)
-        return JsonResponse({"ok": True, "columns": cols})
+        data, status = _cached_result(q, "columns", compute)
+        resp = JsonResponse({"ok": True, "columns": data["columns"]})
+        resp["X-SQLHub-Cache"] = status
+        return resp
     except DriverMissing as e:
         return JsonResponse({"ok": False, "message": f"Driver ausente: {e}"}, status=400)
     except ValueError as e:
@@ -795,8 +1170,44 @@ def query_options_api(request: HttpRequest, pk: int) -> JsonResponse:
       &q_mode=prefix|contains  # força modo (opcional)
       &cache=0                 # desliga cache curto (opcional)
       &skip_cols=COL1,COL2     # força pular colunas específicas
+
+    Resposta cacheada no cache compartilhado (Redis) por consulta+versão+parâmetros;
+    misses concorrentes da mesma chave rodam a consulta de origem uma vez só.
     """
-    qobj = get_object_or_404(SavedQuery, pk=pk, is_active=True)
+    qobj = get_object_or_404(_saved_queries(), pk=pk, is_active=True)
+
+    if request.GET.get("cache", "1") == "0":
+        return _query_options(request, qobj, None)
+
+    params = {k: v for k, v in request.GET.lists() if k != "cache"}
+    if "q" in params:
+        params["q"] = [(v or "").strip().lower() for v in params["q"]]
+    cache_key = _options_key(qobj, params)
+
+    hit = _options_get(cache_key)
+    if hit is not None:
+        return JsonResponse(hit)
+
+    lock_key = f"{cache_key}:lock"
+    try:
+        owner = cache.add(lock_key, 1, OPTIONS_LOCK_TTL_S)
+    except Exception:
+        owner = False
+    if not owner:
+        hit = _options_wait(cache_key)
+        if hit is not None:
+            return JsonResponse(hit)
+    try:
+        return _query_options(request, qobj, cache_key)
+    finally:
+        if owner:
+            try: cache.delete(lock_key)
+            except Exception: pass
+
+
+def _query_options(request: HttpRequest, qobj: SavedQuery, cache_key: Optional[str]) -> JsonResponse:
+    pk = qobj.pk
+    timeout_s = statement_timeout_for(qobj.connection, qobj)
     value_field = (request.GET.get("value_field") or request.GET.get("value") or "").strip()
     label_field = (request.GET.get("label_field") or request.GET.get("label") or "").strip()
     limit = _clamp_limit(request.GET.get("limit") or 200)
@@ -805,7 +1216,7 @@ def query_options_api(request: HttpRequest, pk: int) -> JsonResponse:
 
     # Descobre colunas e 1ª linha para inferir tipos textuais
     try:
-        cols, sample_rows = _fetch_preview(qobj.connection, qobj.sql_text, limit=1, filters=filters)
+        cols, sample_rows = _fetch_preview(qobj.connection, qobj.sql_text, limit=1, filters=filters, timeout_s=timeout_s)
     except Exception as e:
         return JsonResponse({"ok": False, "message": f"Falha ao inspecionar colunas: {e}"}, status=400)
 
@@ -842,9 +1253,10 @@ def query_options_api(request: HttpRequest, pk: int) -> JsonResponse:
     # aplicar skip_cols e blacklist TTL
     skip_cols_param = (request.GET.get("skip_cols") or "").strip()
     skip_cols = {c.strip() for c in skip_cols_param.split(",") if c.strip()}
+    known_bad = _bad_cols(qobj, search_cols_ordered)
     search_cols_ordered = [
         c for c in search_cols_ordered
-        if c not in skip_cols and not _is_bad_col(qobj.id, c)
+        if c not in skip_cols and c not in known_bad
     ]
 
     # mantenha no máximo 4 colunas no caminho DB (tuneável via GET se quiser)
@@ -852,19 +1264,6 @@ def query_options_api(request: HttpRequest, pk: int) -> JsonResponse:
     if max_cols > 0:
         search_cols_ordered = search_cols_ordered[:max_cols]
 
-    # cache curto (funciona com e sem q)
-    cache_enabled = (request.GET.get("cache", "1") != "0")
-    cache_key = None
-    if cache_enabled:
-        filt_key = tuple(
-            (f.get("field",""), f.get("op",""), str(f.get("value","")))
-            for f in (filters or [])
-        )
-        cache_key = ("opt", pk, tuple(search_cols_ordered), vf_idx, lf_idx, (qtext or "").lower(), limit, filt_key)
-        hit = _OPTIONS_CACHE.get(cache_key)
-        if hit:
-            return JsonResponse(hit)
-
     # ---------- 1) Caminho server-side quando tem q ----------
     if qtext and (request.GET.get("db_search", "1") != "0"):
         logger.debug("options_api pk=%s engine=%s q=%r search_cols=%s", pk, engine, qtext, search_cols_ordered)
@@ -872,7 +1271,8 @@ def query_options_api(request: HttpRequest, pk: int) -> JsonResponse:
             try:
                 base_sql, _ = _build_sql_with_filters(qobj.sql_text, engine, filters or [])
                 rows, good_cols, bad_cols = _dbfilter_firebird_greedy(
-                    qobj.id, qobj.connection, base_sql, search_cols_ordered, qtext, limit, vf_idx, text_cols
+                    qobj, qobj.connection, base_sql, search_cols_ordered, qtext, limit, vf_idx, text_cols,
+                    timeout_s=timeout_s,
                 )
                 if rows:
                     options = []
@@ -882,12 +1282,11 @@ def query_options_api(request: HttpRequest, pk: int) -> JsonResponse:
                         except Exception:
                             continue
                     payload = {"ok": True, "columns": cols, "options": options}
-                    if cache_key:
-                        _OPTIONS_CACHE.set(cache_key, payload)
+                    _options_set(cache_key, payload)
                     return JsonResponse(payload)
 
                 # sem linhas no greedy → combinado prefix e depois contains
-                try_cols = good_cols or [c for c in search_cols_ordered if c not in bad_cols and not _is_bad_col(qobj.id, c)]
+                try_cols = good_cols or [c for c in search_cols_ordered if c not in bad_cols and not _is_bad_col(qobj, c)]
 
                 rows2: List[List[Any]] = []
                 if try_cols:
@@ -895,7 +1294,7 @@ def query_options_api(request: HttpRequest, pk: int) -> JsonResponse:
                         qobj.sql_text, engine, try_cols, qtext=qtext, limit=limit, q_mode="prefix", text_cols=text_cols
                     )
                     logger.debug("options_api FB combined(prefix) cols=%s sql=%s", try_cols, sql_db)
-                    py_conn, cur = _open_dbapi(qobj.connection)
+                    py_conn, cur = _open_dbapi(qobj.connection, timeout_s)
                     try:
                         cur.execute(sql_db, params)
                         while len(rows2) < limit:
@@ -914,7 +1313,7 @@ def query_options_api(request: HttpRequest, pk: int) -> JsonResponse:
                         qobj.sql_text, engine, try_cols, qtext=qtext, limit=limit, q_mode="contains", text_cols=text_cols
                     )
                     logger.debug("options_api FB combined(contains) cols=%s sql=%s", try_cols, sql_db)
-                    py_conn, cur = _open_dbapi(qobj.connection)
+                    py_conn, cur = _open_dbapi(qobj.connection, timeout_s)
                     try:
                         cur.execute(sql_db, params)
                         while len(rows2) < limit:
@@ -936,8 +1335,7 @@ def query_options_api(request: HttpRequest, pk: int) -> JsonResponse:
                         except Exception:
                             continue
                     payload = {"ok": True, "columns": cols, "options": options}
-                    if cache_key:
-                        _OPTIONS_CACHE.set(cache_key, payload)
+                    _options_set(cache_key, payload)
                     return JsonResponse(payload)
 
             except Exception as e:
@@ -952,7 +1350,7 @@ def query_options_api(request: HttpRequest, pk: int) -> JsonResponse:
                     "options_api DB-FILTER sql=%s | search_cols=%s | params_count=%s",
                     sql_db, search_cols_ordered, len(params)
                 )
-                py_conn, cur = _open_dbapi(qobj.connection)
+                py_conn, cur = _open_dbapi(qobj.connection, timeout_s)
                 try:
                     cur.execute(sql_db, params)
                     rows: List[List[Any]] = []
@@ -975,8 +1373,7 @@ def query_options_api(request: HttpRequest, pk: int) -> JsonResponse:
                         continue
 
                 payload = {"ok": True, "columns": cols, "options": options}
-                if cache_key:
-                    _OPTIONS_CACHE.set(cache_key, payload)
+                _options_set(cache_key, payload)
                 return JsonResponse(payload)
             except Exception as e:
                 logger.warning("options_api pk=%s DB-FILTER falhou (%r) → fallback client-side", pk, e)
@@ -999,7 +1396,7 @@ def query_options_api(request: HttpRequest, pk: int) -> JsonResponse:
     looked = 0
 
     try:
-        py_conn, cur = _open_dbapi(qobj.connection)
+        py_conn, cur = _open_dbapi(qobj.connection, timeout_s)
         try:
             if base_params:
                 cur.execute(base_sql, base_params)
@@ -1061,8 +1458,7 @@ def query_options_api(request: HttpRequest, pk: int) -> JsonResponse:
             continue
 
     payload = {"ok": True, "columns": cols, "options": options}
-    if cache_key:
-        _OPTIONS_CACHE.set(cache_key, payload)
+    _options_set(cache_key, payload)
     return JsonResponse(payload)
 
 
@@ -1071,6 +1467,7 @@ def query_options_api(request: HttpRequest, pk: int) -> JsonResponse:
 @login_required
 @require_POST
 def query_preview_adhoc(request: HttpRequest) -> JsonResponse:
+    """Preview síncrono — reserva do editor quando a fila está indisponível (normal: query_job_page)."""
     try:
         conn_id = int(request.POST.get("connection_id") or 0)
         sql_text = request.POST.get("sql_text") or ""
@@ -1082,7 +1479,7 @@ def query_preview_adhoc(request: HttpRequest) -> JsonResponse:
         return JsonResponse({"ok": False, "message": "Informe conexão e SQL."}, status=400)
 
     filters = _parse_where_filters(request)
-    conn = get_object_or_404(DBConnection, pk=conn_id)
+    conn = get_object_or_404(DBConnection.objects.defer("password"), pk=conn_id)
 
     try:
         cols, rows = _fetch_preview(conn, sql_text, limit=limit, filters=filters)
@@ -1098,6 +1495,7 @@ def query_preview_adhoc(request: HttpRequest) -> JsonResponse:
 @login_required
 @require_POST
 def query_page_adhoc(request: HttpRequest) -> JsonResponse:
+    """Página síncrona — reserva do editor quando a fila está indisponível (normal: query_job_page)."""
     try:
         conn_id = int(request.POST.get("connection_id") or 0)
         sql_text = request.POST.get("sql_text") or ""
@@ -1110,9 +1508,16 @@ def query_page_adhoc(request: HttpRequest) -> JsonResponse:
         return JsonResponse({"ok": False, "message": "Informe conexão e SQL."}, status=400)
 
     filters = _parse_where_filters(request)
-    conn = get_object_or_404(DBConnection, pk=conn_id)
+    conn = get_object_or_404(DBConnection.objects.defer("password"), pk=conn_id)
 
     try:
+        keyset = _parse_keyset(request.POST.get("keyset"))
+        if keyset:
+            cols, rows, next_cursor = _fetch_keyset_page(
+                conn, sql_text, keyset, request.POST.get("cursor") or None, limit=limit, filters=filters
+            )
+            return JsonResponse({"ok": True, "columns": cols, "rows": rows,
+                                 "next_cursor": next_cursor, "has_more": next_cursor is not None})
         cols, rows, has_more = _fetch_page(conn, sql_text, offset=offset, limit=limit, filters=filters)
         next_offset = offset + len(rows)
         return JsonResponse({"ok": True, "columns": cols, "rows": rows, "next_offset": next_offset, "has_more": has_more})
@@ -1124,9 +1529,166 @@ def query_page_adhoc(request: HttpRequest) -> JsonResponse:
         return JsonResponse({"ok": False, "message": f"Erro ao carregar página: {e}"}, status=400)
 
 
+# ----- Exportação (CSV / XLSX) -----
+
+_EXPORT_BATCH = 1000
+_XLSX_MAX_ROWS = 1_048_575  # limite de linhas da planilha (1 de cabeçalho)
+
+
+def _iter_export_batches(conn: DBConnection, sql_text: str, filters: List[Dict[str, Any]]):
+    """
+    (colunas, lote) com fetchmany — a memória fica limitada a um lote. Se o consumidor
+    fecha o gerador (cliente desconectou), aborta o comando no banco de origem.
+    """
+    final_sql, params = _build_sql_with_filters(sql_text, conn.engine, filters or [])
+    py_conn, cur = _open_dbapi(conn, statement_timeout_for(conn, default=EXPORT_STATEMENT_TIMEOUT_S))
+    try:
+        if params:
+            cur.execute(final_sql, params)
+        else:
+            cur.execute(final_sql)
+        columns = [d[0] for d in (cur.description or [])]
+        yield columns, []
+        while True:
+            batch = cur.fetchmany(_EXPORT_BATCH)
+            if not batch:
+                break
+            yield columns, batch
+    except GeneratorExit:
+        # cliente desconectou no meio do download: aborta o comando no banco de origem
+        cancel_statement(conn, py_conn, cur)
+        getattr(py_conn, "invalidate", lambda: None)()
+        raise
+    finally:
+        try: cur.close()
+        except Exception: pass
+        try: py_conn.close()
+        except Exception: pass
+
+
+def _csv_stream(batches) -> Iterable[str]:
+    # BOM para Excel reconhecer UTF-8
+    yield "\ufeff"
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=";", lineterminator="\n")
+    header = False
+    with closing(batches):
+        for columns, batch in batches:
+            if not header:
+                writer.writerow(columns)
+                header = True
+            for r in batch:
+                writer.writerow(list(r))
+            s = buf.getvalue()
+            if s:
+                yield s
+            buf.seek(0); buf.truncate(0)
+
+
+_XLSX_ILLEGAL_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _xlsx_value(v: Any) -> Any:
+    """Célula tipada: números/datas/Decimal/bool ficam nativos; o resto vira texto seguro para XML."""
+    if v is None or isinstance(v, (bool, int, float, Decimal, datetime.date, datetime.time, datetime.timedelta)):
+        if isinstance(v, (datetime.datetime, datetime.time)) and v.tzinfo is not None:
+            v = v.replace(tzinfo=None)  # Excel não guarda fuso
+        return v
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        return bytes(v).hex()
+    return _XLSX_ILLEGAL_RE.sub("", str(v))
+
+
+def _xlsx_row(ws, row) -> list:
+    from openpyxl.cell import WriteOnlyCell
+
+    out = []
+    for v in row:
+        v = _xlsx_value(v)
+        if isinstance(v, str) and v.startswith("="):
+            # texto vindo do banco nunca vira fórmula
+            cell = WriteOnlyCell(ws, value=v)
+            cell.data_type = "s"
+            v = cell
+        out.append(v)
+    return out
+
+
+def _xlsx_stream(batches, chunk_size: int = 64 * 1024) -> Iterable[bytes]:
+    """
+    Planilha em modo write-only do openpyxl: as linhas vão direto para um arquivo temporário,
+    então a memória não cresce com o número de linhas. Acima do limite do Excel abre nova aba.
+    O .xlsx (zip) só fica pronto no save; daí é enviado em pedaços e o temporário apagado.
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws, sheet_no, used = None, 0, 0
+    with closing(batches):
+        for columns, batch in batches:
+            if ws is None:
+                sheet_no += 1
+                ws = wb.create_sheet("Dados")
+                ws.append(columns)
+            for r in batch:
+                if used >= _XLSX_MAX_ROWS:
+                    sheet_no += 1
+                    ws, used = wb.create_sheet(f"Dados ({sheet_no})"), 0
+                    ws.append(columns)
+                ws.append(_xlsx_row(ws, r))
+                used += 1
+
+    with tempfile.TemporaryFile(suffix=".xlsx") as fh:
+        wb.save(fh)
+        fh.seek(0)
+        while True:
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+_EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": columnar.PARQUET_CONTENT_TYPE,
+    "arrow": columnar.ARROW_STREAM_CONTENT_TYPE,
+}
+
+
+def _export_format_error(fmt: str) -> Optional[str]:
+    if fmt not in _EXPORT_FORMATS:
+        return "Formato inválido."
+    if fmt == "xlsx":
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            return "openpyxl não está instalado."
+    if fmt in ("parquet", "arrow") and not columnar.available():
+        return "pyarrow não está instalado."
+    return None
+
+
+def _export_response(fmt: str, batches, filename: str) -> StreamingHttpResponse:
+    writer = {
+        "csv": _csv_stream,
+        "xlsx": _xlsx_stream,
+        "parquet": columnar.iter_parquet,
+        "arrow": columnar.iter_arrow_stream,
+    }[fmt]
+    resp = StreamingHttpResponse(writer(batches), content_type=_EXPORT_FORMATS[fmt])
+    resp["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return resp
+
+
 @login_required
 @require_POST
 def query_export_adhoc(request: HttpRequest) -> StreamingHttpResponse:
+    """
+    Exporta o resultado completo (respeita filtros): format=csv (padrão), xlsx, parquet ou arrow.
+    Síncrono (prende o request no banco): o editor exporta pelo job (query_job_export) e só
+    cai aqui quando a fila do worker está indisponível.
+    """
     try:
         conn_id = int(request.POST.get("connection_id") or 0)
         sql_text = request.POST.get("sql_text") or ""
@@ -1136,57 +1698,60 @@ def query_export_adhoc(request: HttpRequest) -> StreamingHttpResponse:
     if not conn_id or not sql_text.strip():
         return StreamingHttpResponse("Informe conexão e SQL.", status=400)
 
-    filename = (request.POST.get("filename") or "export.csv").strip() or "export.csv"
-    conn = get_object_or_404(DBConnection, pk=conn_id)
-    filters = _parse_where_filters(request)
-
-    def row_stream() -> Iterable[str]:
-        # BOM para Excel reconhecer UTF-8
-        yield "\ufeff"
-        engine = conn.engine
-        final_sql, params = _build_sql_with_filters(sql_text, engine, filters or [])
+    fmt = (request.POST.get("format") or "csv").strip().lower()
+    error = _export_format_error(fmt)
+    if error:
+        return StreamingHttpResponse(error, status=400)
 
-        py_conn, cur = _open_dbapi(conn)
-        try:
-            if params:
-                cur.execute(final_sql, params)
-            else:
-                cur.execute(final_sql)
+    filename = (request.POST.get("filename") or f"export.{fmt}").strip() or f"export.{fmt}"
+    conn = get_object_or_404(DBConnection.objects.defer("password"), pk=conn_id)
+    filters = _parse_where_filters(request)
+    return _export_response(fmt, _iter_export_batches(conn, sql_text, filters), filename)
 
-            columns = [d[0] for d in (cur.description or [])]
 
-            # header
-            buf = io.StringIO()
-            writer = csv.writer(buf, delimiter=";", lineterminator="\n")
-            writer.writerow(columns)
-            yield buf.getvalue()
-            buf.seek(0); buf.truncate(0)
+def _count_estimate(conn: DBConnection, final_sql: str, params: List[Any]) -> Optional[int]:
+    """Estimativa do otimizador (counts.estimate); falha vira None — é só um palpite para a tela."""
+    if not counts.supports_estimate(conn.engine):
+        return None
+    py_conn, cur = _open_dbapi(conn, statement_timeout_for(conn, default=counts.COUNT_ESTIMATE_TIMEOUT_S))
+    try:
+        return counts.estimate(conn.engine, cur, final_sql, params)
+    except Exception as e:
+        logger.info("sqlhub: estimativa de contagem indisponível (conexão %s): %s", conn.pk, e)
+        getattr(py_conn, "invalidate", lambda: None)()  # sessão pode ter ficado em SHOWPLAN/erro
+        return None
+    finally:
+        try: cur.close()
+        except Exception: pass
+        try: py_conn.close()
+        except Exception: pass
 
-            # stream de dados
-            while True:
-                batch = cur.fetchmany(1000)
-                if not batch:
-                    break
-                for r in batch:
-                    writer.writerow(list(r))
-                s = buf.getvalue()
-                if s:
-                    yield s
-                buf.seek(0); buf.truncate(0)
-        finally:
-            try: cur.close()
-            except Exception: pass
-            try: py_conn.close()
-            except Exception: pass
 
-    resp = StreamingHttpResponse(row_stream(), content_type="text/csv; charset=utf-8")
-    resp["Content-Disposition"] = f'attachment; filename="{filename}"'
-    return resp
+def _count_exact(conn: DBConnection, final_sql: str, params: List[Any]) -> int:
+    py_conn, cur = _open_dbapi(conn)
+    try:
+        count_sql = f"SELECT COUNT(*) FROM ({final_sql}) t"
+        if params:
+            cur.execute(count_sql, params)
+        else:
+            cur.execute(count_sql)
+        row = cur.fetchone()
+        return int(row[0]) if row else 0
+    finally:
+        try: cur.close()
+        except Exception: pass
+        try: py_conn.close()
+        except Exception: pass
 
 
 @login_required
 @require_POST
 def query_count_adhoc(request: HttpRequest) -> JsonResponse:
+    """
+    Total de linhas para a tela. Contagem exata em cache → devolve direto. Senão devolve a
+    estimativa do plano (exact=False) e agenda a contagem exata em um job (job_id para
+    acompanhar em query_job_status). Sem fila disponível conta aqui mesmo, como antes.
+    """
     try:
         conn_id = int(request.POST.get("connection_id") or 0)
         sql_text = request.POST.get("sql_text") or ""
@@ -1197,27 +1762,29 @@ def query_count_adhoc(request: HttpRequest) -> JsonResponse:
         return JsonResponse({"ok": False, "message": "Informe conexão e SQL."}, status=400)
 
     filters = _parse_where_filters(request)
-    conn = get_object_or_404(DBConnection, pk=conn_id)
+    conn = get_object_or_404(DBConnection.objects.defer("password"), pk=conn_id)
 
-    try:
-        engine = conn.engine
-        final_sql, params = _build_sql_with_filters(sql_text, engine, filters or [])
-        count_sql = f"SELECT COUNT(*) FROM ({final_sql}) t"
+    total = counts.cached(conn, sql_text, filters)
+    if total is not None:
+        return JsonResponse({"ok": True, "count": total, "exact": True, "cached": True, "job_id": None})
 
-        py_conn, cur = _open_dbapi(conn)
-        try:
-            if params:
-                cur.execute(count_sql, params)
-            else:
-                cur.execute(count_sql)
-            row = cur.fetchone()
-            total = int(row[0]) if row else 0
-            return JsonResponse({"ok": True, "count": total})
-        finally:
-            try: cur.close()
-            except Exception: pass
-            try: py_conn.close()
-            except Exception: pass
+    try:
+        _validate_select(sql_text)
+        final_sql, params = _build_sql_with_filters(sql_text, conn.engine, filters or [])
+        job = counts.exact_job(request.user, conn, sql_text, filters)
+        if job.status == QueryJobStatus.DONE:
+            total = int((job.result or {}).get("count") or 0)
+            return JsonResponse({"ok": True, "count": total, "exact": True, "cached": False, "job_id": str(job.pk)})
+        if job.status == QueryJobStatus.FAILED:
+            if job.started_at is not None:
+                return JsonResponse({"ok": False, "message": f"Erro ao contar: {job.error}"}, status=400)
+            # fila indisponível (job nem chegou ao worker)
+            total = _count_exact(conn, final_sql, params)
+            counts.remember(conn, sql_text, filters, total)
+            return JsonResponse({"ok": True, "count": total, "exact": True, "cached": False, "job_id": None})
+
+        estimate = _count_estimate(conn, final_sql, params)
+        return JsonResponse({"ok": True, "count": estimate, "exact": False, "cached": False, "job_id": str(job.pk)})
     except DriverMissing as e:
         return JsonResponse({"ok": False, "message": f"Driver ausente: {e}"}, status=400)
     except ValueError as e:
@@ -1226,6 +1793,106 @@ def query_count_adhoc(request: HttpRequest) -> JsonResponse:
         return JsonResponse({"ok": False, "message": f"Erro ao contar: {e}"}, status=400)
 
 
+# ----- Jobs assíncronos (execução no worker, resultado no spool) -----
+
+def _job_json(job: QueryJob) -> Dict[str, Any]:
+    end = job.finished_at or timezone.now()
+    return {
+        "ok": True,
+        "job_id": str(job.pk),
+        "kind": job.kind,
+        "status": job.status,
+        "finished": job.finished,
+        "rows_done": job.rows_done,
+        "columns": job.columns,
+        "truncated": job.truncated,
+        "result": job.result,
+        "error": job.error,
+        "elapsed_s": round((end - job.started_at).total_seconds(), 1) if job.started_at else None,
+    }
+
+
+def _user_job(request: HttpRequest, job_id) -> QueryJob:
+    return get_object_or_404(QueryJob, pk=job_id, created_by=request.user)
+
+
+@login_required
+@require_POST
+def query_job_submit(request: HttpRequest) -> JsonResponse:
+    """
+    POST connection_id, sql_text, kind=select|count (+ where[...]) → {"job_id"}.
+    O worker executa; o navegador acompanha por query_job_status e lê por query_job_page.
+    """
+    try:
+        conn_id = int(request.POST.get("connection_id") or 0)
+        sql_text = request.POST.get("sql_text") or ""
+    except Exception:
+        return JsonResponse({"ok": False, "message": "Parâmetros inválidos."}, status=400)
+    kind = request.POST.get("kind") or QueryJob.KIND_SELECT
+    if kind not in (QueryJob.KIND_SELECT, QueryJob.KIND_COUNT):
+        return JsonResponse({"ok": False, "message": "Tipo de job inválido."}, status=400)
+    if not conn_id or not sql_text.strip():
+        return JsonResponse({"ok": False, "message": "Informe conexão e SQL."}, status=400)
+
+    conn = get_object_or_404(DBConnection.objects.defer("password"), pk=conn_id)
+    try:
+        job = jobs.submit(request.user, conn, sql_text, _parse_where_filters(request), kind=kind)
+    except ValueError as e:
+        return JsonResponse({"ok": False, "message": str(e)}, status=400)
+    return JsonResponse(_job_json(job), status=202)
+
+
+@login_required
+def query_job_status(request: HttpRequest, job_id) -> JsonResponse:
+    return JsonResponse(_job_json(_user_job(request, job_id)))
+
+
+@login_required
+def query_job_page(request: HttpRequest, job_id) -> JsonResponse:
+    """Página do spool (não toca o banco de origem); funciona enquanto o job ainda roda."""
+    job = _user_job(request, job_id)
+    try:
+        offset = max(0, int(request.GET.get("offset") or 0))
+    except ValueError:
+        return JsonResponse({"ok": False, "message": "Parâmetros inválidos."}, status=400)
+    limit = _clamp_limit(request.GET.get("limit") or 1000, soft_max=2000)
+    rows, has_more = jobs.read_page(job, offset, limit)
+    # o spool devolve os tipos originais; binário vai em hex (como na exportação)
+    rows = [[bytes(v).hex() if isinstance(v, (bytes, bytearray, memoryview)) else v for v in r] for r in rows]
+    return JsonResponse({**_job_json(job), "rows": rows, "next_offset": offset + len(rows), "has_more": has_more})
+
+
+@login_required
+@require_POST
+def query_job_cancel(request: HttpRequest, job_id) -> JsonResponse:
+    job = _user_job(request, job_id)
+    if not job.finished:
+        jobs.request_cancel(job)
+        job.refresh_from_db()
+    return JsonResponse(_job_json(job))
+
+
+@login_required
+def query_job_export(request: HttpRequest, job_id) -> StreamingHttpResponse:
+    """Exporta o spool de um job concluído (mesmos formatos de query_export_adhoc)."""
+    job = _user_job(request, job_id)
+    if job.status != QueryJobStatus.DONE or job.kind != QueryJob.KIND_SELECT:
+        return StreamingHttpResponse("Job ainda não concluído.", status=409)
+
+    fmt = (request.GET.get("format") or "csv").strip().lower()
+    error = _export_format_error(fmt)
+    if error:
+        return StreamingHttpResponse(error, status=400)
+
+    def batches():
+        yield job.columns, []
+        for chunk in jobs.iter_rows(job):
+            yield job.columns, chunk
+
+    filename = (request.GET.get("filename") or f"export.{fmt}").strip() or f"export.{fmt}"
+    return _export_response(fmt, batches(), filename)
+
+
 @login_required
 def connections_list_api(request: HttpRequest) -> JsonResponse:
     data = [